@@ -0,0 +1,233 @@
+from quart import Quart, request, jsonify, Response, url_for
+import os
+from functools import wraps
+from quart_cors import cors
+
+import auth
+import compression
+import db
+import etags
+import hateoas
+import negotiation
+import ratelimit
+import async_queries as queries
+
+def create_app():
+    """
+    Version Async: V4 chạy trên ASGI (Quart)
+    Cùng route và cùng dạng JSON với V4, nhưng mọi view là coroutine:
+    - Truy vấn SQLite chạy trên thread pool có giới hạn (async_queries), nên
+      một truy vấn chậm không giữ một worker thread của server.
+    - Mỗi client keep-alive (vd. frontend trình duyệt qua CORS) chỉ tốn một
+      coroutine, không tốn một luồng.
+    Chạy bằng:  uvicorn --factory appAsync:create_app
+    (hoặc hypercorn "appAsync:create_app()"). Khởi tạo CSDL vẫn dùng CLI
+    của Flask: flask --app appV4 init-db (cùng file instance/library.db).
+    Cần cài thêm quart, quart-cors và một server ASGI (xem README).
+    Giống V4: `?links=full|relative|none`, MessagePack theo Accept, nén
+    response theo Accept-Encoding và giới hạn tần suất mượn/trả (quy tắc
+    "borrow"), dùng chung hateoas/negotiation/compression/ratelimit với V4.
+    """
+    app = Quart(__name__, instance_relative_config=True)
+    app = cors(app, allow_origin="*")
+
+    db_path = os.path.join(app.instance_path, 'library.db')
+    app.config.from_mapping(DATABASE=db_path)
+    try:
+        os.makedirs(app.instance_path)
+    except OSError:
+        pass
+
+    queries.init_app(app)
+    auth.init_app(app)
+    ratelimit.init_app(app)
+    compression.init_async_app(app)
+    etags.init_app(app)
+
+    # Decorator token_required kế thừa từ V2 (phiên bản coroutine, token lưu trong CSDL)
+    def token_required(f):
+        @wraps(f)
+        async def decorated(*args, **kwargs):
+            token = None
+            if 'Authorization' in request.headers:
+                try: token = request.headers['Authorization'].split(" ")[1]
+                except IndexError: return jsonify({'message': 'Token format is invalid!'}), 401
+            if not token: return jsonify({'message': 'Token is missing!'}), 401
+            # Token đã gặp được xác thực từ cache ngay trên event loop
+            identity = auth.cached_identity(token, app) or await queries.verify_token(token)
+            if identity is None: return jsonify({'message': 'Token is invalid!'}), 401
+            return await f(identity['user_id'], *args, **kwargs)
+        return decorated
+
+    # Helper HATEOAS kế thừa từ V4 (template dựng một lần, xem hateoas.py)
+    def add_hateoas_links_to_book(book, mode="full"):
+        """Thêm một trường `_links` vào dictionary của sách."""
+        return hateoas.get_linker(mode, request, app, url_for)(book)
+
+    def collection_response(data, fmt):
+        """Danh sách dạng JSON hoặc MessagePack (theo negotiation.best_format)."""
+        if fmt == 'msgpack':
+            response = Response(negotiation.pack(data), mimetype=negotiation.MSGPACK_MIMETYPE)
+        else:
+            response = jsonify(data)
+        response.vary.add('Accept')
+        return response
+
+    def not_modified(etag):
+        return Response("", status=304, headers={'ETag': etag})
+
+    @app.errorhandler(db.PoolTimeout)
+    async def database_busy(e):
+        """Hàng đợi truy vấn đã đầy: 503 ngay thay vì để request xếp hàng."""
+        response = jsonify({'message': 'Database is busy, please retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config.get('DB_BUSY_RETRY_AFTER', 1))
+        return response
+
+    # === API Endpoints ===
+    @app.route('/')
+    async def hello():
+        return 'Hi! This is Async - V4 on ASGI.'
+    # -- User Endpoints --
+    @app.route('/users', methods=['GET'])
+    async def get_users():
+        return collection_response(await queries.get_all_users(), negotiation.best_format(request)), 200
+
+    @app.route('/users/<int:user_id>', methods=['GET'])
+    async def get_user(user_id):
+        cached_etag = etags.cached("user", user_id, app)
+        if etags.is_not_modified(cached_etag, request):
+            return not_modified(cached_etag)
+
+        user = await queries.get_user_by_id(user_id)
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        etag = etags.user_etag(user)
+        etags.remember("user", user_id, etag, app)
+        if etags.is_not_modified(etag, request):
+            return not_modified(etag)
+        response = jsonify(user)
+        response.headers['ETag'] = etag
+        return response, 200
+
+    @app.route('/users', methods=['POST'])
+    async def add_user():
+        data = await request.get_json()
+        if not data or not all(k in data for k in ("name", "email")):
+            return jsonify({"message": "Missing required fields: name, email"}), 400
+
+        new_user = await queries.add_user(data)
+        if new_user:
+            return jsonify(new_user), 201
+        return jsonify({"message": "Email already exists"}), 409
+
+    # -- Book Endpoints --
+    @app.route('/books', methods=['GET'])
+    async def get_books():
+        mode = hateoas.links_mode(request)
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+        fmt = negotiation.best_format(request)
+        etag = etags.collection_etag('books', await queries.get_collection_version('books'), request, fmt)
+        if etags.is_not_modified(etag, request):
+            response = not_modified(etag)
+            response.vary.add('Accept')
+            return response
+
+        all_books = await queries.get_all_books()
+        link = hateoas.get_linker(mode, request, app, url_for)
+        response = collection_response([link(b.copy()) for b in all_books], fmt)
+        response.headers['ETag'] = etag
+        return response, 200
+
+    @app.route('/books/<int:book_id>', methods=['GET'])
+    async def get_book(book_id):
+        mode = hateoas.links_mode(request)
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+
+        # 304 từ bộ đệm ETag ngay trên event loop, không cần tới thread pool
+        cached_etag = etags.cached("book", book_id, app)
+        if etags.is_not_modified(cached_etag, request):
+            return not_modified(cached_etag)
+
+        book = await queries.get_book_by_id(book_id)
+        if not book: return jsonify({"message": "Book not found"}), 404
+
+        etag = etags.book_etag(book)
+        etags.remember("book", book_id, etag, app)
+        if etags.is_not_modified(etag, request):
+            return not_modified(etag)
+
+        response = jsonify(add_hateoas_links_to_book(book.copy(), mode))
+        response.headers['ETag'] = etag
+        return response
+
+    @app.route('/books', methods=['POST'])
+    async def add_book():
+        data = await request.get_json()
+        if not data or not all(k in data for k in ("title", "author", "year")):
+            return jsonify({"message": "Missing required fields: title, author, year"}), 400
+
+        new_book = await queries.add_book(data)
+        return jsonify(new_book), 201
+
+    @app.route('/books/<int:book_id>', methods=['PUT'])
+    async def update_book(book_id):
+        if not await queries.get_book_by_id(book_id):
+            return jsonify({"message": "Book not found"}), 404
+
+        data = await request.get_json()
+        if not data or not all(k in data for k in ("title", "author", "year")):
+            return jsonify({"message": "Missing required fields: title, author, year"}), 400
+
+        updated_book = await queries.update_book(book_id, data)
+        return jsonify(updated_book), 200
+
+    @app.route('/books/<int:book_id>', methods=['DELETE'])
+    async def delete_book(book_id):
+        deleted, error = await queries.delete_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_borrowed': return jsonify({"message": "Cannot delete a borrowed book"}), 409
+        if deleted:
+            return jsonify({"message": f"Book with id {book_id} has been deleted."}), 200
+        return jsonify({"message": "An error occurred"}), 500
+    # borrow, return
+    @app.route('/books/<int:book_id>/borrow', methods=['POST'])
+    @token_required
+    @ratelimit.limit_async('borrow')
+    async def borrow_book_route(current_user_id, book_id):
+        result, error = await queries.borrow_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if error == 'book_unavailable':
+            book = await queries.get_book_by_id(book_id)
+            if not book:
+                # Sách bị xóa ngay sau lượt mượn thất bại
+                return jsonify({"message": "Book not found"}), 404
+            book_with_links = add_hateoas_links_to_book(book)
+            return jsonify({
+                "message": "Book is not available",
+                "current_state": book_with_links
+            }), 409
+        if result:
+            return jsonify(add_hateoas_links_to_book(result['book'])), 200
+        return jsonify({"message": "Failed to borrow book"}), 500
+
+    @app.route('/books/<int:book_id>/return', methods=['POST'])
+    @token_required
+    @ratelimit.limit_async('borrow')
+    async def return_book_route(current_user_id, book_id):
+        result, error = await queries.return_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify(add_hateoas_links_to_book(result['book'])), 200
+        return jsonify({"message": "Could not find an active borrow record"}), 500
+
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    app.run(debug=True)
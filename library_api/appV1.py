@@ -2,6 +2,11 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS 
 import db
+import profiling
+import json_provider
+import negotiation
+import compression
+import ratelimit
 import queries
 
 #Sever chỉ xử lí request và trả về response json
@@ -10,6 +15,10 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
     db.init_app(app)
+    profiling.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    ratelimit.init_app(app)
 
     # === API Endpoints ===
     @app.route('/')
@@ -18,7 +27,10 @@ def create_app():
     # -- User Endpoints --
     @app.route('/users', methods=['GET'])
     def get_users():
-        return jsonify(queries.get_all_users()), 200
+        if negotiation.response_format() == 'msgpack':
+            return negotiation.msgpack_response(queries.get_all_users())
+        # Chuỗi JSON dựng sẵn trong SQLite, không qua dict trung gian
+        return json_provider.raw_json_response(queries.get_all_users_json())
 
     @app.route('/users/<int:user_id>', methods=['GET'])
     def get_user(user_id):
@@ -41,7 +53,9 @@ def create_app():
     # -- Book Endpoints --
     @app.route('/books', methods=['GET'])
     def get_books():
-        return jsonify(queries.get_all_books()), 200
+        if negotiation.response_format() == 'msgpack':
+            return negotiation.msgpack_response(queries.get_all_books())
+        return json_provider.raw_json_response(queries.get_all_books_json())
 
     @app.route('/books/<int:book_id>', methods=['GET'])
     def get_book(book_id):
@@ -73,43 +87,37 @@ def create_app():
 
     @app.route('/books/<int:book_id>', methods=['DELETE'])
     def delete_book(book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book:
-            return jsonify({"message": "Book not found"}), 404
-        
-        if book['status'] == 'borrowed':
-            return jsonify({"message": "Cannot delete a borrowed book"}), 409
-
-        if queries.delete_book(book_id):
+        deleted, error = queries.delete_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_borrowed': return jsonify({"message": "Cannot delete a borrowed book"}), 409
+        if deleted:
             return jsonify({"message": f"Book with id {book_id} has been deleted."}), 200
         return jsonify({"message": "An error occurred"}), 500
 
     # -- Borrow/Return Endpoints --
     @app.route('/books/<int:book_id>/borrow', methods=['POST'])
-    def borrow_book_route():
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'available': return jsonify({"message": "Book is not available"}), 409
-
+    @ratelimit.limit('borrow')
+    def borrow_book_route(book_id):
         data = request.get_json()
         if not data or 'user_id' not in data: return jsonify({"message": "Missing user_id"}), 400
-        
-        user = queries.get_user_by_id(data['user_id'])
-        if not user: return jsonify({"message": "User not found"}), 404
-        
-        borrow_record = queries.borrow_book(book_id, data['user_id'])
-        if borrow_record:
-            return jsonify(borrow_record), 201
+
+        # Kiểm tra trạng thái và mượn trong cùng một giao dịch (không đọc trước)
+        result, error = queries.borrow_book(book_id, data['user_id'])
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_unavailable': return jsonify({"message": "Book is not available"}), 409
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if result:
+            return jsonify(result['borrow']), 201
         return jsonify({"message": "Failed to borrow book"}), 500
 
     @app.route('/books/<int:book_id>/return', methods=['POST'])
-    def return_book_route():
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'borrowed': return jsonify({"message": "Book was not borrowed"}), 400
-            
-        if queries.return_book(book_id):
-            return jsonify({"message": f"Book '{book['title']}' has been returned."}), 200
+    @ratelimit.limit('borrow')
+    def return_book_route(book_id):
+        result, error = queries.return_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify({"message": f"Book '{result['book']['title']}' has been returned."}), 200
         return jsonify({"message": "Could not find an active borrow record"}), 500
 
     return app
@@ -1,17 +1,14 @@
 from flask import Flask, request, jsonify
 import os
-from functools import wraps
 import db
+import profiling
+import auth
+import json_provider
+import compression
+import ratelimit
 from flask_cors import CORS 
 import queries
 
-# === CẢI TIẾN V2: Thêm cơ chế Token ===
-# Giả lập token của user.
-USER_TOKENS = {
-    "token_alice_123": 1,  # token -> user_id
-    "token_bob_456": 2
-}
-
 def create_app():
     """
     Version 2: Stateless (Kế thừa V1)
@@ -35,29 +32,15 @@ def create_app():
         pass
 
     db.init_app(app)
+    profiling.init_app(app)
+    auth.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    ratelimit.init_app(app)
 
     # === CẢI TIẾN V2: Decorator để kiểm tra token ===
-    def token_required(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            token = None
-            # Client phải gửi token theo format: "Bearer <token>"
-            if 'Authorization' in request.headers:
-                try:
-                    token = request.headers['Authorization'].split(" ")[1]
-                except IndexError:
-                    return jsonify({'message': 'Token format is invalid!'}), 401
-
-            if not token:
-                return jsonify({'message': 'Token is missing!'}), 401
-            
-            if token not in USER_TOKENS:
-                return jsonify({'message': 'Token is invalid!'}), 401
-
-            # Lấy user_id từ token và truyền vào hàm xử lý route
-            current_user_id = USER_TOKENS[token]
-            return f(current_user_id, *args, **kwargs)
-        return decorated
+    # Token được tra trong bảng `tokens` (có cache trong bộ nhớ), xem auth.py
+    token_required = auth.token_required
 
 
     # === API Endpoints  ===
@@ -68,7 +51,8 @@ def create_app():
     # -- User Endpoints --
     @app.route('/users', methods=['GET'])
     def get_users():
-        return jsonify(queries.get_all_users()), 200
+        # Chuỗi JSON dựng sẵn trong SQLite, không qua dict trung gian
+        return json_provider.raw_json_response(queries.get_all_users_json())
 
     @app.route('/users/<int:user_id>', methods=['GET'])
     def get_user(user_id):
@@ -88,7 +72,7 @@ def create_app():
     # -- Book Endpoints  --
     @app.route('/books', methods=['GET'])
     def get_books():
-        return jsonify(queries.get_all_books()), 200
+        return json_provider.raw_json_response(queries.get_all_books_json())
 
     @app.route('/books/<int:book_id>', methods=['GET'])
     def get_book(book_id):
@@ -119,6 +103,7 @@ def create_app():
     # -- Borrow/Return Endpoints (Cải tiến với @token_required) --
     @app.route('/books/<int:book_id>/borrow', methods=['POST'])
     @token_required
+    @ratelimit.limit('borrow')
     def borrow_book_route(current_user_id, book_id):
         """
         Cải tiến quan trọng của V2:
@@ -127,26 +112,25 @@ def create_app():
           dựa trên token được gửi trong header.
         - Mỗi request đều độc lập và chứa đủ thông tin để được xử lý.
         """
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'available': return jsonify({"message": "Book is not available"}), 409
-
-        borrow_record = queries.borrow_book(book_id, current_user_id)
-        if borrow_record:
-            return jsonify(borrow_record), 201
+        result, error = queries.borrow_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_unavailable': return jsonify({"message": "Book is not available"}), 409
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if result:
+            return jsonify(result['borrow']), 201
         return jsonify({"message": "Failed to borrow book"}), 500
 
     @app.route('/books/<int:book_id>/return', methods=['POST'])
     @token_required
+    @ratelimit.limit('borrow')
     def return_book_route(current_user_id, book_id):
         # Mặc dù logic trả sách không cần user_id, việc bảo vệ endpoint này
         # đảm bảo chỉ người dùng đã đăng nhập mới có thể thực hiện hành động.
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'borrowed': return jsonify({"message": "Book was not borrowed"}), 400
-            
-        if queries.return_book(book_id):
-            return jsonify({"message": f"Book '{book['title']}' has been returned."}), 200
+        result, error = queries.return_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify({"message": f"Book '{result['book']['title']}' has been returned."}), 200
         return jsonify({"message": "Could not find an active borrow record"}), 500
     
     # Các endpoint thay đổi dữ liệu khác (POST, PUT, DELETE sách) cũng nên được
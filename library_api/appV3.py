@@ -1,18 +1,16 @@
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
-import hashlib
-import json
-from functools import wraps
 import db
+import profiling
+import auth
+import json_provider
+import compression
+import ratelimit
 import queries
+import etags
 
 
-USER_TOKENS = {
-    "token_alice_123": 1,
-    "token_bob_456": 2
-}
-
 def create_app():
     """
     Version 3: Cacheable (Kế thừa V2)
@@ -21,6 +19,8 @@ def create_app():
     - Client có thể sử dụng ETag này để kiểm tra xem dữ liệu đã thay đổi chưa
       mà không cần tải lại toàn bộ nội dung, giúp tiết kiệm băng thông và
       giảm tải cho server.
+    - ETag suy ra từ số phiên bản của bản ghi (tăng mỗi lần ghi) và được nhớ
+      trong bộ đệm của tiến trình: request 304 không cần đọc CSDL.
     """
     app = Flask(__name__, instance_relative_config=True)
     CORS(app)
@@ -34,23 +34,13 @@ def create_app():
         pass
 
     db.init_app(app)
+    profiling.init_app(app)
+    auth.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    ratelimit.init_app(app)
+    etags.init_app(app)
 
-    def token_required(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            token = None
-            if 'Authorization' in request.headers:
-                try:
-                    token = request.headers['Authorization'].split(" ")[1]
-                except IndexError:
-                    return jsonify({'message': 'Token format is invalid!'}), 401
-            if not token:
-                return jsonify({'message': 'Token is missing!'}), 401
-            if token not in USER_TOKENS:
-                return jsonify({'message': 'Token is invalid!'}), 401
-            current_user_id = USER_TOKENS[token]
-            return f(current_user_id, *args, **kwargs)
-        return decorated
     # === API Endpoints  ===
     @app.route('/')
     def hello():
@@ -58,14 +48,26 @@ def create_app():
     # -- User Endpoints --
     @app.route('/users', methods=['GET'])
     def get_users():
-        return jsonify(queries.get_all_users()), 200
+        # Chuỗi JSON dựng sẵn trong SQLite, không qua dict trung gian
+        return json_provider.raw_json_response(queries.get_all_users_json())
 
     @app.route('/users/<int:user_id>', methods=['GET'])
     def get_user(user_id):
+        cached_etag = etags.cached("user", user_id)
+        if etags.is_not_modified(cached_etag):
+            return Response(status=304, headers={'ETag': cached_etag})
+
         user = queries.get_user_by_id(user_id)
-        if user:
-            return jsonify(user), 200
-        return jsonify({"message": "User not found"}), 404
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        etag = etags.user_etag(user)
+        etags.remember("user", user_id, etag)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+        response = jsonify(user)
+        response.headers['ETag'] = etag
+        return response, 200
 
     @app.route('/users', methods=['POST'])
     def add_user():
@@ -81,26 +83,38 @@ def create_app():
     # === CẢI TIẾN V3: Endpoint GET sách giờ có thể cache ===
     @app.route('/books', methods=['GET'])
     def get_books():
-        return jsonify(queries.get_all_books()), 200
+        # ETag của cả danh sách: chỉ cần đọc một bộ đếm, không đọc cả bảng
+        etag = etags.collection_etag('books', queries.get_collection_version('books'))
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+        response = json_provider.raw_json_response(queries.get_all_books_json())
+        response.headers['ETag'] = etag
+        return response, 200
 
     @app.route('/books/<int:book_id>', methods=['GET'])
     def get_book(book_id):
+        # 1. Nếu ETag của sách đã có trong bộ đệm và khớp với `If-None-Match`
+        # thì trả về 304 ngay, không cần đọc CSDL.
+        cached_etag = etags.cached("book", book_id)
+        if etags.is_not_modified(cached_etag):
+            return Response(status=304, headers={'ETag': cached_etag})
+
         book = queries.get_book_by_id(book_id)
         if not book:
             return jsonify({"message": "Book not found"}), 404
         
-        # 1. Tạo ETag từ hash của nội dung cuốn sách.
-        # Dùng json.dumps để đảm bảo dictionary được chuyển thành chuỗi một cách nhất quán.
-        book_json_str = json.dumps(book, sort_keys=True).encode('utf-8')
-        etag = f'"{hashlib.sha1(book_json_str).hexdigest()}"'
+        # 2. Tạo ETag từ số phiên bản của cuốn sách (tăng sau mỗi lần sửa,
+        # mượn, trả) rồi nhớ lại cho các request sau.
+        etag = etags.book_etag(book)
+        etags.remember("book", book_id, etag)
         
-        # 2. Kiểm tra header `If-None-Match` từ client gửi lên.
-        if request.headers.get('If-None-Match') == etag:
+        # 3. Kiểm tra header `If-None-Match` từ client gửi lên.
+        if etags.is_not_modified(etag):
             # Nếu ETag giống nhau, nghĩa là dữ liệu không đổi.
             # Trả về 304 Not Modified.
-            return Response(status=304)
+            return Response(status=304, headers={'ETag': etag})
         
-        # 3. Nếu là lần request đầu tiên hoặc dữ liệu đã thay đổi,
+        # 4. Nếu là lần request đầu tiên hoặc dữ liệu đã thay đổi,
         # trả về response đầy đủ kèm theo header ETag.
         response = jsonify(book)
         response.headers['ETag'] = etag
@@ -128,43 +142,37 @@ def create_app():
 
     @app.route('/books/<int:book_id>', methods=['DELETE'])
     def delete_book(book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book:
-            return jsonify({"message": "Book not found"}), 404
-        
-        if book['status'] == 'borrowed':
-            return jsonify({"message": "Cannot delete a borrowed book"}), 409
-
-        if queries.delete_book(book_id):
+        deleted, error = queries.delete_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_borrowed': return jsonify({"message": "Cannot delete a borrowed book"}), 409
+        if deleted:
             return jsonify({"message": f"Book with id {book_id} has been deleted."}), 200
         return jsonify({"message": "An error occurred"}), 500
 
     # -- Borrow/Return Endpoints --
     @app.route('/books/<int:book_id>/borrow', methods=['POST'])
-    def borrow_book_route():
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'available': return jsonify({"message": "Book is not available"}), 409
-
+    @ratelimit.limit('borrow')
+    def borrow_book_route(book_id):
         data = request.get_json()
         if not data or 'user_id' not in data: return jsonify({"message": "Missing user_id"}), 400
-        
-        user = queries.get_user_by_id(data['user_id'])
-        if not user: return jsonify({"message": "User not found"}), 404
-        
-        borrow_record = queries.borrow_book(book_id, data['user_id'])
-        if borrow_record:
-            return jsonify(borrow_record), 201
+
+        # Kiểm tra trạng thái và mượn trong cùng một giao dịch (không đọc trước)
+        result, error = queries.borrow_book(book_id, data['user_id'])
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_unavailable': return jsonify({"message": "Book is not available"}), 409
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if result:
+            return jsonify(result['borrow']), 201
         return jsonify({"message": "Failed to borrow book"}), 500
 
     @app.route('/books/<int:book_id>/return', methods=['POST'])
-    def return_book_route():
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'borrowed': return jsonify({"message": "Book was not borrowed"}), 400
-            
-        if queries.return_book(book_id):
-            return jsonify({"message": f"Book '{book['title']}' has been returned."}), 200
+    @ratelimit.limit('borrow')
+    def return_book_route(book_id):
+        result, error = queries.return_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify({"message": f"Book '{result['book']['title']}' has been returned."}), 200
         return jsonify({"message": "Could not find an active borrow record"}), 500
 
     return app
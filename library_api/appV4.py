@@ -1,17 +1,17 @@
 from flask import Flask, request, jsonify, Response, url_for
 import os
-import hashlib
-import json
-from functools import wraps
 from flask_cors import CORS 
 
 import db
+import profiling
+import auth
+import json_provider
+import negotiation
+import compression
 import queries
-
-USER_TOKENS = {
-    "token_alice_123": 1,
-    "token_bob_456": 2
-}
+import ratelimit
+import etags
+import hateoas
 
 def create_app():
     """
@@ -32,40 +32,20 @@ def create_app():
         pass
 
     db.init_app(app)
+    profiling.init_app(app)
+    auth.init_app(app)
+    ratelimit.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    etags.init_app(app)
 
-    # Decorator token_required kế thừa từ V2
-    def token_required(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            token = None
-            if 'Authorization' in request.headers:
-                try: token = request.headers['Authorization'].split(" ")[1]
-                except IndexError: return jsonify({'message': 'Token format is invalid!'}), 401
-            if not token: return jsonify({'message': 'Token is missing!'}), 401
-            if token not in USER_TOKENS: return jsonify({'message': 'Token is invalid!'}), 401
-            current_user_id = USER_TOKENS[token]
-            return f(current_user_id, *args, **kwargs)
-        return decorated
+    # Decorator token_required kế thừa từ V2 (token lưu trong CSDL, xem auth.py)
+    token_required = auth.token_required
 
     # === CẢI TIẾN V4: Helper function để thêm các liên kết HATEOAS ===
-    def add_hateoas_links_to_book(book):
-        """Thêm một trường `_links` vào dictionary của sách."""
-        book['_links'] = {
-            "self": { "href": url_for('get_book', book_id=book['id'], _external=True) },
-            "collection": { "href": url_for('get_books', _external=True) }
-        }
-        # Chỉ thêm link hành động nếu phù hợp với trạng thái hiện tại
-        if book['status'] == 'available':
-            book['_links']['borrow'] = { 
-                "href": url_for('borrow_book_route', book_id=book['id'], _external=True),
-                "method": "POST"
-            }
-        elif book['status'] == 'borrowed':
-            book['_links']['return'] = {
-                "href": url_for('return_book_route', book_id=book['id'], _external=True),
-                "method": "POST"
-            }
-        return book
+    def add_hateoas_links_to_book(book, mode="full"):
+        """Thêm một trường `_links` vào dictionary của sách (dựng từ template, xem hateoas.py)."""
+        return hateoas.get_linker(mode)(book)
     # === API Endpoints (Kế thừa và cải tiến) ===
     @app.route('/')
     def hello():
@@ -73,14 +53,28 @@ def create_app():
     # -- User Endpoints --
     @app.route('/users', methods=['GET'])
     def get_users():
-        return jsonify(queries.get_all_users()), 200
+        if negotiation.response_format() == 'msgpack':
+            return negotiation.msgpack_response(queries.get_all_users())
+        # Chuỗi JSON dựng sẵn trong SQLite, không qua dict trung gian
+        return json_provider.raw_json_response(queries.get_all_users_json())
 
     @app.route('/users/<int:user_id>', methods=['GET'])
     def get_user(user_id):
+        cached_etag = etags.cached("user", user_id)
+        if etags.is_not_modified(cached_etag):
+            return Response(status=304, headers={'ETag': cached_etag})
+
         user = queries.get_user_by_id(user_id)
-        if user:
-            return jsonify(user), 200
-        return jsonify({"message": "User not found"}), 404
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        etag = etags.user_etag(user)
+        etags.remember("user", user_id, etag)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+        response = jsonify(user)
+        response.headers['ETag'] = etag
+        return response, 200
 
     @app.route('/users', methods=['POST'])
     def add_user():
@@ -95,25 +89,45 @@ def create_app():
     # === CẢI TIẾN V4: Các endpoint GET giờ đây chứa cả _links ===
     @app.route('/books', methods=['GET'])
     def get_books():
+        mode = hateoas.links_mode()
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+        fmt = negotiation.response_format()
+        etag = etags.collection_etag('books', queries.get_collection_version('books'), fmt=fmt)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+
         all_books = queries.get_all_books()
-        # Thêm _links cho từng cuốn sách trong danh sách
-        books_with_links = [add_hateoas_links_to_book(b.copy()) for b in all_books]
-        return jsonify(books_with_links), 200
+        # Thêm _links cho từng cuốn sách trong danh sách (template dựng một lần)
+        link = hateoas.get_linker(mode)
+        books_with_links = [link(b.copy()) for b in all_books]
+        response = negotiation.collection_response(books_with_links, fmt)
+        response.headers['ETag'] = etag
+        return response
 
     @app.route('/books/<int:book_id>', methods=['GET'])
     def get_book(book_id):
+        mode = hateoas.links_mode()
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+
+        # Cơ chế ETag từ V3: 304 từ bộ đệm mà không cần đọc CSDL
+        cached_etag = etags.cached("book", book_id)
+        if etags.is_not_modified(cached_etag):
+            return Response(status=304, headers={'ETag': cached_etag})
+
         book = queries.get_book_by_id(book_id)
         if not book: return jsonify({"message": "Book not found"}), 404
         
+        # ETag theo phiên bản sách; links phụ thuộc `status`, mà đổi `status`
+        # (mượn/trả) luôn tăng phiên bản, nên ETag vẫn đúng cho cả links
+        etag = etags.book_etag(book)
+        etags.remember("book", book_id, etag)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+
         # Thêm các liên kết HATEOAS vào response
-        book_with_links = add_hateoas_links_to_book(book.copy())
-        
-        # Cơ chế ETag từ V3 vẫn hoạt động, nhưng bây giờ dựa trên data đã có links
-        book_json_str = json.dumps(book_with_links, sort_keys=True).encode('utf-8')
-        etag = f'"{hashlib.sha1(book_json_str).hexdigest()}"'
-        
-        if request.headers.get('If-None-Match') == etag:
-            return Response(status=304)
+        book_with_links = add_hateoas_links_to_book(book.copy(), mode)
         
         response = jsonify(book_with_links)
         response.headers['ETag'] = etag
@@ -141,43 +155,45 @@ def create_app():
 
     @app.route('/books/<int:book_id>', methods=['DELETE'])
     def delete_book(book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book:
-            return jsonify({"message": "Book not found"}), 404
-        
-        if book['status'] == 'borrowed':
-            return jsonify({"message": "Cannot delete a borrowed book"}), 409
-
-        if queries.delete_book(book_id):
+        deleted, error = queries.delete_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_borrowed': return jsonify({"message": "Cannot delete a borrowed book"}), 409
+        if deleted:
             return jsonify({"message": f"Book with id {book_id} has been deleted."}), 200
         return jsonify({"message": "An error occurred"}), 500
     # borrow, return 
     @app.route('/books/<int:book_id>/borrow', methods=['POST'])
     @token_required
+    @ratelimit.limit('borrow')
     def borrow_book_route(current_user_id, book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'available':
-            # Cải tiến nhỏ: Trả về trạng thái hiện tại của sách với HATEOAS
-            book_with_links = add_hateoas_links_to_book(book.copy())
+        result, error = queries.borrow_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if error == 'book_unavailable':
+            # Chỉ đọc lại sách khi mượn thất bại, để trả về trạng thái hiện tại với HATEOAS
+            book = queries.get_book_by_id(book_id)
+            if not book:
+                # Sách bị xóa ngay sau lượt mượn thất bại
+                return jsonify({"message": "Book not found"}), 404
+            book_with_links = add_hateoas_links_to_book(book)
             return jsonify({
                 "message": "Book is not available",
                 "current_state": book_with_links
             }), 409
-
-        borrow_record = queries.borrow_book(book_id, current_user_id)
-        if borrow_record:
-            # Sau khi mượn thành công, trả về trạng thái mới của sách
-            updated_book = queries.get_book_by_id(book_id)
-            return jsonify(add_hateoas_links_to_book(updated_book)), 200
+        if result:
+            # Sau khi mượn thành công, trả về trạng thái mới của sách (từ RETURNING)
+            return jsonify(add_hateoas_links_to_book(result['book'])), 200
         return jsonify({"message": "Failed to borrow book"}), 500
 
     @app.route('/books/<int:book_id>/return', methods=['POST'])
     @token_required
+    @ratelimit.limit('borrow')
     def return_book_route(current_user_id, book_id):
-        if queries.return_book(book_id):
-            updated_book = queries.get_book_by_id(book_id)
-            return jsonify(add_hateoas_links_to_book(updated_book)), 200
+        result, error = queries.return_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify(add_hateoas_links_to_book(result['book'])), 200
         return jsonify({"message": "Could not find an active borrow record"}), 500
 
     return app
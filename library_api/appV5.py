@@ -0,0 +1,484 @@
+from flask import Flask, request, jsonify, Response, url_for, g
+import os
+from flask_cors import CORS
+
+import db
+import profiling
+import auth
+import json_provider
+import negotiation
+import compression
+import queries
+import ratelimit
+import stats
+import etags
+import hateoas
+import cache
+import bulk_import
+import export
+import fieldsets
+import compound
+
+# Số sách tối đa trong một request /borrows:batch hoặc /returns:batch
+MAX_BATCH_ITEMS = 100
+
+def create_app():
+    """
+    Version 5: Pagination theo cursor (Kế thừa V4 + Week5)
+    Cải tiến: GET /books hỗ trợ tìm kiếm, lọc và phân trang keyset.
+    - Client nhận về một "trang" gồm `items` và `_links.next` chứa cursor opaque
+      trỏ tới trang sau, thay vì tự tính `page`.
+    - Server "seek" thẳng tới vị trí (sort_key, id) của cursor, nên trang thứ
+      5000 cũng nhanh như trang đầu tiên.
+    - Tham số `page` cũ vẫn được hỗ trợ để tương thích ngược.
+    """
+    app = Flask(__name__, instance_relative_config=True)
+    CORS(app)
+
+    db_path = os.path.join(app.instance_path, 'library.db')
+    app.config.from_mapping(DATABASE=db_path)
+    try:
+        os.makedirs(app.instance_path)
+    except OSError:
+        pass
+
+    db.init_app(app)
+    profiling.init_app(app)
+    auth.init_app(app)
+    ratelimit.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    etags.init_app(app)
+    cache.init_app(app)
+    stats.init_app(app)
+
+    # Decorator token_required kế thừa từ V2 (token lưu trong CSDL, xem auth.py)
+    token_required = auth.token_required
+
+    # Helper HATEOAS kế thừa từ V4
+    def add_hateoas_links_to_book(book, mode="full"):
+        """Thêm một trường `_links` vào dictionary của sách (dựng từ template, xem hateoas.py)."""
+        return hateoas.get_linker(mode)(book)
+
+    # === API Endpoints ===
+    @app.route('/')
+    def hello():
+        return 'Hi! This is V5 - Cursor Pagination.'
+    # -- User Endpoints --
+    # === Lấy nhiều bản ghi theo id: ?ids=1,2,3 (một câu IN) và ?fields= ===
+    def records_by_ids(collection, ids, fetch, columns, link=None):
+        """
+        Response cho GET /<collection>?ids=...: `items` theo thứ tự `ids`,
+        `missing` là các id không tồn tại. `fields` thu hẹp danh sách cột được
+        SELECT; `link` (nếu có) chỉ được gọi khi không có `fields` hoặc khi
+        `fields` có `_links`.
+        """
+        fields, error_response = fieldsets.parse_fields(columns, extra=(fieldsets.LINKS_FIELD,) if link else ())
+        if error_response: return error_response
+        fmt = negotiation.response_format()
+        etag = etags.collection_etag(collection, queries.get_collection_version(collection), fmt=fmt)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+
+        if fields is None:
+            records = fetch(tuple(ids))
+            if link:
+                records = [link(r) for r in records]
+        else:
+            with_links = link is not None and fieldsets.LINKS_FIELD in fields
+            # BookLinker cần hai bộ đếm để quyết định link mượn/trả
+            needed = ('available_copies', 'total_copies') if with_links else ()
+            records = fetch(tuple(ids), fieldsets.select_columns(fields, needed))
+            records = [fieldsets.project(link(r) if with_links else r, fields) for r in records]
+
+        found = {r['id'] for r in records}
+        external = hateoas.links_mode() != 'relative'
+        response = negotiation.collection_response({
+            "items": records,
+            "missing": [i for i in ids if i not in found],
+            "_links": {"self": {"href": request.url if external else request.full_path.rstrip('?')}},
+        }, fmt)
+        response.headers['ETag'] = etag
+        return response
+
+    @app.route('/users', methods=['GET'])
+    def get_users():
+        user_ids, error_response = fieldsets.parse_ids()
+        if error_response: return error_response
+        if user_ids is not None:
+            return records_by_ids('users', user_ids, queries.get_users_by_ids, queries.USER_COLUMNS)
+        if negotiation.response_format() == 'msgpack':
+            return negotiation.msgpack_response(queries.get_all_users())
+        # Chuỗi JSON dựng sẵn trong SQLite, không qua dict trung gian
+        return json_provider.raw_json_response(queries.get_all_users_json())
+
+    @app.route('/users/<int:user_id>', methods=['GET'])
+    def get_user(user_id):
+        cached_etag = etags.cached("user", user_id)
+        if etags.is_not_modified(cached_etag):
+            return Response(status=304, headers={'ETag': cached_etag})
+
+        user = queries.get_user_by_id(user_id)
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        etag = etags.user_etag(user)
+        etags.remember("user", user_id, etag)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+        response = jsonify(user)
+        response.headers['ETag'] = etag
+        return response, 200
+
+    @app.route('/users', methods=['POST'])
+    def add_user():
+        data = request.get_json()
+        if not data or not all(k in data for k in ("name", "email")):
+            return jsonify({"message": "Missing required fields: name, email"}), 400
+
+        new_user = queries.add_user(data)
+        if new_user:
+            return jsonify(new_user), 201
+        return jsonify({"message": "Email already exists"}), 409
+
+    # Nesting kế thừa từ Week5
+    @app.route('/users/<int:user_id>/borrowed-books', methods=['GET'])
+    def get_user_borrowed_books(user_id):
+        # ?include=borrower,books,history: tài liệu gộp, số truy vấn cố định (xem compound.py)
+        include, error_response = compound.parse_include(compound.BORROWED_BOOKS_INCLUDES)
+        if error_response: return error_response
+        mode = hateoas.links_mode()
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+        user = queries.get_user_by_id(user_id)
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+        borrowed_books = queries.get_borrowed_books_by_user(user_id)
+        if include:
+            return jsonify(compound.borrowed_books_document(user, borrowed_books, include, mode)), 200
+        return jsonify(borrowed_books), 200
+
+    # === CẢI TIẾN V5: GET /books phân trang bằng cursor ===
+    @app.route('/books', methods=['GET'])
+    @ratelimit.limit('search', when=lambda: bool(request.args.get('q')))
+    def get_books():
+        search_term = request.args.get('q', default=None, type=str)
+        author = request.args.get('author', default=None, type=str)
+        year = request.args.get('year', default=None, type=int)
+        page = request.args.get('page', default=None, type=int)
+        limit = request.args.get('limit', default=10, type=int)
+        cursor = request.args.get('cursor', default=None, type=str)
+        # Có từ khóa tìm kiếm thì mặc định xếp theo độ liên quan (bm25)
+        sort = request.args.get('sort', default='relevance' if search_term else 'id', type=str)
+        # ?available=true: chỉ các đầu sách còn bản trên kệ (đọc bộ đếm available_copies)
+        available = request.args.get('available', default=None, type=str)
+        if available not in (None, 'true', 'false'):
+            return jsonify({"message": "available must be true or false"}), 400
+        available = None if available is None else available == 'true'
+        mode = hateoas.links_mode()
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+
+        # ?ids=1,2,3: thay cho N lần GET /books/<id> (kệ sách của một user...)
+        book_ids, error_response = fieldsets.parse_ids()
+        if error_response: return error_response
+        if book_ids is not None:
+            return records_by_ids('books', book_ids, queries.get_books_by_ids, queries.BOOK_COLUMNS,
+                                  link=hateoas.get_linker(mode))
+
+        fmt = negotiation.response_format()
+        etag = etags.collection_etag('books', queries.get_collection_version('books'), fmt=fmt)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+
+        next_cursor = None
+        # Cả ba cách phân trang đều kiểm tra page/limit/cursor (ValueError -> 400)
+        try:
+            if sort == 'relevance' and cursor is None:
+                # Tìm kiếm full-text xếp hạng bm25, phân trang theo `page`
+                page = page or 1
+                books = queries.search_books_ranked(search_term, author, year, page, limit, available)
+            elif page is not None and cursor is None:
+                # Tương thích ngược với phân trang LIMIT/OFFSET
+                books = queries.search_and_filter_books(search_term, author, year, page, limit, available)
+            else:
+                books, next_cursor = queries.search_books_keyset(
+                    search_term, author, year, limit, cursor=cursor, sort=sort, available=available
+                )
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        # Link phân trang luôn có (kể cả links=none), theo kiểu tuyệt đối/tương đối
+        external = mode == 'full'
+        links = {"self": {"href": request.url if external else request.full_path.rstrip('?')}}
+        if next_cursor:
+            args = request.args.to_dict()
+            args.pop('page', None)
+            args['cursor'] = next_cursor
+            links["next"] = {"href": url_for('get_books', _external=external, **args)}
+        elif page is not None and cursor is None and len(books) == limit:
+            args = request.args.to_dict()
+            args['page'] = page + 1
+            links["next"] = {"href": url_for('get_books', _external=external, **args)}
+
+        link = hateoas.get_linker(mode)
+        response = negotiation.collection_response({
+            "items": [link(b) for b in books],
+            "_links": links
+        }, fmt)
+        response.headers['ETag'] = etag
+        return response
+
+    # === Số liệu của lớp cache truy vấn (hits/misses/evictions...) ===
+    @app.route('/debug/cache', methods=['GET'])
+    def cache_stats():
+        return jsonify(cache.stats()), 200
+
+    # === Xuất toàn bộ dữ liệu dạng luồng (NDJSON hoặc CSV) ===
+    @app.route('/books/export', methods=['GET'])
+    def export_books():
+        fmt = export.choose_format()
+        if not fmt:
+            return jsonify({"message": "format must be one of: ndjson, csv"}), 400
+        return export.export_response(queries.iter_books(), fmt, 'books')
+
+    @app.route('/borrows/export', methods=['GET'])
+    def export_borrows():
+        fmt = export.choose_format()
+        if not fmt:
+            return jsonify({"message": "format must be one of: ndjson, csv"}), 400
+        return export.export_response(queries.iter_borrows(), fmt, 'borrows')
+
+    @app.route('/books/<int:book_id>', methods=['GET'])
+    def get_book(book_id):
+        mode = hateoas.links_mode()
+        if mode is None:
+            return jsonify({"message": "links must be one of: full, relative, none"}), 400
+        include, error_response = compound.parse_include(compound.BOOK_INCLUDES)
+        if error_response: return error_response
+
+        # Cơ chế ETag từ V3: 304 từ bộ đệm mà không cần đọc CSDL
+        cached_etag = etags.cached("book", book_id)
+        if etags.is_not_modified(cached_etag):
+            return Response(status=304, headers={'ETag': cached_etag})
+
+        book = queries.get_book_by_id(book_id)
+        if not book: return jsonify({"message": "Book not found"}), 404
+
+        # ETag theo phiên bản sách; links phụ thuộc `status`, mà đổi `status`
+        # (mượn/trả) luôn tăng phiên bản, nên ETag vẫn đúng cho cả links.
+        # Người đang mượn và lịch sử (?include=) cũng chỉ đổi khi mượn/trả.
+        etag = etags.book_etag(book)
+        etags.remember("book", book_id, etag)
+        if etags.is_not_modified(etag):
+            return Response(status=304, headers={'ETag': etag})
+
+        book_with_links = add_hateoas_links_to_book(book.copy(), mode)
+        compound.embed_in_book(book_with_links, include, mode)
+
+        response = jsonify(book_with_links)
+        response.headers['ETag'] = etag
+        return response
+
+    @app.route('/books', methods=['POST'])
+    def add_book():
+        data = request.get_json()
+        if not data or not all(k in data for k in ("title", "author", "year")):
+            return jsonify({"message": "Missing required fields: title, author, year"}), 400
+        total_copies = data.get('total_copies', 1)
+        if not isinstance(total_copies, int) or isinstance(total_copies, bool) or total_copies < 0:
+            return jsonify({"message": "total_copies must be a non-negative integer"}), 400
+
+        new_book = queries.add_book(data, total_copies=total_copies)
+        return jsonify(new_book), 201
+
+    # === Nạp sách hàng loạt: JSON array hoặc NDJSON, đọc theo luồng ===
+    @app.route('/books:bulk', methods=['POST'])
+    def bulk_add_books():
+        batch_size = request.args.get('batch_size', default=bulk_import.DEFAULT_BATCH_SIZE, type=int)
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            records = bulk_import.iter_ndjson(request.stream)
+        elif request.mimetype == 'application/json':
+            records = bulk_import.iter_json_array(request.stream)
+        else:
+            return jsonify({"message": "Content-Type must be application/json or application/x-ndjson"}), 415
+
+        report = bulk_import.import_books(records, batch_size=max(1, batch_size))
+        status = 201 if report['inserted'] else 400
+        return jsonify(report), status
+
+    @app.route('/books/<int:book_id>', methods=['PUT'])
+    def update_book(book_id):
+        if not queries.get_book_by_id(book_id):
+            return jsonify({"message": "Book not found"}), 404
+
+        data = request.get_json()
+        if not data or not all(k in data for k in ("title", "author", "year")):
+            return jsonify({"message": "Missing required fields: title, author, year"}), 400
+        total_copies = data.get('total_copies')
+        if total_copies is not None and (not isinstance(total_copies, int)
+                                         or isinstance(total_copies, bool) or total_copies < 0):
+            return jsonify({"message": "total_copies must be a non-negative integer"}), 400
+
+        updated_book = queries.update_book(book_id, data, total_copies=total_copies)
+        if updated_book is None:
+            return jsonify({"message": "total_copies cannot be less than the number of copies on loan"}), 409
+        return jsonify(updated_book), 200
+
+    @app.route('/books/<int:book_id>', methods=['DELETE'])
+    def delete_book(book_id):
+        deleted, error = queries.delete_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_borrowed': return jsonify({"message": "Cannot delete a borrowed book"}), 409
+        if deleted:
+            return jsonify({"message": f"Book with id {book_id} has been deleted."}), 200
+        return jsonify({"message": "An error occurred"}), 500
+    # borrow, return
+    @app.route('/books/<int:book_id>/borrow', methods=['POST'])
+    @token_required
+    @ratelimit.limit('borrow')
+    def borrow_book_route(current_user_id, book_id):
+        result, error = queries.borrow_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if error == 'book_unavailable':
+            # Chỉ đọc lại sách khi mượn thất bại, để trả về trạng thái hiện tại với HATEOAS
+            book = queries.get_book_by_id(book_id)
+            if not book:
+                # Sách bị xóa ngay sau lượt mượn thất bại
+                return jsonify({"message": "Book not found"}), 404
+            book_with_links = add_hateoas_links_to_book(book)
+            return jsonify({
+                "message": "Book is not available",
+                "current_state": book_with_links
+            }), 409
+        if result:
+            # Sau khi mượn thành công, trả về trạng thái mới của sách (từ RETURNING)
+            return jsonify(add_hateoas_links_to_book(result['book'])), 200
+        return jsonify({"message": "Failed to borrow book"}), 500
+
+    @app.route('/books/<int:book_id>/return', methods=['POST'])
+    @token_required
+    @ratelimit.limit('borrow')
+    def return_book_route(current_user_id, book_id):
+        result, error = queries.return_book(book_id, current_user_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify(add_hateoas_links_to_book(result['book'])), 200
+        return jsonify({"message": "Could not find an active borrow record"}), 500
+
+    # === Cấp / thu hồi token (bảng `tokens`, xem auth.py) ===
+    @app.route('/tokens', methods=['POST'])
+    @token_required
+    def issue_token_route(current_user_id):
+        """Cấp thêm một token cho chính user đang đăng nhập (vd. để xoay vòng token)."""
+        data = request.get_json(silent=True) or {}
+        scopes = data.get('scopes', ' '.join(sorted(g.token['scopes'])))
+        expires_in = data.get('expires_in')
+        if not isinstance(scopes, str):
+            return jsonify({"message": "scopes must be a string"}), 400
+        # bool là lớp con của int; ngoài khoảng này timedelta tràn số (500) hoặc token đã hết hạn ngay
+        if expires_in is not None and (isinstance(expires_in, bool) or not isinstance(expires_in, int)
+                                       or not 1 <= expires_in <= auth.MAX_EXPIRES_IN):
+            return jsonify({"message": f"expires_in must be an integer between 1 and {auth.MAX_EXPIRES_IN}"}), 400
+        # Không được tự nâng quyền: token mới chỉ có tối đa các quyền của token hiện tại
+        if not set(scopes.split()) <= g.token['scopes']:
+            return jsonify({"message": "Cannot grant scopes the current token does not have"}), 403
+
+        token, record = auth.issue_token(current_user_id, scopes, expires_in)
+        return jsonify({
+            "token": token,
+            "id": record['id'],
+            "user_id": record['user_id'],
+            "scopes": record['scopes'],
+            "expires_at": record['expires_at'],
+            "_links": {
+                "revoke": {"href": url_for('revoke_token_route', token_id=record['id'], _external=True),
+                           "method": "DELETE"}
+            }
+        }), 201
+
+    @app.route('/tokens/<int:token_id>', methods=['DELETE'])
+    @token_required
+    def revoke_token_route(current_user_id, token_id):
+        # Chỉ thu hồi được token của chính mình
+        if auth.revoke_token(token_id, current_user_id):
+            return jsonify({"message": f"Token {token_id} has been revoked."}), 200
+        return jsonify({"message": "Token not found"}), 404
+
+    # === Mượn/trả theo lô cho quầy thủ thư: một request, một giao dịch ===
+    # Mỗi cuốn có kết quả riêng (thành công từng phần); lỗi của từng cuốn
+    # được ánh xạ sang status code giống endpoint mượn/trả một cuốn.
+    BATCH_ERRORS = {
+        'book_not_found': (404, "Book not found"),
+        'user_not_found': (404, "User not found"),
+        'book_unavailable': (409, "Book is not available"),
+        'book_not_borrowed': (400, "Book was not borrowed"),
+        'no_active_borrow': (500, "Could not find an active borrow record"),
+        'db_error': (500, "An error occurred"),
+    }
+
+    def parse_book_ids():
+        """Đọc `book_ids` từ body; trả về (danh sách id, None) hoặc (None, response lỗi 400)."""
+        data = request.get_json(silent=True)
+        book_ids = data.get('book_ids') if isinstance(data, dict) else None
+        if not isinstance(book_ids, list) or not book_ids:
+            return None, (jsonify({"message": "book_ids must be a non-empty list"}), 400)
+        if len(book_ids) > MAX_BATCH_ITEMS:
+            return None, (jsonify({"message": f"At most {MAX_BATCH_ITEMS} book_ids per request"}), 400)
+        if not all(isinstance(i, int) and not isinstance(i, bool) for i in book_ids):
+            return None, (jsonify({"message": "book_ids must contain integers"}), 400)
+        return book_ids, None
+
+    def batch_response(book_ids, results, links):
+        items = []
+        for book_id, (result, error) in zip(book_ids, results):
+            if result:
+                items.append({"book_id": book_id, "status": 200,
+                              "book": add_hateoas_links_to_book(result['book'])})
+            else:
+                status, message = BATCH_ERRORS.get(error, (500, "An error occurred"))
+                items.append({"book_id": book_id, "status": status, "message": message,
+                              "_links": {"book": {"href": url_for('get_book', book_id=book_id, _external=True)}}})
+        succeeded = sum(1 for item in items if item['status'] == 200)
+        body = {"succeeded": succeeded, "failed": len(items) - succeeded, "items": items, "_links": links}
+        # 200: tất cả thành công; 207: thành công một phần; 409: không cuốn nào thành công
+        status = 200 if succeeded == len(items) else (207 if succeeded else 409)
+        return jsonify(body), status
+
+    @app.route('/borrows:batch', methods=['POST'])
+    @token_required
+    @ratelimit.limit('borrow')
+    # Mỗi cuốn trong lô là một lượt UPDATE/INSERT riêng (có SAVEPOINT): lặp là cố ý
+    @profiling.query_budget(max_queries=4 * MAX_BATCH_ITEMS + 10, max_repeats=MAX_BATCH_ITEMS + 1)
+    def borrow_books_batch(current_user_id):
+        book_ids, error_response = parse_book_ids()
+        if error_response: return error_response
+        results = queries.borrow_books(book_ids, current_user_id)
+        return batch_response(book_ids, results, {
+            "self": {"href": url_for('borrow_books_batch', _external=True)},
+            "borrowed_books": {"href": url_for('get_user_borrowed_books', user_id=current_user_id, _external=True)},
+            "returns": {"href": url_for('return_books_batch', _external=True), "method": "POST"},
+        })
+
+    @app.route('/returns:batch', methods=['POST'])
+    @token_required
+    @ratelimit.limit('borrow')
+    # Mỗi cuốn trong lô là một lượt UPDATE/INSERT riêng (có SAVEPOINT): lặp là cố ý
+    @profiling.query_budget(max_queries=4 * MAX_BATCH_ITEMS + 10, max_repeats=MAX_BATCH_ITEMS + 1)
+    def return_books_batch(current_user_id):
+        book_ids, error_response = parse_book_ids()
+        if error_response: return error_response
+        results = queries.return_books(book_ids, current_user_id)
+        return batch_response(book_ids, results, {
+            "self": {"href": url_for('return_books_batch', _external=True)},
+            "borrowed_books": {"href": url_for('get_user_borrowed_books', user_id=current_user_id, _external=True)},
+            "borrows": {"href": url_for('borrow_books_batch', _external=True), "method": "POST"},
+        })
+
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    app.run(debug=True)
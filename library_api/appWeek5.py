@@ -1,13 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, url_for
 from flask_cors import CORS 
 import db
+import profiling
+import json_provider
+import compression
 import queries
+import ratelimit
+import fieldsets
+import compound
+import hateoas
+import stats
 
 def create_app():
 
     app = Flask(__name__)
     CORS(app)
     db.init_app(app)
+    profiling.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    ratelimit.init_app(app)
+    stats.init_app(app)
 
     # === API Endpoints ===
     @app.route('/')
@@ -15,9 +28,25 @@ def create_app():
         return 'Hi!'
     
     # -- User Endpoints --
+    # Lấy nhiều bản ghi theo id (?ids=1,2,3) trong một truy vấn, ?fields= chọn cột
+    def records_by_ids(ids, fetch, columns):
+        fields, error_response = fieldsets.parse_fields(columns)
+        if error_response: return error_response
+        if fields is None:
+            records = fetch(tuple(ids))
+        else:
+            records = fetch(tuple(ids), fieldsets.select_columns(fields))
+        found = {r['id'] for r in records}
+        return jsonify({"items": records, "missing": [i for i in ids if i not in found]}), 200
+
     @app.route('/users', methods=['GET'])
     def get_users():
-        return jsonify(queries.get_all_users()), 200
+        user_ids, error_response = fieldsets.parse_ids()
+        if error_response: return error_response
+        if user_ids is not None:
+            return records_by_ids(user_ids, queries.get_users_by_ids, queries.USER_COLUMNS)
+        # Chuỗi JSON dựng sẵn trong SQLite, không qua dict trung gian
+        return json_provider.raw_json_response(queries.get_all_users_json())
 
     @app.route('/users/<int:user_id>', methods=['GET'])
     def get_user(user_id):
@@ -40,49 +69,123 @@ def create_app():
     # <<< DEMO NESTING: Lấy sách mà một người dùng đã mượn >>>
     @app.route('/users/<int:user_id>/borrowed-books', methods=['GET'])
     def get_user_borrowed_books(user_id):
-        # Kiểm tra xem user có tồn tại không
-        if not queries.get_user_by_id(user_id):
+        # ?include=borrower,books,history: trả về tài liệu gộp (xem compound.py)
+        include, error_response = compound.parse_include(compound.BORROWED_BOOKS_INCLUDES)
+        if error_response: return error_response
+
+        # Kiểm tra xem user có tồn tại không (bản ghi này cũng là `borrower` được nhúng)
+        user = queries.get_user_by_id(user_id)
+        if not user:
             return jsonify({"message": "User not found"}), 404
         
         # Giả sử bạn có một hàm trong queries.py để làm việc này
         borrowed_books = queries.get_borrowed_books_by_user(user_id)
+        if include:
+            return jsonify(compound.borrowed_books_document(user, borrowed_books, include)), 200
         return jsonify(borrowed_books), 200
 
     # -- Book Endpoints --
     # <<< DEMO: NÂNG CẤP ENDPOINT NÀY ĐỂ TÌM KIẾM, LỌC VÀ PHÂN TRANG >>>
     @app.route('/books', methods=['GET'])
+    @ratelimit.limit('search', when=lambda: bool(request.args.get('q')))
     def get_books():
+        # ?ids=1,2,3: nhiều cuốn theo id trong một truy vấn, thay cho N lần GET /books/<id>
+        book_ids, error_response = fieldsets.parse_ids()
+        if error_response: return error_response
+        if book_ids is not None:
+            return records_by_ids(book_ids, queries.get_books_by_ids, queries.BOOK_COLUMNS)
+
         # Lấy các query parameters từ URL
         search_term = request.args.get('q', default=None, type=str)
         author = request.args.get('author', default=None, type=str)
         year = request.args.get('year', default=None, type=int)
-        page = request.args.get('page', default=1, type=int)
+        page = request.args.get('page', default=None, type=int)
         limit = request.args.get('limit', default=10, type=int)
-
-        # Giả sử bạn có một hàm trong queries.py xử lý tất cả logic này
-        books = queries.search_and_filter_books(
-            search_term=search_term,
-            author=author,
-            year=year,
-            page=page,
-            limit=limit
-        )
-        return jsonify(books), 200
+        cursor = request.args.get('cursor', default=None, type=str)
+        # Có từ khóa tìm kiếm thì mặc định xếp theo độ liên quan (bm25)
+        sort = request.args.get('sort', default='relevance' if search_term else 'id', type=str)
+        # ?available=true: chỉ các đầu sách còn bản trên kệ (đọc bộ đếm available_copies)
+        available = request.args.get('available', default=None, type=str)
+        if available not in (None, 'true', 'false'):
+            return jsonify({"message": "available must be true or false"}), 400
+        available = None if available is None else available == 'true'
+
+        # Tìm kiếm full-text xếp hạng: phân trang theo `page` vì thứ tự bm25
+        # không phải một khóa ổn định để làm cursor
+        if sort == 'relevance' and cursor is None:
+            page = page or 1
+            try:
+                books = queries.search_books_ranked(search_term, author, year, page, limit, available)
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
+            response = jsonify(books)
+            if len(books) == limit:
+                args = request.args.to_dict()
+                args['page'] = page + 1
+                next_url = url_for('get_books', _external=True, **args)
+                response.headers['Link'] = f'<{next_url}>; rel="next"'
+            return response, 200
+
+        # Tương thích ngược: client gửi `page` vẫn được phân trang LIMIT/OFFSET
+        if page is not None and cursor is None:
+            try:
+                books = queries.search_and_filter_books(
+                    search_term=search_term,
+                    author=author,
+                    year=year,
+                    page=page,
+                    limit=limit,
+                    available=available
+                )
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
+            return jsonify(books), 200
+
+        # Mặc định: phân trang keyset, link trang sau nằm trong header `Link`
+        try:
+            books, next_cursor = queries.search_books_keyset(
+                search_term=search_term,
+                author=author,
+                year=year,
+                limit=limit,
+                cursor=cursor,
+                sort=sort,
+                available=available
+            )
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        response = jsonify(books)
+        if next_cursor:
+            args = request.args.to_dict()
+            args.pop('page', None)
+            args['cursor'] = next_cursor
+            next_url = url_for('get_books', _external=True, **args)
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+        return response, 200
 
     @app.route('/books/<int:book_id>', methods=['GET'])
     def get_book(book_id):
+        include, error_response = compound.parse_include(compound.BOOK_INCLUDES)
+        if error_response: return error_response
         book = queries.get_book_by_id(book_id)
-        if book:
-            return jsonify(book), 200
-        return jsonify({"message": "Book not found"}), 404
+        if not book:
+            return jsonify({"message": "Book not found"}), 404
+        if include:
+            # Tài liệu gộp dùng quy ước `_links` của V4
+            return jsonify(compound.embed_in_book(hateoas.get_linker()(book), include)), 200
+        return jsonify(book), 200
 
     @app.route('/books', methods=['POST'])
     def add_book():
         data = request.get_json()
         if not data or not all(k in data for k in ("title", "author", "year")):
             return jsonify({"message": "Missing required fields: title, author, year"}), 400
-        
-        new_book = queries.add_book(data)
+        total_copies = data.get('total_copies', 1)
+        if not isinstance(total_copies, int) or isinstance(total_copies, bool) or total_copies < 0:
+            return jsonify({"message": "total_copies must be a non-negative integer"}), 400
+
+        new_book = queries.add_book(data, total_copies=total_copies)
         return jsonify(new_book), 201
 
     @app.route('/books/<int:book_id>', methods=['PUT'])
@@ -93,49 +196,49 @@ def create_app():
         data = request.get_json()
         if not data or not all(k in data for k in ("title", "author", "year")):
             return jsonify({"message": "Missing required fields: title, author, year"}), 400
-
-        updated_book = queries.update_book(book_id, data)
+        total_copies = data.get('total_copies')
+        if total_copies is not None and (not isinstance(total_copies, int)
+                                         or isinstance(total_copies, bool) or total_copies < 0):
+            return jsonify({"message": "total_copies must be a non-negative integer"}), 400
+
+        updated_book = queries.update_book(book_id, data, total_copies=total_copies)
+        if updated_book is None:
+            return jsonify({"message": "total_copies cannot be less than the number of copies on loan"}), 409
         return jsonify(updated_book), 200
 
     @app.route('/books/<int:book_id>', methods=['DELETE'])
     def delete_book(book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book:
-            return jsonify({"message": "Book not found"}), 404
-        
-        if book['status'] == 'borrowed':
-            return jsonify({"message": "Cannot delete a borrowed book"}), 409
-
-        if queries.delete_book(book_id):
+        deleted, error = queries.delete_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_borrowed': return jsonify({"message": "Cannot delete a borrowed book"}), 409
+        if deleted:
             return jsonify({"message": f"Book with id {book_id} has been deleted."}), 200
         return jsonify({"message": "An error occurred"}), 500
 
     # -- Borrow/Return Endpoints --
     @app.route('/books/<int:book_id>/borrow', methods=['POST'])
+    @ratelimit.limit('borrow')
     def borrow_book_route(book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'available': return jsonify({"message": "Book is not available"}), 409
-
         data = request.get_json()
         if not data or 'user_id' not in data: return jsonify({"message": "Missing user_id"}), 400
-        
-        user = queries.get_user_by_id(data['user_id'])
-        if not user: return jsonify({"message": "User not found"}), 404
-        
-        borrow_record = queries.borrow_book(book_id, data['user_id'])
-        if borrow_record:
-            return jsonify(borrow_record), 201
+
+        # Kiểm tra trạng thái và mượn trong cùng một giao dịch (không đọc trước)
+        result, error = queries.borrow_book(book_id, data['user_id'])
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_unavailable': return jsonify({"message": "Book is not available"}), 409
+        if error == 'user_not_found': return jsonify({"message": "User not found"}), 404
+        if result:
+            return jsonify(result['borrow']), 201
         return jsonify({"message": "Failed to borrow book"}), 500
 
     @app.route('/books/<int:book_id>/return', methods=['POST'])
+    @ratelimit.limit('borrow')
     def return_book_route(book_id):
-        book = queries.get_book_by_id(book_id)
-        if not book: return jsonify({"message": "Book not found"}), 404
-        if book['status'] != 'borrowed': return jsonify({"message": "Book was not borrowed"}), 400
-            
-        if queries.return_book(book_id):
-            return jsonify({"message": f"Book '{book['title']}' has been returned."}), 200
+        result, error = queries.return_book(book_id)
+        if error == 'book_not_found': return jsonify({"message": "Book not found"}), 404
+        if error == 'book_not_borrowed': return jsonify({"message": "Book was not borrowed"}), 400
+        if result:
+            return jsonify({"message": f"Book '{result['book']['title']}' has been returned."}), 200
         return jsonify({"message": "Could not find an active borrow record"}), 500
 
     return app
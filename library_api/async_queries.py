@@ -0,0 +1,100 @@
+# async_queries.py
+"""
+Lớp truy vấn bất đồng bộ cho appAsync (Quart/ASGI).
+
+SQLite không có API bất đồng bộ thật, nên mỗi hàm của queries.py được chạy
+trên một thread pool có giới hạn thay vì trên event loop:
+- Pool đọc có đúng DB_POOL_SIZE luồng, bằng số kết nối của pool đọc, nên một
+  luồng không bao giờ phải chờ kết nối; các truy vấn vượt quá chờ trong hàng
+  đợi của executor (một coroutine, không phải một luồng).
+- Pool ghi có MỘT luồng, khớp với kết nối ghi duy nhất: các lệnh ghi được
+  tuần tự hóa bằng hàng đợi thay vì bằng luồng bị chặn.
+Nhờ vậy hàng nghìn kết nối keep-alive chỉ tốn coroutine, còn số luồng thì
+cố định. Hàng đợi cũng có giới hạn (DB_READ_MAX_WAITERS/DB_WRITE_MAX_WAITERS
+như pool của db.py): khi đầy, `run` ném db.PoolSaturated ngay (503). Cache, ETag và invalidation vẫn là của queries.py.
+Chỉ bọc các hàm mà appAsync cần; thêm hàm mới theo cùng mẫu `_async`.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import current_app
+
+import auth
+import db
+import queries
+
+EXECUTORS_KEY = "db_executors"
+PENDING_KEY = "db_executors_pending"
+
+
+def init_app(app):
+    """Tạo hai executor đọc/ghi cho `app` và đóng chúng (cùng các pool) khi server dừng."""
+    app.extensions[EXECUTORS_KEY] = {
+        "read": ThreadPoolExecutor(max_workers=app.config.get("DB_POOL_SIZE", 5),
+                                   thread_name_prefix="db-read"),
+        "write": ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write"),
+    }
+    # Số việc đang chạy + đang chờ trên mỗi executor (chỉ sửa trên event loop, không cần khóa)
+    app.extensions[PENDING_KEY] = {"read": 0, "write": 0}
+
+    @app.after_serving
+    async def shutdown_executors():
+        for executor in app.extensions.pop(EXECUTORS_KEY).values():
+            executor.shutdown(wait=True)
+        for key in ("db_pool_read", "db_pool_write"):
+            pool = app.extensions.pop(key, None)
+            if pool is not None:
+                pool.close()
+
+
+async def run(kind, fn, *args, **kwargs):
+    """Chạy `fn(*args, **kwargs)` trên executor `kind` ('read' | 'write') của ứng dụng hiện tại."""
+    app = current_app._get_current_object()
+
+    def call():
+        with db.bind_app(app):
+            return fn(*args, **kwargs)
+
+    executor = app.extensions[EXECUTORS_KEY][kind]
+    pending = app.extensions[PENDING_KEY]
+    if kind == "write":
+        limit = 1 + app.config.get("DB_WRITE_MAX_WAITERS", 16)
+    else:
+        max_waiters = app.config.get("DB_READ_MAX_WAITERS")
+        limit = None if max_waiters is None else app.config.get("DB_POOL_SIZE", 5) + max_waiters
+    if limit is not None and pending[kind] >= limit:
+        raise db.PoolSaturated(f"Too many queued {kind} queries ({pending[kind]})")
+    pending[kind] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+    finally:
+        pending[kind] -= 1
+
+
+def _async(kind, fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(kind, fn, *args, **kwargs)
+    return wrapper
+
+
+# === AUTH ===
+verify_token = _async("read", auth.verify_token)
+
+# === USER QUERIES ===
+get_all_users = _async("read", queries.get_all_users)
+get_user_by_id = _async("read", queries.get_user_by_id)
+add_user = _async("write", queries.add_user)
+
+# === BOOK QUERIES ===
+get_collection_version = _async("read", queries.get_collection_version)
+get_all_books = _async("read", queries.get_all_books)
+get_book_by_id = _async("read", queries.get_book_by_id)
+add_book = _async("write", queries.add_book)
+update_book = _async("write", queries.update_book)
+delete_book = _async("write", queries.delete_book)
+
+# === BORROW/RETURN QUERIES ===
+borrow_book = _async("write", queries.borrow_book)
+return_book = _async("write", queries.return_book)
@@ -0,0 +1,156 @@
+# auth.py
+"""
+Xác thực bằng token lưu trong bảng `tokens` (migration 0004), thay cho dict
+USER_TOKENS viết cứng trong từng app.
+- Client gửi `Authorization: Bearer <token>`; CSDL chỉ lưu SHA-256 của token.
+- Token đã xác thực được giữ trong một LRU có TTL trong tiến trình, nên
+  đường nóng (token đã gặp) không đọc CSDL.
+- Thu hồi: worker xử lý request thu hồi xóa token khỏi cache của nó ngay;
+  các worker khác thấy sau tối đa AUTH_TOKEN_CACHE_TTL giây (mục trong cache
+  hết hạn và bảng được đọc lại).
+"""
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import click
+from flask import g, jsonify, request
+
+import db
+import queries
+from cache import LRUCache
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 30.0
+DEFAULT_SCOPES = "library"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Hạn dài nhất của một token có hạn (giây); token vĩnh viễn thì bỏ trống expires_in
+MAX_EXPIRES_IN = 365 * 24 * 3600
+
+# (đường dẫn CSDL, token_hash) -> {"token_id", "user_id", "scopes"}: các app
+# dùng CSDL khác nhau trong cùng tiến trình không nhận token của nhau
+_verified = LRUCache(maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL)
+
+
+def init_app(app):
+    """
+    Đọc AUTH_TOKEN_CACHE_SIZE / AUTH_TOKEN_CACHE_TTL (giây) từ app.config và
+    đăng ký lệnh `flask issue-token`.
+    """
+    _verified.maxsize = app.config.get("AUTH_TOKEN_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+    _verified.ttl = app.config.get("AUTH_TOKEN_CACHE_TTL", DEFAULT_CACHE_TTL)
+
+    @app.cli.command("issue-token")
+    @click.argument("user_id", type=int)
+    @click.option("--scopes", default=DEFAULT_SCOPES, show_default=True,
+                  help="Các quyền, cách nhau bởi dấu cách.")
+    @click.option("--expires-in", type=click.IntRange(1, MAX_EXPIRES_IN), default=None,
+                  help="Số giây tới khi hết hạn (mặc định: không hết hạn).")
+    def issue_token_command(user_id, scopes, expires_in):
+        """Cấp token mới cho một user (token chỉ được in ra một lần)."""
+        # bind_app thay cho app_context: chạy được cả với app Quart (appAsync)
+        with db.bind_app(app):
+            token, record = issue_token(user_id, scopes, expires_in)
+        print(token)
+        print(f"id={record['id']} user_id={user_id} scopes={record['scopes']!r} "
+              f"expires_at={record['expires_at'] or 'never'}")
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _key(token_hash, app=None):
+    return (db.get_database_path(app), token_hash)
+
+
+def cached_identity(token, app=None):
+    """
+    Danh tính của token nếu đã có trong cache (không đọc CSDL), hoặc None.
+    `app` dùng khi gọi ngoài app context (vd. trên event loop của appAsync).
+    """
+    return _verified.get(_key(hash_token(token), app))
+
+
+def verify_token(token):
+    """
+    {"token_id", "user_id", "scopes"} của một token hợp lệ (chưa hết hạn,
+    chưa bị thu hồi), hoặc None. Kết quả được cache tối đa tới lúc token hết hạn.
+    """
+    token_hash = hash_token(token)
+    identity = _verified.get(_key(token_hash))
+    if identity is not None:
+        return identity
+
+    record = queries.get_token_by_hash(token_hash)
+    if record is None or record["revoked_at"] is not None:
+        return None
+    ttl = _verified.ttl
+    if record["expires_at"]:
+        remaining = (datetime.strptime(record["expires_at"], TIME_FORMAT) - _now()).total_seconds()
+        if remaining <= 0:
+            return None
+        ttl = remaining if ttl is None else min(ttl, remaining)
+    identity = {
+        "token_id": record["id"],
+        "user_id": record["user_id"],
+        "scopes": frozenset(record["scopes"].split()),
+    }
+    _verified.set(_key(token_hash), identity, ttl=ttl)
+    return identity
+
+
+def issue_token(user_id, scopes=DEFAULT_SCOPES, expires_in=None):
+    """Cấp token mới; trả về (token gốc, bản ghi trong bảng tokens)."""
+    token = secrets.token_urlsafe(32)
+    expires_at = None
+    if expires_in is not None:
+        expires_at = (_now() + timedelta(seconds=expires_in)).strftime(TIME_FORMAT)
+    record = queries.add_token(user_id, hash_token(token), scopes, expires_at)
+    return token, record
+
+
+def revoke_token(token_id, user_id):
+    """Thu hồi token của `user_id`; trả về bản ghi đã thu hồi hoặc None."""
+    record = queries.revoke_token(token_id, user_id)
+    if record:
+        _verified.delete(_key(record["token_hash"]))
+    return record
+
+
+def bearer_token():
+    """(token, None) từ header Authorization, hoặc (None, response lỗi 401)."""
+    token = None
+    if 'Authorization' in request.headers:
+        try: token = request.headers['Authorization'].split(" ")[1]
+        except IndexError: return None, (jsonify({'message': 'Token format is invalid!'}), 401)
+    if not token: return None, (jsonify({'message': 'Token is missing!'}), 401)
+    return token, None
+
+
+def token_required(f=None, scopes=()):
+    """
+    Decorator cho các route cần xác thực; route nhận `current_user_id` làm
+    tham số đầu tiên. Danh tính đầy đủ của token nằm trong `g.token`.
+    Dùng `@token_required` hoặc `@token_required(scopes=["..."])`.
+    """
+    if f is None:
+        return lambda fn: token_required(fn, scopes)
+    required = frozenset(scopes)
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token, error_response = bearer_token()
+        if error_response: return error_response
+        identity = verify_token(token)
+        if identity is None: return jsonify({'message': 'Token is invalid!'}), 401
+        if not required <= identity["scopes"]:
+            return jsonify({'message': 'Token does not have the required scope!'}), 403
+        g.token = identity
+        return f(identity["user_id"], *args, **kwargs)
+    return decorated
@@ -0,0 +1,4 @@
+# Các script đo hiệu năng / kiểm tra tải, chạy từ thư mục library_api:
+#   python -m benchmarks.<tên_script> --help
+# Bộ đo mốc (baseline): datagen.py (sinh dữ liệu) -> workload.py (sinh trace)
+# -> replay.py (phát lại trên create_app hoặc server thật) -> report.py.
@@ -0,0 +1,92 @@
+# bench_json.py
+"""
+So sánh các đường serialize GET /books trên N sách (mặc định 100k):
+- dict + jsonify (json chuẩn)   : sqlite3.Row -> dict -> DefaultJSONProvider
+- dict + jsonify (orjson)       : sqlite3.Row -> dict -> FastJSONProvider
+- SQLite json_group_array       : queries.get_all_books_json, không có dict nào
+Cache truy vấn bị tắt để mọi lần đo đều chạy SQL thật.
+
+Chạy từ thư mục library_api:
+    python -m benchmarks.bench_json --books 100000 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import appV1
+import cache
+import db
+import json_provider
+import queries
+
+
+def seed(app, count):
+    with app.app_context():
+        rows = [(f"Sách số {i}", f"Tác giả {i % 1000}", 1900 + i % 125) for i in range(count)]
+        for start in range(0, count, 10000):
+            queries.insert_books(rows[start:start + 10000])
+
+
+def measure(app, build, repeat):
+    """Thời gian (giây) để dựng xong body của response, lấy trung vị `repeat` lần."""
+    timings, size = [], 0
+    for _ in range(repeat):
+        with app.test_request_context():
+            started = time.perf_counter()
+            body = build().get_data()
+            timings.append(time.perf_counter() - started)
+            db.close_db()
+        size = len(body)
+    return statistics.median(timings), size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các đường serialize JSON")
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    fd, database = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    app = appV1.create_app()
+    app.config["DATABASE"] = database
+    try:
+        db.init_db(app)
+        seed(app, args.books)
+
+        cases = [("dict + jsonify (json chuẩn)", DefaultJSONProvider(app),
+                  lambda: jsonify(queries.get_all_books()))]
+        if json_provider.orjson is not None:
+            cases.append(("dict + jsonify (orjson)", json_provider.FastJSONProvider(app),
+                          lambda: jsonify(queries.get_all_books())))
+        else:
+            print("orjson chưa được cài: bỏ qua trường hợp orjson")
+        cases.append(("SQLite json_group_array", json_provider.FastJSONProvider(app),
+                      lambda: json_provider.raw_json_response(queries.get_all_books_json())))
+
+        print(f"{args.books:,} sách, trung vị {args.repeat} lần:")
+        baseline = None
+        with cache.disabled():
+            for name, provider, build in cases:
+                app.json = provider
+                seconds, size = measure(app, build, args.repeat)
+                baseline = baseline or seconds
+                print(f"  {name:<30} {seconds * 1000:8.1f} ms  {size / 1e6:6.1f} MB  "
+                      f"x{baseline / seconds:.1f}")
+    finally:
+        for key in ("db_pool_read", "db_pool_write"):
+            pool = app.extensions.get(key)
+            if pool is not None:
+                pool.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+
+
+if __name__ == "__main__":
+    main()
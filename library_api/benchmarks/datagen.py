@@ -0,0 +1,169 @@
+# datagen.py
+"""
+Sinh dữ liệu giả lập cho benchmark: N user, M đầu sách (mỗi đầu 1-5 bản) và
+lịch sử mượn/trả với tên người, tên sách tiếng Việt. Cùng `--seed` thì cùng dữ liệu, nên các lần
+đo trước/sau một thay đổi chạy trên đúng một bộ dữ liệu.
+
+Mỗi user (kể cả 2 user mẫu) có một token `bench_token_<id>` (xem user_token)
+để trace gọi được các route cần đăng nhập.
+
+Chạy từ thư mục library_api (file CSDL sẽ bị khởi tạo lại từ đầu):
+    python -m benchmarks.datagen --database /tmp/bench.db --users 1000 --books 50000 --borrows 20000
+"""
+import argparse
+import random
+import time
+import unicodedata
+from datetime import date, timedelta
+
+import appV5
+import auth
+import db
+import queries
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng",
+      "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý"]
+DEM = ["Văn", "Thị", "Hữu", "Đức", "Minh", "Ngọc", "Thanh", "Quang", "Thu", "Gia", "Bảo", "Xuân"]
+TEN = ["An", "Bình", "Chi", "Dũng", "Đạt", "Hà", "Hải", "Hạnh", "Hùng", "Hương", "Khánh",
+       "Lan", "Linh", "Long", "Mai", "Nam", "Nga", "Phúc", "Quân", "Sơn", "Tâm", "Thảo",
+       "Trang", "Tuấn", "Vy", "Yến"]
+AUTHORS = ["Nam Cao", "Tô Hoài", "Vũ Trọng Phụng", "Nguyễn Du", "Nguyễn Nhật Ánh",
+           "Xuân Diệu", "Thạch Lam", "Nguyễn Tuân", "Ngô Tất Tố", "Kim Lân",
+           "Nguyễn Huy Thiệp", "Bảo Ninh", "Hồ Anh Thái", "Nguyễn Ngọc Tư", "Ma Văn Kháng"]
+DANH_TU = ["Ngôi nhà", "Dòng sông", "Cánh đồng", "Mùa thu", "Chiếc lá", "Người lính",
+           "Bến đò", "Con đường", "Giấc mơ", "Tiếng hát", "Ánh trăng", "Làng quê",
+           "Kỷ niệm", "Hạt mưa", "Cánh diều", "Ngọn đèn", "Chuyến tàu", "Khu vườn"]
+TINH_TU = ["cuối cùng", "xanh", "lặng lẽ", "vàng", "xa xôi", "bình yên", "rực rỡ",
+           "cô đơn", "mùa hạ", "không tên", "đầu tiên", "bên kia"]
+DIA_DANH = ["Hà Nội", "Sài Gòn", "Huế", "Đà Lạt", "Hội An", "miền Tây", "Tây Bắc",
+            "sông Hồng", "phố cổ", "Trường Sơn"]
+TITLE_TEMPLATES = [
+    "{noun} {adj}",
+    "{noun} {place}",
+    "{noun} {adj} ở {place}",
+    "Chuyện {noun_lower} {place}",
+    "Những {noun_lower} {adj}",
+    "{noun} của {person}",
+]
+
+# Số bản của mỗi đầu sách và trọng số tương ứng
+COPIES = (1, 2, 3, 5)
+COPIES_WEIGHTS = (60, 25, 10, 5)
+TODAY = date(2024, 6, 1)  # cố định để dữ liệu không phụ thuộc ngày chạy
+HISTORY_DAYS = 3 * 365
+
+
+def user_token(user_id):
+    """Token (dạng rõ) của user trong dữ liệu benchmark."""
+    return f"bench_token_{user_id}"
+
+
+def ascii_slug(text):
+    """'Nguyễn Văn Đạt' -> 'nguyenvandat' (dùng cho email)."""
+    text = text.replace("Đ", "D").replace("đ", "d")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def make_person(rng):
+    return f"{rng.choice(HO)} {rng.choice(DEM)} {rng.choice(TEN)}"
+
+
+def make_title(rng):
+    noun = rng.choice(DANH_TU)
+    return rng.choice(TITLE_TEMPLATES).format(
+        noun=noun, noun_lower=noun.lower(), adj=rng.choice(TINH_TU),
+        place=rng.choice(DIA_DANH), person=make_person(rng),
+    )
+
+
+def make_author(rng):
+    # Phần lớn sách thuộc một nhóm tác giả quen (lọc theo author có nhiều kết quả)
+    return rng.choice(AUTHORS) if rng.random() < 0.6 else make_person(rng)
+
+
+def generate(app, users=1000, books=50000, borrows=20000, active_ratio=0.1, seed=42):
+    """
+    Khởi tạo lại CSDL của `app` (init_db) rồi thêm dữ liệu giả lập.
+    `active_ratio`: tỉ lệ lượt mượn chưa trả (không vượt quá số bản của đầu sách).
+    Trả về {"users": id user lớn nhất, "books": id sách lớn nhất, "borrows": số lượt mượn}.
+    """
+    rng = random.Random(seed)
+    db.init_db(app)
+    with app.app_context():
+        conn = db.get_db()
+        first_user = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0] + 1
+        user_rows = []
+        for user_id in range(first_user, first_user + users):
+            name = make_person(rng)
+            joined = TODAY - timedelta(days=rng.randrange(HISTORY_DAYS + 365))
+            user_rows.append((name, f"{ascii_slug(name)}{user_id}@example.com", joined.isoformat()))
+        with conn:
+            conn.executemany("INSERT INTO users (name, email, member_since) VALUES (?, ?, ?)", user_rows)
+
+        book_rows = [(make_title(rng), make_author(rng), rng.randint(1900, 2024)) for _ in range(books)]
+        with queries.books_bulk_load():
+            for start in range(0, len(book_rows), 10000):
+                queries.insert_books(book_rows[start:start + 10000])
+
+        max_user = conn.execute("SELECT MAX(id) FROM users").fetchone()[0]
+        # Số bản còn trên kệ của từng đầu sách (kể cả dữ liệu mẫu của init_db)
+        available = {row[0]: row[1] for row in conn.execute("SELECT id, available_copies FROM books")}
+        copies = {}
+        for book_id in range(max(available) - books + 1, max(available) + 1):
+            copies[book_id] = rng.choices(COPIES, COPIES_WEIGHTS)[0]
+            available[book_id] = copies[book_id]
+        max_book = max(available)
+
+        borrow_rows = []
+        for _ in range(borrows):
+            book_id = rng.randint(1, max_book)
+            borrowed = TODAY - timedelta(days=rng.randrange(HISTORY_DAYS))
+            returned = None
+            if available[book_id] == 0 or rng.random() >= active_ratio:
+                returned = min(TODAY, borrowed + timedelta(days=rng.randint(1, 30))).isoformat()
+            else:
+                available[book_id] -= 1
+            borrow_rows.append((book_id, rng.randint(1, max_user), borrowed.isoformat(), returned))
+
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        with conn:
+            conn.executemany(
+                "INSERT INTO borrows (book_id, user_id, borrow_date, return_date) VALUES (?, ?, ?, ?)",
+                borrow_rows,
+            )
+            conn.executemany(
+                "UPDATE books SET total_copies = ?, available_copies = ?, "
+                "status = CASE WHEN ? > 0 THEN 'available' ELSE 'borrowed' END WHERE id = ?",
+                [(total, available[book_id], available[book_id], book_id)
+                 for book_id, total in copies.items()],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO tokens (token_hash, user_id, scopes, created_at) VALUES (?, ?, ?, ?)",
+                [(auth.hash_token(user_token(u)), u, auth.DEFAULT_SCOPES, created)
+                 for u in range(1, max_user + 1)],
+            )
+            conn.execute("ANALYZE")
+    return {"users": max_user, "books": max_book, "borrows": len(borrow_rows)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả lập cho benchmark")
+    parser.add_argument("--database", required=True, help="file CSDL (sẽ bị khởi tạo lại)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=50000)
+    parser.add_argument("--borrows", type=int, default=20000)
+    parser.add_argument("--active-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    app = appV5.create_app()
+    app.config["DATABASE"] = args.database
+    started = time.perf_counter()
+    summary = generate(app, args.users, args.books, args.borrows, args.active_ratio, args.seed)
+    print(f"Generated {summary['users']} users, {summary['books']} books, "
+          f"{summary['borrows']} borrows in {time.perf_counter() - started:.1f}s -> {args.database}")
+
+
+if __name__ == "__main__":
+    main()
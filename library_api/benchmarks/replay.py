@@ -0,0 +1,209 @@
+# replay.py
+"""
+Phát lại một trace request (xem workload.py) và in báo cáo (report.py).
+
+Hai chế độ:
+- `--app appV5` (hoặc appV1..appV4, appWeek5): chạy trong tiến trình qua WSGI
+  test client, trên một CSDL sinh bởi datagen.py (`--database` có sẵn, hoặc
+  tự sinh vào file tạm). Profiling được bật nên có thời gian CSDL; giới hạn
+  tần suất bị tắt để không đo nhầm các 429.
+- `--url http://127.0.0.1:5000`: gửi tới một server thật (keep-alive, mỗi
+  luồng một kết nối). Server cần chạy trên CSDL của datagen.py; bật
+  LIBRARY_PROFILING=1 để có cột thời gian CSDL, và nên tắt RATELIMIT_ENABLED.
+
+Chạy từ thư mục library_api:
+    python -m benchmarks.replay --app appV5 --requests 5000 --concurrency 8 --output after.json
+    python -m benchmarks.replay --url http://127.0.0.1:5000 --trace trace.jsonl --baseline before.json
+"""
+import argparse
+import http.client
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks import datagen, report, workload
+
+
+def _headers(request):
+    headers = dict(request.get("headers") or {})
+    if request.get("user_id") is not None:
+        headers["Authorization"] = f"Bearer {datagen.user_token(request['user_id'])}"
+    return headers
+
+
+class TestClientTarget:
+    """Gửi request qua WSGI test client (mỗi luồng một client)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, request):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(request["path"], method=request["method"],
+                               headers=_headers(request), json=request.get("json"))
+        response.get_data()  # đọc hết body (kể cả response dạng luồng)
+        return response.status_code, response.headers.get("Server-Timing")
+
+
+class HTTPTarget:
+    """Gửi request tới server thật qua http.client (mỗi luồng một kết nối keep-alive)."""
+
+    def __init__(self, url, timeout=30.0):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, request):
+        headers = _headers(request)
+        body = None
+        if request.get("json") is not None:
+            body = json.dumps(request["json"]).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(request["method"], self.prefix + request["path"], body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return response.status, response.getheader("Server-Timing")
+            except (http.client.HTTPException, OSError):
+                # Server đóng kết nối keep-alive: mở lại và thử thêm một lần
+                conn.close()
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+
+
+def replay(target, trace, concurrency=1):
+    """
+    Phát `trace` với `concurrency` luồng (các luồng lấy lần lượt request kế
+    tiếp, nên thứ tự tương đối của trace được giữ). Trả về (results, elapsed).
+    """
+    results = []
+    lock = threading.Lock()
+    position = iter(range(len(trace)))
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                break
+            request = trace[index]
+            started = time.perf_counter()
+            try:
+                status, server_timing = target.send(request)
+            except (http.client.HTTPException, OSError):
+                status, server_timing = "error", None
+            latency_ms = (time.perf_counter() - started) * 1000
+            local.append((request.get("name") or request["path"], status, latency_ms,
+                          report.db_ms_from_header(server_timing)))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - started
+
+
+def make_app(module_name, database):
+    app = importlib.import_module(module_name).create_app()
+    app.config.update(DATABASE=database, PROFILING_ENABLED=True, RATELIMIT_ENABLED=False,
+                      QUERY_GUARD="off")
+    return app
+
+
+def close_pools(app):
+    for key in ("db_pool_read", "db_pool_write"):
+        pool = app.extensions.get(key)
+        if pool is not None:
+            pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phát lại trace request và báo cáo độ trễ")
+    target_group = parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument("--app", help="module có create_app, vd. appV5 (chạy trong tiến trình)")
+    target_group.add_argument("--url", help="địa chỉ server thật, vd. http://127.0.0.1:5000")
+    parser.add_argument("--trace", help="file trace JSONL (mặc định: sinh bằng workload.py)")
+    parser.add_argument("--requests", type=int, default=5000, help="số request khi tự sinh trace")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=200, help="số request đầu không tính vào báo cáo")
+    parser.add_argument("--database", help="CSDL đã sinh bằng datagen.py (chế độ --app)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=50000)
+    parser.add_argument("--borrows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="ghi báo cáo ra file JSON")
+    parser.add_argument("--baseline", help="báo cáo JSON dùng làm mốc so sánh")
+    args = parser.parse_args(argv)
+
+    app, scratch = None, None
+    max_user, max_book = args.users + 2, args.books + 3  # cộng phần dữ liệu mẫu của init_db
+    if args.app:
+        database = args.database
+        if database is None:
+            fd, scratch = tempfile.mkstemp(suffix=".db")
+            os.close(fd)
+            database = scratch
+        app = make_app(args.app, database)
+        if scratch:
+            sizes = datagen.generate(app, args.users, args.books, args.borrows, seed=args.seed)
+            max_user, max_book = sizes["users"], sizes["books"]
+        target = TestClientTarget(app)
+    else:
+        target = HTTPTarget(args.url)
+
+    try:
+        if args.trace:
+            trace = workload.load_trace(args.trace)
+        else:
+            trace = workload.make_trace(args.warmup + args.requests, max_user, max_book, seed=args.seed)
+        if args.warmup:
+            replay(target, trace[:args.warmup], args.concurrency)
+        results, elapsed = replay(target, trace[args.warmup:], args.concurrency)
+    finally:
+        if app is not None:
+            close_pools(app)
+        if scratch:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(scratch + suffix):
+                    os.remove(scratch + suffix)
+
+    summary = report.summarize(results, elapsed)
+    summary["config"] = {
+        "target": args.app or args.url, "trace": args.trace, "requests": len(results),
+        "concurrency": args.concurrency, "warmup": args.warmup,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(report.format_report(summary, baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
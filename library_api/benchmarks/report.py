@@ -0,0 +1,118 @@
+# report.py
+"""
+Tổng hợp kết quả replay: thông lượng, p50/p95/p99 theo endpoint và thời gian
+CSDL (lấy từ header Server-Timing `db;dur=...` do profiling.py gắn vào).
+
+Báo cáo lưu được ra JSON (`replay.py --output`) để làm mốc so sánh:
+    python -m benchmarks.report after.json --baseline before.json
+"""
+import argparse
+import json
+import math
+import re
+from collections import defaultdict
+
+SERVER_TIMING_DB = re.compile(r"(?:^|,)\s*db;dur=([0-9.]+)")
+
+
+def db_ms_from_header(value):
+    """Thời gian CSDL (ms) trong header Server-Timing, hoặc None nếu không có."""
+    match = SERVER_TIMING_DB.search(value or "")
+    return float(match.group(1)) if match else None
+
+
+def percentile(sorted_values, p):
+    """Phân vị theo kiểu nearest-rank trên danh sách đã sắp xếp."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _stats(latencies, db_times, statuses, elapsed):
+    latencies = sorted(latencies)
+    row = {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else None,
+        "statuses": dict(sorted(statuses.items())),
+    }
+    if db_times:
+        row["db_mean_ms"] = sum(db_times) / len(db_times)
+        row["db_p95_ms"] = percentile(sorted(db_times), 95)
+        row["db_share"] = sum(db_times) / sum(latencies) if sum(latencies) else None
+    return row
+
+
+def summarize(results, elapsed):
+    """
+    `results`: các tuple (name, status, latency_ms, db_ms hoặc None);
+    `elapsed`: thời gian chạy thực (giây). Trả về dict có thể ghi ra JSON.
+    """
+    groups = defaultdict(lambda: ([], [], defaultdict(int)))
+    for name, status, latency_ms, db_ms in results:
+        for key in (name, "TOTAL"):
+            latencies, db_times, statuses = groups[key]
+            latencies.append(latency_ms)
+            if db_ms is not None:
+                db_times.append(db_ms)
+            statuses[str(status)] += 1
+    return {
+        "elapsed_s": elapsed,
+        "endpoints": {name: _stats(*group, elapsed) for name, group in sorted(groups.items())},
+    }
+
+
+def _fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def _delta(value, base):
+    if value is None or not base:
+        return ""
+    return f" ({(value - base) / base * 100:+.0f}%)"
+
+
+def format_report(summary, baseline=None):
+    """Bảng văn bản; có `baseline` thì kèm % thay đổi của p50/p95/p99 và thông lượng."""
+    header = (f"{'endpoint':38} {'req':>6} {'req/s':>14} {'p50 ms':>14} {'p95 ms':>14} "
+              f"{'p99 ms':>14} {'db ms':>7} {'db %':>5}  statuses")
+    lines = [header, "-" * len(header)]
+    base_endpoints = (baseline or {}).get("endpoints", {})
+    for name, row in summary["endpoints"].items():
+        base = base_endpoints.get(name, {})
+        cells = [
+            f"{name[:38]:38}",
+            f"{row['requests']:>6}",
+            f"{_fmt(row['throughput']) + _delta(row['throughput'], base.get('throughput')):>14}",
+        ]
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{_fmt(row[key], '.2f') + _delta(row[key], base.get(key)):>14}")
+        cells.append(f"{_fmt(row.get('db_mean_ms'), '.2f'):>7}")
+        share = row.get("db_share")
+        cells.append(f"{_fmt(share * 100 if share is not None else None, '.0f'):>5}")
+        cells.append(" " + " ".join(f"{code}:{n}" for code, n in row["statuses"].items()))
+        lines.append(" ".join(cells))
+    lines.append(f"elapsed {summary['elapsed_s']:.2f}s")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="In báo cáo benchmark đã lưu (JSON)")
+    parser.add_argument("report", help="file JSON do replay.py --output ghi ra")
+    parser.add_argument("--baseline", help="báo cáo JSON dùng làm mốc so sánh")
+    args = parser.parse_args(argv)
+    with open(args.report, encoding="utf-8") as f:
+        summary = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(summary, baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# stress_borrow.py
+"""
+Kiểm tra tải cho mượn/trả đồng thời: nhiều luồng cùng mượn MỘT cuốn sách,
+chỉ được phép có đúng một người thắng (201), số còn lại nhận 409; sau đó
+cùng trả cuốn sách đó, chỉ đúng một lần trả thành công.
+
+Mỗi "worker" là một instance ứng dụng riêng (pool kết nối ghi riêng) trên
+cùng một file CSDL, giống khi chạy nhiều tiến trình gunicorn; nhờ vậy các
+request thật sự tranh nhau khóa ghi của SQLite chứ không xếp hàng trên một
+kết nối chung.
+
+Chạy từ thư mục library_api:
+    python -m benchmarks.stress_borrow --workers 4 --threads 16 --rounds 20
+Trả về mã thoát 1 nếu có vòng nào sai.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+import appWeek5
+import db
+
+
+def make_apps(database, workers):
+    apps = []
+    for _ in range(workers):
+        app = appWeek5.create_app()
+        # Kiểm tra tính đúng khi tranh chấp, không phải giới hạn tần suất:
+        # tắt ratelimit để mọi request thật sự chạm tới CSDL
+        app.config.update(DATABASE=database, RATELIMIT_ENABLED=False)
+        apps.append(app)
+    return apps
+
+
+def hammer(apps, threads, path, payload_for):
+    """Gửi đồng thời `threads` request POST `path` lên mỗi app; trả về Counter các status code."""
+    barrier = threading.Barrier(len(apps) * threads)
+    statuses = []
+    lock = threading.Lock()
+
+    def run(app, n):
+        client = app.test_client()
+        barrier.wait()
+        status = client.post(path, json=payload_for(n)).status_code
+        with lock:
+            statuses.append(status)
+
+    workers = [
+        threading.Thread(target=run, args=(app, i * threads + t))
+        for i, app in enumerate(apps) for t in range(threads)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return Counter(statuses)
+
+
+def open_borrows(database, book_id):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute(
+            "SELECT COUNT(*) FROM borrows WHERE book_id = ? AND return_date IS NULL", (book_id,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="số instance ứng dụng")
+    parser.add_argument("--threads", type=int, default=16, help="số luồng mỗi instance")
+    parser.add_argument("--rounds", type=int, default=20, help="số vòng mượn/trả")
+    args = parser.parse_args(argv)
+
+    fd, database = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    apps = make_apps(database, args.workers)
+    try:
+        db.init_db(apps[0])
+        book_id = 1
+        user_ids = (1, 2)  # dữ liệu mẫu có 2 user
+        failures = 0
+        for round_no in range(1, args.rounds + 1):
+            borrowed = hammer(apps, args.threads, f"/books/{book_id}/borrow",
+                              lambda n: {"user_id": user_ids[n % len(user_ids)]})
+            after_borrow = open_borrows(database, book_id)
+            returned = hammer(apps, args.threads, f"/books/{book_id}/return", lambda n: None)
+            after_return = open_borrows(database, book_id)
+
+            ok = (borrowed[201] == 1 and borrowed[409] == sum(borrowed.values()) - 1
+                  and after_borrow == 1
+                  and returned[200] == 1 and returned[400] == sum(returned.values()) - 1
+                  and after_return == 0)
+            failures += not ok
+            print(f"round {round_no}: borrow {dict(borrowed)} (open={after_borrow}), "
+                  f"return {dict(returned)} (open={after_return}) {'ok' if ok else 'FAILED'}")
+        total = args.workers * args.threads
+        print(f"{args.rounds} rounds x {total} concurrent requests: "
+              f"{'all ok' if not failures else f'{failures} failed'}")
+        return 1 if failures else 0
+    finally:
+        for app in apps:
+            for key in ("db_pool_read", "db_pool_write"):
+                pool = app.extensions.get(key)
+                if pool is not None:
+                    pool.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# workload.py
+"""
+Sinh trace request (JSONL, mỗi dòng một request) cho replay.py.
+
+Mỗi dòng có dạng:
+    {"name": "GET /books?q", "method": "GET", "path": "/books?q=dong+song",
+     "user_id": 12, "json": {...}}
+- `name`: nhãn để gom số liệu trong báo cáo (thường là route + loại tham số).
+- `user_id` (tùy chọn): replay gửi kèm `Authorization: Bearer bench_token_<id>`
+  (token do datagen.py tạo). `headers` (tùy chọn) được gửi nguyên văn.
+
+Tỉ lệ mặc định (MIX) mô phỏng một thư viện: chủ yếu là đọc/tìm kiếm, mượn và
+trả chiếm một phần nhỏ; mỗi lượt mượn được nối bằng một lượt trả sau đó.
+
+Chạy từ thư mục library_api:
+    python -m benchmarks.workload --requests 10000 --users 1002 --books 50003 > trace.jsonl
+"""
+import argparse
+import json
+import random
+import sys
+from urllib.parse import urlencode
+
+from benchmarks.datagen import AUTHORS, DANH_TU, DIA_DANH
+
+MIX = {
+    "GET /books": 25,
+    "GET /books?q": 20,
+    "GET /books?author": 10,
+    "GET /books/<id>": 20,
+    "GET /users/<id>": 5,
+    "GET /users/<id>/borrowed-books": 10,
+    "POST /books/<id>/borrow": 10,
+}
+# Số request tối đa giữa một lượt mượn và lượt trả tương ứng
+RETURN_DELAY = 50
+
+
+def make_request(kind, rng, max_user, max_book):
+    user_id = rng.randint(1, max_user)
+    book_id = rng.randint(1, max_book)
+    if kind == "GET /books":
+        query = {"limit": rng.choice((10, 20, 50))}
+        if rng.random() < 0.3:
+            query["sort"] = rng.choice(("title", "year"))
+        return {"name": kind, "method": "GET", "path": f"/books?{urlencode(query)}"}
+    if kind == "GET /books?q":
+        term = rng.choice((rng.choice(DANH_TU), rng.choice(DIA_DANH))).lower()
+        # Gõ thiếu dấu/chưa xong từ như người dùng thật
+        if rng.random() < 0.5:
+            term = term.split()[0]
+        return {"name": kind, "method": "GET", "path": f"/books?{urlencode({'q': term})}"}
+    if kind == "GET /books?author":
+        return {"name": kind, "method": "GET",
+                "path": f"/books?{urlencode({'author': rng.choice(AUTHORS)})}"}
+    if kind == "GET /books/<id>":
+        return {"name": kind, "method": "GET", "path": f"/books/{book_id}"}
+    if kind == "GET /users/<id>":
+        return {"name": kind, "method": "GET", "path": f"/users/{user_id}"}
+    if kind == "GET /users/<id>/borrowed-books":
+        return {"name": kind, "method": "GET", "path": f"/users/{user_id}/borrowed-books"}
+    if kind == "POST /books/<id>/borrow":
+        # user_id trong body cho V1-V3/Week5, token cho V4/V5
+        return {"name": kind, "method": "POST", "path": f"/books/{book_id}/borrow",
+                "user_id": user_id, "json": {"user_id": user_id}}
+    raise ValueError(f"Unknown request kind: {kind}")
+
+
+def make_trace(count, max_user, max_book, seed=7, mix=None):
+    """Danh sách `count` request theo tỉ lệ `mix` (mặc định MIX)."""
+    rng = random.Random(seed)
+    mix = mix or MIX
+    kinds, weights = list(mix), list(mix.values())
+    trace, pending_returns = [], []
+    while len(trace) < count:
+        if pending_returns and pending_returns[0][0] <= len(trace):
+            _, book_id, user_id = pending_returns.pop(0)
+            trace.append({"name": "POST /books/<id>/return", "method": "POST",
+                          "path": f"/books/{book_id}/return", "user_id": user_id})
+            continue
+        request = make_request(rng.choices(kinds, weights)[0], rng, max_user, max_book)
+        if request["method"] == "POST":
+            book_id = int(request["path"].split("/")[2])
+            pending_returns.append((len(trace) + rng.randint(1, RETURN_DELAY), book_id, request["user_id"]))
+        trace.append(request)
+    return trace
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh trace request (JSONL) cho replay.py")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--users", type=int, required=True, help="id user lớn nhất")
+    parser.add_argument("--books", type=int, required=True, help="id sách lớn nhất")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    for request in make_trace(args.requests, args.users, args.books, args.seed):
+        sys.stdout.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# bulk_import.py
+"""
+Nạp sách hàng loạt (POST /books:bulk và `flask import-books`).
+- Đọc dữ liệu theo luồng (JSON array, NDJSON hoặc CSV), không bao giờ giữ
+  toàn bộ file trong bộ nhớ.
+- Dòng hợp lệ được gom thành lô và ghi bằng queries.insert_books
+  (executemany, một giao dịch mỗi lô), trong queries.books_bulk_load: các
+  trigger từng dòng được bỏ một lần cho cả lần nạp, mỗi lô tự đánh chỉ mục
+  FTS bằng một lệnh. Sau mỗi lô kết nối ghi được trả về pool, nên các
+  request ghi khác chen vào được giữa hai lô thay vì phải chờ (hoặc nhận
+  503) suốt thời gian tải lên.
+- Việc đọc/kiểm tra chạy trong một luồng riêng, song song với việc ghi.
+- Dòng lỗi không chặn cả file: được ghi lại kèm số thứ tự để báo cáo.
+"""
+import codecs
+import csv
+import json
+import queue
+import threading
+
+import db
+import queries
+
+DEFAULT_BATCH_SIZE = 10000
+# Giới hạn số lỗi chi tiết trả về để báo cáo không phình theo kích thước file
+MAX_REPORTED_ERRORS = 1000
+READ_CHUNK_SIZE = 64 * 1024
+# Số lô đã kiểm tra được đọc trước trong lúc lô hiện tại đang được ghi
+PREFETCH_BATCHES = 2
+
+
+class BulkFormatError(ValueError):
+    """Dữ liệu đầu vào sai định dạng tới mức không thể đọc tiếp."""
+
+
+def validate_book(record):
+    """Trả về (tuple (title, author, year), None) nếu hợp lệ, ngược lại (None, thông báo lỗi)."""
+    if not isinstance(record, dict):
+        return None, "Row must be an object"
+    title, author, year = record.get("title"), record.get("author"), record.get("year")
+    # Chuỗi chỉ có khoảng trắng cũng coi như thiếu
+    missing = [name for name, value in (("title", title), ("author", author), ("year", year))
+               if value is None or (isinstance(value, str) and not value.strip())]
+    if missing:
+        return None, f"Missing required fields: {', '.join(missing)}"
+    if not isinstance(title, str) or not isinstance(author, str):
+        return None, "title and author must be strings"
+    # bool là lớp con của int (true -> 1), int() cắt phần lẻ của số thực: đều từ chối
+    if isinstance(year, bool) or not isinstance(year, (int, str)):
+        return None, f"Invalid year: {year!r}"
+    try:
+        year = int(year)
+    except ValueError:
+        return None, f"Invalid year: {year!r}"
+    return (title.strip(), author.strip(), year), None
+
+
+def _iter_lines(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    Tách các dòng từ luồng bytes, đọc theo khối `chunk_size`. readline() trên
+    request.stream (werkzeug LimitedStream, không có bộ đệm) đọc từng byte,
+    chậm hơn nhiều lần so với phần còn lại của việc nạp.
+    """
+    pending = b""
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_ndjson(stream):
+    """Đọc NDJSON (mỗi dòng một object) từ một luồng bytes; bỏ qua dòng trống."""
+    for line in _iter_lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            # Một dòng hỏng không ảnh hưởng các dòng khác
+            yield BulkFormatError(f"Invalid JSON: {e}")
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    Đọc từng phần tử của một JSON array từ luồng bytes mà không nạp cả
+    mảng vào bộ nhớ (json.load sẽ dựng toàn bộ danh sách trước).
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    expecting = "open"  # open -> value_or_end -> comma_or_end -> value -> ...
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + utf8.decode(chunk or b"", final=not chunk)
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise BulkFormatError("Unexpected end of JSON array")
+            fill()
+            continue
+
+        char = buf[pos]
+        if expecting == "open":
+            if char != "[":
+                raise BulkFormatError("Expected a JSON array")
+            pos += 1
+            expecting = "value_or_end"
+        elif expecting in ("value_or_end", "comma_or_end") and char == "]":
+            return
+        elif expecting == "comma_or_end":
+            if char != ",":
+                raise BulkFormatError(f"Expected ',' or ']' but found {char!r}")
+            pos += 1
+            expecting = "value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise BulkFormatError("Invalid JSON in array")
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # Giá trị có thể bị cắt ngang ở ranh giới chunk (vd. số 12|34)
+                fill()
+                continue
+            pos = end
+            expecting = "comma_or_end"
+            yield value
+
+
+def iter_csv(text_stream):
+    """Đọc CSV có dòng tiêu đề title,author,year."""
+    reader = csv.DictReader(text_stream)
+    if not reader.fieldnames or not {"title", "author", "year"} <= set(reader.fieldnames):
+        raise BulkFormatError("CSV header must contain: title, author, year")
+    yield from reader
+
+
+def _validated_batches(records, batch_size, fail):
+    """Kiểm tra từng bản ghi, gọi `fail(số thứ tự, thông báo)` cho dòng lỗi, sinh ra các lô dòng hợp lệ."""
+    batch = []
+    row_number = 0
+    try:
+        for row_number, record in enumerate(records, start=1):
+            if isinstance(record, BulkFormatError):
+                fail(row_number, str(record))
+                continue
+            row, error = validate_book(record)
+            if error:
+                fail(row_number, error)
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    except BulkFormatError as e:
+        # Dữ liệu hỏng giữa chừng: các lô trước vẫn được ghi, báo lỗi tại vị trí dừng
+        fail(row_number + 1, str(e))
+    if batch:
+        yield batch
+
+
+def _prefetch(iterable, size=PREFETCH_BATCHES):
+    """
+    Duyệt `iterable` trong một luồng riêng, đi trước bên dùng tối đa `size`
+    phần tử. sqlite3 nhả GIL trong lúc chạy câu lệnh, nên việc đọc/kiểm tra
+    lô sau chồng lên việc ghi lô trước thay vì chạy nối tiếp. Lỗi trong luồng
+    đọc được ném lại ở bên dùng.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    thread = threading.Thread(target=produce, name="bulk-import-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # Bên dùng dừng sớm (lỗi khi ghi): gỡ chặn put() của luồng đọc rồi chờ nó kết thúc
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def import_books(records, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Kiểm tra và ghi các bản ghi theo lô. Trả về báo cáo:
+    {"inserted": n, "failed": m, "errors": [{"row": i, "message": ...}, ...]}
+    (`row` đánh số từ 1 theo thứ tự trong input).
+    """
+    report = {"inserted": 0, "failed": 0, "errors": []}
+
+    def fail(row_number, message):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "message": message})
+
+    with queries.books_bulk_load():
+        db.release_write_db()
+        for batch in _prefetch(_validated_batches(records, batch_size, fail)):
+            report["inserted"] += queries.insert_books(batch)
+            db.release_write_db()
+    return report
+
+
+def import_file(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Nạp sách từ file .csv, .ndjson/.jsonl hoặc .json (array), chọn theo phần mở rộng."""
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            return import_books(iter_csv(f), batch_size)
+    with open(path, "rb") as f:
+        if path.lower().endswith(".json"):
+            return import_books(iter_json_array(f), batch_size)
+        return import_books(iter_ndjson(f), batch_size)
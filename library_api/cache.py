@@ -0,0 +1,403 @@
+# cache.py
+"""
+Bộ nhớ đệm cho các hàm đọc trong queries.py.
+
+- `LRUCache`: cache LRU trong tiến trình (cũng được etags.py dùng trực tiếp).
+- Backend cho lớp cache kết quả truy vấn:
+  * `MemoryBackend`: LRU trong tiến trình, nhanh nhất, mỗi worker một bản.
+  * `SQLiteBackend`: một file SQLite riêng mà mọi worker gunicorn trên cùng
+    máy cùng nhìn thấy (hủy cache ở worker này có hiệu lực ở mọi worker).
+  * None (CACHE_BACKEND = "null"): tắt cache.
+- Mỗi mục cache gắn các tag (vd. "book:3", "user:1:borrows"); các hàm ghi
+  trong queries.py gọi `invalidate(...)` với đúng các tag bị ảnh hưởng.
+
+Chống ghi đè dữ liệu cũ: trước khi đọc CSDL, decorator ghi nhận "epoch"
+(tăng mỗi lần hủy cache). Nếu trong lúc đọc có một lần hủy xảy ra, kết quả
+vừa đọc có thể đã cũ nên sẽ KHÔNG được đưa vào cache.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Cache LRU an toàn luồng, có thời hạn (TTL) tùy chọn cho mỗi mục.
+    - Khi đầy (`maxsize`), mục lâu nhất chưa được dùng sẽ bị loại
+      (`on_evict(key)` được gọi, `evictions` tăng).
+    - `ttl=None`: mục không bao giờ hết hạn (chỉ bị loại khi đầy hoặc bị xóa).
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+            self.evictions += len(evicted)
+        if self.on_evict:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryBackend:
+    """Backend LRU trong tiến trình, có chỉ mục tag -> các key."""
+
+    name = "memory"
+
+    def __init__(self, maxsize=10000, default_ttl=60.0):
+        self.default_ttl = default_ttl
+        self._entries = LRUCache(maxsize=maxsize, ttl=default_ttl, on_evict=self._forget)
+        self._tags = {}      # tag -> set(key)
+        self._key_tags = {}  # key -> tags
+        # RLock: on_evict (_forget) có thể được gọi khi đang giữ khóa trong set()
+        self._lock = threading.RLock()
+        self._epoch = 0
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "stale_skips": 0, "invalidations": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _forget(self, key):
+        with self._lock:
+            for tag in self._key_tags.pop(key, ()):
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    def epoch(self):
+        return self._epoch
+
+    def get(self, key):
+        value = self._entries.get(key, _MISSING)
+        self._count("misses" if value is _MISSING else "hits")
+        return value
+
+    def set(self, key, value, tags, ttl, epoch):
+        with self._lock:
+            if epoch != self._epoch:
+                self._stats["stale_skips"] += 1
+                return False
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._key_tags[key] = tuple(tags)
+            self._stats["sets"] += 1
+            self._entries.set(key, value, ttl=self.default_ttl if ttl is None else ttl)
+        return True
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._epoch += 1
+            self._stats["invalidations"] += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+        for key in keys:
+            self._entries.delete(key)
+            self._forget(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._tags.clear()
+            self._key_tags.clear()
+        self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(backend=self.name, entries=len(self._entries),
+                     maxsize=self._entries.maxsize, evictions=self._entries.evictions)
+        return stats
+
+
+class SQLiteBackend:
+    """
+    Backend dùng chung giữa các worker: một file SQLite riêng (không phải CSDL
+    thư viện). Khi vượt `maxsize`, các mục được ghi sớm nhất bị loại trước.
+    Bộ đếm hits/misses là của riêng tiến trình hiện tại.
+    """
+
+    name = "sqlite"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_cache_entries_created ON cache_entries (created_at);
+        CREATE TABLE IF NOT EXISTS cache_tags (
+            tag TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (tag, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_cache_tags_key ON cache_tags (key);
+        CREATE TRIGGER IF NOT EXISTS cache_entries_after_delete AFTER DELETE ON cache_entries BEGIN
+            DELETE FROM cache_tags WHERE key = old.key;
+        END;
+        CREATE TABLE IF NOT EXISTS cache_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO cache_meta (id, epoch) VALUES (1, 0);
+    """
+    # Kiểm tra kích thước sau mỗi chừng này lần ghi (COUNT(*) không miễn phí)
+    EVICT_EVERY = 100
+
+    def __init__(self, path, maxsize=100000, default_ttl=60.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sets_since_evict = 0
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "stale_skips": 0,
+                       "invalidations": 0, "evictions": 0}
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Dữ liệu cache mất cũng không sao: không cần fsync
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def epoch(self):
+        return self._conn().execute("SELECT epoch FROM cache_meta WHERE id = 1").fetchone()[0]
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self._count("misses")
+            return _MISSING
+        self._count("hits")
+        return row[0]
+
+    def set(self, key, value, tags, ttl, epoch):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT epoch FROM cache_meta WHERE id = 1").fetchone()[0] != epoch:
+                conn.execute("ROLLBACK")
+                self._count("stale_skips")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl if ttl is not None else None, now),
+            )
+            conn.executemany("INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+                             [(tag, key) for tag in tags])
+            evicted = self._maybe_evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("sets")
+        if evicted:
+            self._count("evictions", evicted)
+        return True
+
+    def _maybe_evict(self, conn):
+        with self._lock:
+            self._sets_since_evict += 1
+            if self._sets_since_evict < self.EVICT_EVERY:
+                return 0
+            self._sets_since_evict = 0
+        overflow = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.maxsize
+        if overflow <= 0:
+            return 0
+        return conn.execute(
+            "DELETE FROM cache_entries WHERE key IN "
+            "(SELECT key FROM cache_entries ORDER BY created_at LIMIT ?)", (overflow,)
+        ).rowcount
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE cache_meta SET epoch = epoch + 1 WHERE id = 1")
+            placeholders = ", ".join("?" for _ in tags)
+            removed = conn.execute(
+                f"DELETE FROM cache_entries WHERE key IN "
+                f"(SELECT key FROM cache_tags WHERE tag IN ({placeholders}))", tags
+            ).rowcount if tags else 0
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("invalidations")
+        return removed
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE cache_meta SET epoch = epoch + 1 WHERE id = 1")
+        conn.execute("DELETE FROM cache_entries")
+        conn.execute("COMMIT")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(backend=self.name, path=self.path, maxsize=self.maxsize,
+                     entries=self._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0])
+        return stats
+
+
+# Backend dùng chung của tiến trình. Mặc định: LRU trong bộ nhớ.
+_backend = MemoryBackend()
+
+
+def init_app(app):
+    """
+    Chọn backend theo app.config:
+    - CACHE_BACKEND: "memory" (mặc định) | "sqlite" | "null"
+    - CACHE_MAXSIZE, CACHE_DEFAULT_TTL (giây)
+    - CACHE_PATH: file cho backend sqlite (mặc định <instance>/cache.db)
+    """
+    global _backend
+    kind = app.config.get("CACHE_BACKEND", "memory")
+    ttl = app.config.get("CACHE_DEFAULT_TTL", 60.0)
+    if kind == "null":
+        _backend = None
+    elif kind == "sqlite":
+        path = app.config.get("CACHE_PATH") or os.path.join(app.instance_path, "cache.db")
+        _backend = SQLiteBackend(path, maxsize=app.config.get("CACHE_MAXSIZE", 100000), default_ttl=ttl)
+    elif kind == "memory":
+        _backend = MemoryBackend(maxsize=app.config.get("CACHE_MAXSIZE", 10000), default_ttl=ttl)
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {kind}")
+
+
+def get_backend():
+    return _backend
+
+
+def _make_key(fn, args, kwargs, version=None):
+    # Cùng một tiến trình có thể chạy nhiều app trỏ tới các CSDL khác nhau
+    import db
+    key = f"{db.get_database_path()}|{fn.__module__}.{fn.__qualname__}|{args!r}|{sorted(kwargs.items())!r}"
+    return key if version is None else f"{key}|v{version}"
+
+
+def cached(tags, ttl=None, version=None):
+    """
+    Decorator cho các hàm đọc trong queries.py.
+    `tags(result, *args, **kwargs)` trả về danh sách tag của kết quả; tag có
+    thể phụ thuộc cả kết quả (vd. mỗi cuốn sách trong danh sách).
+    `version()` (tùy chọn): phiên bản hiện tại của dữ liệu nguồn, đọc từ CSDL
+    và ghép vào khóa. Dùng cho các danh sách có ETag theo collection_versions:
+    route đọc phiên bản cho ETag TRƯỚC, nên kết quả trả về không bao giờ cũ
+    hơn ETag, kể cả khi tag chưa kịp bị hủy ở worker này (TTL, worker khác ghi).
+    Kết quả được lưu dạng pickle: mỗi lần trúng cache trả về một bản sao mới,
+    nên route có thể sửa dict (thêm `_links`...) mà không làm bẩn cache.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            backend = _backend
+            if backend is None:
+                return fn(*args, **kwargs)
+            key = _make_key(fn, args, kwargs, version() if version is not None else None)
+            payload = backend.get(key)
+            if payload is not _MISSING:
+                return pickle.loads(payload)
+
+            epoch = backend.epoch()
+            result = fn(*args, **kwargs)
+            backend.set(key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL),
+                        list(tags(result, *args, **kwargs)), ttl, epoch)
+            return result
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags):
+    """Hủy mọi mục cache mang một trong các tag (gọi sau khi commit)."""
+    if _backend is not None and tags:
+        _backend.invalidate(tags)
+
+
+@contextmanager
+def disabled():
+    """Tạm tắt cache trong tiến trình (vd. khi chạy thử truy vấn trên CSDL tạm)."""
+    global _backend
+    previous, _backend = _backend, None
+    try:
+        yield
+    finally:
+        _backend = previous
+
+
+def clear():
+    if _backend is not None:
+        _backend.clear()
+
+
+def stats():
+    """Số liệu hits/misses/evictions... của backend hiện tại."""
+    if _backend is None:
+        return {"backend": "null"}
+    stats = _backend.stats()
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    return stats
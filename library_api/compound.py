@@ -0,0 +1,100 @@
+# compound.py
+"""
+Tài liệu gộp (compound document) cho `?include=`: tài nguyên liên quan được
+nhúng vào `_embedded` của response, theo cùng quy ước `_links` như V4, nên
+một màn hình của client chỉ cần một request thay vì N+1 request.
+
+- GET /books/<id>?include=borrower,history
+    borrower: những người đang mượn (một đầu sách nhiều bản có thể có nhiều người)
+    history: HISTORY_LIMIT lượt mượn gần nhất
+- GET /users/<id>/borrowed-books?include=borrower,books,history
+    borrower: chính user đó; books: `items` là bản ghi sách đầy đủ kèm `_links`
+    thay vì bản tóm tắt; history: HISTORY_LIMIT lượt mượn gần nhất của user
+
+Mỗi phần được nhúng là MỘT truy vấn (xem queries.get_current_borrowers,
+get_book_history, get_user_history, get_books_by_ids), nên số truy vấn cố
+định dù có bao nhiêu dòng liên quan.
+"""
+from flask import jsonify, request, url_for
+
+import hateoas
+import queries
+
+HISTORY_LIMIT = 20
+BOOK_INCLUDES = ("borrower", "history")
+BORROWED_BOOKS_INCLUDES = ("borrower", "books", "history")
+
+
+def parse_include(allowed):
+    """Các phần cần nhúng từ `?include=`; trả về (tập hợp, None) hoặc (None, response lỗi 400)."""
+    raw = request.args.get("include", "")
+    include = {part.strip() for part in raw.split(",") if part.strip()}
+    if not include <= set(allowed):
+        return None, (jsonify({"message": f"include must be a comma-separated subset of: {', '.join(allowed)}"}), 400)
+    return include, None
+
+
+def _href(endpoint, mode, **values):
+    return url_for(endpoint, _external=mode == "full", **values)
+
+
+def _user(user, mode):
+    if mode != "none":
+        user["_links"] = {
+            "self": {"href": _href("get_user", mode, user_id=user["id"])},
+            "borrowed_books": {"href": _href("get_user_borrowed_books", mode, user_id=user["id"])},
+        }
+    return user
+
+
+def _borrow(record, mode):
+    if mode != "none":
+        record["_links"] = {
+            "book": {"href": _href("get_book", mode, book_id=record["book_id"])},
+            "user": {"href": _href("get_user", mode, user_id=record["user_id"])},
+        }
+    return record
+
+
+def embed_in_book(book, include, mode="full"):
+    """Thêm `_embedded` (borrower, history) vào dict của sách đã có `_links`."""
+    if not include:
+        return book
+    embedded = {}
+    if "borrower" in include:
+        embedded["borrower"] = [_user(user, mode) for user in queries.get_current_borrowers(book["id"])]
+    if "history" in include:
+        embedded["history"] = [_borrow(record, mode) for record in queries.get_book_history(book["id"], HISTORY_LIMIT)]
+    book["_embedded"] = embedded
+    return book
+
+
+def borrowed_books_document(user, borrowed, include, mode="full"):
+    """
+    Response của /users/<id>/borrowed-books?include=...: `items` (tóm tắt, hoặc
+    sách đầy đủ với include=books, luôn kèm `borrow_date`), `_links` và `_embedded`.
+    `user` là bản ghi đã đọc để kiểm tra tồn tại, nên nhúng borrower không tốn thêm truy vấn.
+    """
+    items = borrowed
+    if "books" in include and borrowed:
+        link = hateoas.get_linker(mode)
+        # Một user có thể mượn hai bản của cùng một đầu sách: đọc mỗi cuốn một lần
+        books = {book["id"]: link(book) for book in
+                 queries.get_books_by_ids(tuple(dict.fromkeys(book["id"] for book in borrowed)))}
+        items = [dict(books[book["id"]], borrow_date=book["borrow_date"])
+                 for book in borrowed if book["id"] in books]
+
+    document = {"items": items}
+    if mode != "none":
+        document["_links"] = {
+            "self": {"href": request.url if mode == "full" else request.full_path.rstrip("?")},
+            "borrower": {"href": _href("get_user", mode, user_id=user["id"])},
+        }
+    embedded = {}
+    if "borrower" in include:
+        embedded["borrower"] = _user(dict(user), mode)
+    if "history" in include:
+        embedded["history"] = [_borrow(record, mode) for record in queries.get_user_history(user["id"], HISTORY_LIMIT)]
+    if embedded:
+        document["_embedded"] = embedded
+    return document
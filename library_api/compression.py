@@ -0,0 +1,190 @@
+# compression.py
+"""
+Nén response (Content-Encoding) cho các app factory.
+- gzip luôn có (zlib); br nếu cài `brotli`, zstd nếu cài `zstandard`.
+  Thuật toán được chọn theo header Accept-Encoding (có xét q=), hòa thì
+  theo thứ tự ưu tiên COMPRESS_ALGORITHMS của server.
+- Response thường: chỉ nén khi body >= COMPRESS_MIN_SIZE byte (body nhỏ
+  nén xong còn lớn hơn, lại tốn CPU).
+- Response dạng luồng (generator, vd. /books/export): nén từng khối và
+  flush ngay, client vẫn nhận dữ liệu dần dần như khi không nén.
+- ETag mạnh được chuyển thành ETag yếu (W/"...") vì byte gửi đi đã khác;
+  etags.is_not_modified so sánh kiểu yếu nên 304 vẫn hoạt động.
+- appAsync (Quart) đăng ký bằng init_async_app: cùng cấu hình và thuật
+  toán, nhưng chỉ nén body đã có sẵn (appAsync không có response dạng luồng).
+"""
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard là tùy chọn
+    zstandard = None
+
+DEFAULT_ALGORITHMS = ("br", "zstd", "gzip")
+DEFAULT_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+DEFAULT_MIN_SIZE = 500
+DEFAULT_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "text/csv",
+    "text/html",
+    "text/plain",
+)
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _BrotliStream:
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+ENCODERS = {"gzip": _GzipStream}
+if brotli is not None:
+    ENCODERS["br"] = _BrotliStream
+if zstandard is not None:
+    ENCODERS["zstd"] = _ZstdStream
+
+
+def choose_encoding(algorithms, req=None):
+    """Thuật toán tốt nhất mà cả client (Accept-Encoding) và server cùng hỗ trợ, hoặc None."""
+    available = [name for name in algorithms if name in ENCODERS]
+    return (req or request).accept_encodings.best_match(available) if available else None
+
+
+def _compress_stream(chunks, encoder):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        # Đóng generator gốc (vd. stream_with_context) để teardown vẫn chạy
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _settings(app):
+    """Cấu hình nén: COMPRESS_ALGORITHMS, COMPRESS_LEVELS, COMPRESS_MIN_SIZE, COMPRESS_MIMETYPES."""
+    return (
+        app.config.get("COMPRESS_ALGORITHMS", DEFAULT_ALGORITHMS),
+        {**DEFAULT_LEVELS, **app.config.get("COMPRESS_LEVELS", {})},
+        app.config.get("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE),
+        set(app.config.get("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES)),
+    )
+
+
+def _skip(response, mimetypes):
+    return (response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in mimetypes
+            or "no-transform" in response.headers.get("Cache-Control", ""))
+
+
+def _mark_encoded(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def init_app(app):
+    """
+    Đăng ký nén response. Cấu hình qua app.config: COMPRESS_ALGORITHMS,
+    COMPRESS_LEVELS, COMPRESS_MIN_SIZE, COMPRESS_MIMETYPES.
+    """
+    algorithms, levels, min_size, mimetypes = _settings(app)
+
+    @app.after_request
+    def compress_response(response):
+        if response.direct_passthrough or _skip(response, mimetypes):
+            return response
+        # Dù có nén hay không, nội dung phụ thuộc Accept-Encoding
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(algorithms)
+        if encoding is None:
+            return response
+
+        encoder = ENCODERS[encoding](levels[encoding])
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoder)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(encoder.compress(data) + encoder.finish())
+
+        _mark_encoded(response, encoding)
+        return response
+
+
+def init_async_app(app):
+    """Như init_app nhưng cho app Quart (appAsync): hook after_request là coroutine."""
+    from quart import request as quart_request
+    from quart.wrappers.response import DataBody
+
+    algorithms, levels, min_size, mimetypes = _settings(app)
+
+    @app.after_request
+    async def compress_response(response):
+        if not isinstance(response.response, DataBody) or _skip(response, mimetypes):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(algorithms, quart_request)
+        if encoding is None:
+            return response
+        data = await response.get_data()
+        if len(data) < min_size:
+            return response
+        encoder = ENCODERS[encoding](levels[encoding])
+        response.set_data(encoder.compress(data) + encoder.finish())
+        _mark_encoded(response, encoding)
+        return response
@@ -1,27 +1,419 @@
 # db.py
 import sqlite3
 import os
-from flask import g
-from datetime import datetime
+import re
+import queue
+import threading
+import time
+import click
+from contextlib import contextmanager
+from urllib.parse import quote
+from flask import g, current_app, jsonify
+from datetime import datetime, timedelta
 
+import profiling
+
+# Giá trị mặc định khi app không đặt app.config['DATABASE'] (appV1, appWeek5).
 DATABASE = "library.db"
 
-def get_db():
+# PRAGMA áp dụng cho mỗi kết nối mới trong pool.
+# - WAL: người đọc không bị chặn bởi người ghi.
+# - synchronous=NORMAL: an toàn với WAL, giảm số lần fsync.
+# - mmap_size / cache_size: giữ page cache "nóng" giữa các request.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,  # số âm = KiB (~64MB)
+}
+
+# Đưa các dòng books (id > ?) vào chỉ mục full-text, cùng cách chuẩn hóa "đ"
+# với các trigger trong migrations/0002_books_fts.sql.
+FTS_INDEX_BOOKS_SQL = """
+    INSERT INTO books_fts (rowid, title, author)
+    SELECT id,
+           replace(replace(title, 'Đ', 'D'), 'đ', 'd'),
+           replace(replace(author, 'Đ', 'D'), 'đ', 'd')
+    FROM books
+    WHERE id > ?
+"""
+
+# Các trigger AFTER INSERT của books (định nghĩa gốc: migrations/0002_books_fts.sql
+# và migrations/0003_resource_versions.sql). queries.books_bulk_load bỏ chúng
+# trong suốt một lần nạp hàng loạt rồi tạo lại từ đây; rebuild-search-index
+# cũng tạo lại nếu lần nạp bị dừng giữa chừng (vd. tiến trình bị kill).
+BOOKS_INSERT_TRIGGERS = {
+    "books_fts_after_insert": """
+        CREATE TRIGGER IF NOT EXISTS books_fts_after_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author)
+            VALUES (new.id,
+                    replace(replace(new.title, 'Đ', 'D'), 'đ', 'd'),
+                    replace(replace(new.author, 'Đ', 'D'), 'đ', 'd'));
+        END
+    """,
+    "books_collection_after_insert": """
+        CREATE TRIGGER IF NOT EXISTS books_collection_after_insert AFTER INSERT ON books BEGIN
+            UPDATE collection_versions SET version = version + 1 WHERE name = 'books';
+        END
+    """,
+}
+
+# Tính lại các bảng thống kê (migrations/0006_borrow_stats.sql) từ lịch sử
+# mượn/trả (kể cả phần đã archive, xem borrow_history). Bình thường trigger
+# giữ chúng đồng bộ; dùng câu này khi nghi bị lệch.
+STATS_REBUILD_SQL = """
+    DELETE FROM stats_book_monthly;
+    DELETE FROM stats_user_open;
+    DELETE FROM stats_open_by_day;
+    INSERT INTO stats_book_monthly (month, book_id, borrow_count)
+    SELECT substr(borrow_date, 1, 7), book_id, COUNT(*) FROM borrow_history GROUP BY 1, 2;
+    INSERT INTO stats_user_open (user_id, open_count)
+    SELECT user_id, COUNT(*) FROM borrows WHERE return_date IS NULL GROUP BY user_id;
+    INSERT INTO stats_open_by_day (borrow_date, open_count)
+    SELECT borrow_date, COUNT(*) FROM borrows WHERE return_date IS NULL GROUP BY borrow_date;
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'stats';
+"""
+
+# Một lô của archive_borrows: chuyển tối đa `limit` lượt đã trả trước ngày
+# `cutoff` có borrow_id > `after` (duyệt theo khóa chính, không cần chỉ mục
+# trên return_date), rồi xóa đúng các dòng đó khỏi `borrows`.
+ARCHIVE_BATCH_SQL = """
+    INSERT INTO borrows_archive (borrow_id, book_id, user_id, borrow_date, return_date)
+    SELECT borrow_id, book_id, user_id, borrow_date, return_date FROM borrows
+    WHERE borrow_id > :after AND return_date < :cutoff
+    ORDER BY borrow_id LIMIT :limit
+    RETURNING borrow_id
+"""
+ARCHIVE_DELETE_SQL = """
+    DELETE FROM borrows
+    WHERE borrow_id > :after AND borrow_id <= :last AND return_date < :cutoff
+"""
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# Kết nối chỉ đọc (mode=ro) không được phép đổi journal_mode.
+READONLY_SKIPPED_PRAGMAS = {"journal_mode"}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Không lấy được kết nối nào từ pool trong thời gian cho phép."""
+
+
+class PoolSaturated(PoolTimeout):
+    """Đã có quá nhiều request đang chờ kết nối: từ chối ngay thay vì xếp hàng tới timeout."""
+
+
+class ConnectionPool:
+    """
+    Pool các kết nối SQLite sống lâu, dùng chung giữa các request/thread.
+    - Mở tối đa `size` kết nối, mỗi kết nối chỉ chạy PRAGMA một lần.
+    - Kết nối nhàn rỗi quá `health_check_interval` giây sẽ được kiểm tra
+      lại bằng `SELECT 1` trước khi trao cho request.
+    - `readonly=True`: mở bằng URI `file:...?mode=ro`, SQLite tự từ chối mọi
+      lệnh ghi trên các kết nối này.
+    - `factory`: lớp Connection (vd. profiling.InstrumentedConnection để đo
+      thời gian từng câu truy vấn).
+    - `max_waiters`: số request tối đa được xếp hàng chờ khi pool đã hết kết
+      nối; request thứ max_waiters+1 nhận PoolSaturated ngay (None = không giới hạn).
+    """
+
+    def __init__(self, database, size=5, timeout=10.0, pragmas=None,
+                 health_check_interval=30.0, readonly=False, max_waiters=None,
+                 factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.readonly = readonly
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        if readonly:
+            for name in READONLY_SKIPPED_PRAGMAS:
+                self.pragmas.pop(name, None)
+        self.health_check_interval = health_check_interval
+        self.max_waiters = max_waiters
+        self.factory = factory
+        # LIFO: ưu tiên kết nối vừa dùng xong (cache của nó còn "nóng").
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "acquired": 0,
+            "released": 0,
+            "discarded": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "health_checks": 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{quote(self.database)}?mode=ro", uri=True,
+                                   timeout=self.timeout, check_same_thread=False,
+                                   factory=self.factory)
+        else:
+            conn = sqlite3.connect(self.database, timeout=self.timeout,
+                                   check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self._count("created")
+        return conn
+
+    def _is_healthy(self, conn):
+        self._count("health_checks")
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Lấy một kết nối: ưu tiên kết nối nhàn rỗi, sau đó mở mới, cuối cùng mới chờ."""
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open_or_wait()
+                idle_since = time.monotonic()
+
+            if (time.monotonic() - idle_since >= self.health_check_interval
+                    and not self._is_healthy(conn)):
+                self.discard(conn)
+                continue
+
+            self._count("acquired")
+            return conn
+
+    def _open_or_wait(self):
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        with self._lock:
+            if self.max_waiters is not None and self._waiting >= self.max_waiters:
+                self._stats["rejected"] += 1
+                raise PoolSaturated(
+                    f"Too many requests waiting for a database connection "
+                    f"({self._waiting} waiting, pool size {self.size})"
+                )
+            self._waiting += 1
+            self._stats["waits"] += 1
+        try:
+            conn, _ = self._idle.get(timeout=self.timeout)
+            return conn
+        except queue.Empty:
+            self._count("timeouts")
+            raise PoolTimeout(
+                f"No database connection available after {self.timeout}s "
+                f"(pool size {self.size})"
+            )
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self, conn):
+        """Trả kết nối về pool; giao dịch dở dang (nếu có) sẽ bị rollback."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        if self._closed:
+            self.discard(conn)
+            return
+        self._idle.put_nowait((conn, time.monotonic()))
+        self._count("released")
+
+    def discard(self, conn):
+        """Đóng hẳn một kết nối (hỏng hoặc pool đã đóng) và giải phóng chỗ trong pool."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+
+    def close(self):
+        """Đóng tất cả kết nối nhàn rỗi; kết nối đang dùng sẽ bị đóng khi được trả về."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(
+                database=self.database,
+                readonly=self.readonly,
+                size=self.size,
+                open=self._open,
+                waiting=self._waiting,
+                idle=self._idle.qsize(),
+                in_use=self._open - self._idle.qsize(),
+            )
+        return stats
+
+
+_pool_init_lock = threading.Lock()
+
+# Ứng dụng và các kết nối được gắn vào luồng hiện tại bằng bind_app (dùng khi
+# gọi queries từ luồng không có Flask context, vd. thread pool của appAsync).
+_bound = threading.local()
+
+def _current_app():
+    app = getattr(_bound, "app", None)
+    return app if app is not None else current_app._get_current_object()
+
+@contextmanager
+def bind_app(app):
+    """
+    Cho phép gọi các hàm trong queries ở một luồng không có Flask context:
+    trong khối `with`, get_db() lấy kết nối từ pool của `app` và giữ trong
+    thread-local thay vì `g`; ra khỏi khối thì kết nối được trả về pool.
+    """
+    _bound.app, _bound.conns = app, {}
+    try:
+        yield
+    finally:
+        conns = _bound.conns
+        _bound.app, _bound.conns = None, None
+        if "db" in conns:
+            get_pool(app).release(conns["db"])
+        if "db_read" in conns:
+            get_pool(app, readonly=True).release(conns["db_read"])
+
+def index_new_books(conn):
+    """
+    Đánh chỉ mục full-text (một lệnh) cho các sách có id lớn hơn rowid lớn
+    nhất của books_fts. id của books chỉ tăng (AUTOINCREMENT) và sách luôn
+    được đánh chỉ mục theo thứ tự id, nên đó đúng là các sách chưa có trong
+    chỉ mục; khi trigger FTS đang chạy thì không còn sách nào như vậy.
+    Trả về số sách vừa được đánh chỉ mục.
+    """
+    last = conn.execute("SELECT rowid FROM books_fts ORDER BY rowid DESC LIMIT 1").fetchone()
+    return conn.execute(FTS_INDEX_BOOKS_SQL, (last[0] if last else 0,)).rowcount
+
+def get_database_path(app=None):
+    """Đường dẫn CSDL lấy từ app.config['DATABASE'], mặc định là DATABASE."""
+    app = app or _current_app()
+    return app.config.get("DATABASE") or DATABASE
+
+def get_pool(app=None, readonly=False):
     """
-    Tạo hoặc tái sử dụng kết nối CSDL trong cùng một request.
+    Pool kết nối của ứng dụng, tạo một lần khi cần lần đầu.
+    - Pool đọc (readonly=True): DB_POOL_SIZE kết nối `mode=ro`.
+    - Pool ghi: đúng MỘT kết nối, nên các request ghi được tuần tự hóa ngay
+      trong tiến trình thay vì tranh nhau khóa ghi của SQLite.
+    Cấu hình qua app.config: DATABASE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_PRAGMAS, DB_HEALTH_CHECK_INTERVAL, DB_READ_MAX_WAITERS (mặc định không
+    giới hạn), DB_WRITE_MAX_WAITERS (mặc định 16: khi writer đã bão hòa, request
+    ghi tiếp theo nhận 503 ngay thay vì chờ tới DB_POOL_TIMEOUT), PROFILING_ENABLED
+    (kết nối đo thời gian từng câu truy vấn, xem profiling.py).
     """
+    app = app or _current_app()
+    key = "db_pool_read" if readonly else "db_pool_write"
+    pool = app.extensions.get(key)
+    if pool is None:
+        with _pool_init_lock:
+            pool = app.extensions.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    get_database_path(app),
+                    size=app.config.get("DB_POOL_SIZE", 5) if readonly else 1,
+                    timeout=app.config.get("DB_POOL_TIMEOUT", 10.0),
+                    pragmas=app.config.get("DB_PRAGMAS"),
+                    health_check_interval=app.config.get("DB_HEALTH_CHECK_INTERVAL", 30.0),
+                    readonly=readonly,
+                    max_waiters=(app.config.get("DB_READ_MAX_WAITERS") if readonly
+                                 else app.config.get("DB_WRITE_MAX_WAITERS", 16)),
+                    factory=profiling.connection_factory(app),
+                )
+                app.extensions[key] = pool
+    return pool
+
+def pool_stats(app=None):
+    """Thống kê các pool (số kết nối mở/nhàn rỗi/đang dùng, số lần chờ, timeout...)."""
+    return {
+        "read": get_pool(app, readonly=True).stats(),
+        "write": get_pool(app).stats(),
+    }
+
+def get_db(readonly=False):
+    """
+    Lấy kết nối cho request hiện tại (tái sử dụng trong cùng request).
+    - readonly=True: kết nối chỉ đọc từ pool đọc. Nếu request đã giữ kết nối
+      ghi thì đọc luôn trên kết nối đó để thấy dữ liệu vừa ghi.
+    - Mặc định: kết nối ghi duy nhất của ứng dụng.
+    Trong khối bind_app, kết nối được giữ theo luồng thay vì theo request.
+    """
+    if getattr(_bound, "app", None) is not None:
+        return _get_bound_db(readonly)
+    if readonly:
+        if "db" in g:
+            return g.db
+        if "db_read" not in g:
+            g.db_read = get_pool(readonly=True).acquire()
+        return g.db_read
     if "db" not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().acquire()
     return g.db
 
+def _get_bound_db(readonly):
+    conns = _bound.conns
+    if readonly and "db" in conns:
+        return conns["db"]
+    key = "db_read" if readonly else "db"
+    if key not in conns:
+        conns[key] = get_pool(_bound.app, readonly=readonly).acquire()
+    return conns[key]
+
 def close_db(e=None):
     """
-    Đóng kết nối CSDL khi request kết thúc.
+    Trả các kết nối về pool khi request kết thúc (không đóng kết nối).
+    """
+    db = g.pop("db", None)
+    if db is not None:
+        get_pool().release(db)
+    db_read = g.pop("db_read", None)
+    if db_read is not None:
+        get_pool(readonly=True).release(db_read)
+
+def release_write_db():
+    """
+    Trả sớm kết nối ghi của request về pool (sau khi đã commit), để request
+    chạy lâu như POST /books:bulk không giữ kết nối ghi duy nhất giữa các lô.
+    Lần get_db() sau sẽ lấy lại từ pool. Trong khối bind_app thì không làm gì:
+    kết nối được giữ theo luồng đến hết khối.
     """
+    if getattr(_bound, "app", None) is not None:
+        return
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
 def init_db(app):
     """
@@ -34,6 +426,7 @@ def init_db(app):
         schema_path = os.path.join(os.path.dirname(__file__), "schema.sql")
         with open(schema_path, "r", encoding="utf8") as f:
             db.executescript(f.read())
+        apply_migrations(db)
 
         # 2. Thêm dữ liệu mẫu (Seeding)
         cursor = db.cursor()
@@ -46,15 +439,15 @@ def init_db(app):
             ('Trần Thị B', 'ttb@example.com', datetime.now().strftime("%Y-%m-%d"))
         )
 
-        # Thêm books
+        # Thêm books (mỗi đầu sách một bản; bản của "Dế Mèn" đang được mượn)
         cursor.execute("INSERT INTO books (title, author, year, status) VALUES (?, ?, ?, ?)",
             ('Lão Hạc', 'Nam Cao', 1943, 'available')
         )
         cursor.execute("INSERT INTO books (title, author, year, status) VALUES (?, ?, ?, ?)",
             ('Số Đỏ', 'Vũ Trọng Phụng', 1936, 'available')
         )
-        cursor.execute("INSERT INTO books (title, author, year, status) VALUES (?, ?, ?, ?)",
-            ('Dế Mèn Phiêu Lưu Ký', 'Tô Hoài', 1941, 'borrowed')
+        cursor.execute("INSERT INTO books (title, author, year, status, available_copies) VALUES (?, ?, ?, ?, ?)",
+            ('Dế Mèn Phiêu Lưu Ký', 'Tô Hoài', 1941, 'borrowed', 0)
         )
 
         # Thêm borrows
@@ -64,14 +457,180 @@ def init_db(app):
         
         db.commit()
 
+def list_migrations():
+    """Danh sách (version, tên file) trong migrations/, sắp theo version."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_.*\.sql$", filename)
+        if match:
+            migrations.append((int(match.group(1)), filename))
+    return sorted(migrations)
+
+def apply_migrations(db):
+    """
+    Áp dụng các migration chưa chạy, theo thứ tự version.
+    Phiên bản hiện tại được lưu trong `PRAGMA user_version`; mỗi migration
+    chạy trong một giao dịch riêng cùng với lệnh tăng user_version, nên
+    lỗi giữa chừng không để lại lược đồ "nửa vời".
+    Migration KHÔNG được xóa bảng/dữ liệu (khác với schema.sql).
+    """
+    current = db.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for version, filename in list_migrations():
+        if version <= current:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), "r", encoding="utf8") as f:
+            script = f.read()
+        try:
+            db.executescript(f"BEGIN IMMEDIATE;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        applied.append(filename)
+    return applied
+
+def migrate(app):
+    """Đưa CSDL của ứng dụng lên phiên bản lược đồ mới nhất."""
+    with app.app_context():
+        return apply_migrations(get_db())
+
+def rebuild_search_index(app):
+    """
+    Dựng lại toàn bộ chỉ mục full-text books_fts từ bảng books
+    (dùng khi chỉ mục bị lệch, ví dụ sau khi nạp dữ liệu bỏ qua trigger),
+    và tạo lại các trigger AFTER INSERT của books nếu một lần nạp hàng loạt
+    bị dừng giữa chừng trước khi kịp tạo lại chúng.
+    """
+    with app.app_context():
+        db = get_db()
+        with db:
+            db.execute("INSERT INTO books_fts (books_fts) VALUES ('delete-all')")
+            db.execute(FTS_INDEX_BOOKS_SQL, (0,))
+            for sql in BOOKS_INSERT_TRIGGERS.values():
+                db.execute(sql)
+            # Gộp các segment để truy vấn MATCH đọc ít trang nhất có thể
+            db.execute("INSERT INTO books_fts (books_fts) VALUES ('optimize')")
+        return db.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+def rebuild_stats(app):
+    """
+    Tính lại toàn bộ bảng thống kê từ lịch sử mượn/trả (borrow_history, gồm
+    cả borrows_archive) trong một giao dịch: các request đọc /stats/* trong
+    lúc đó vẫn thấy số liệu cũ, không thấy bảng rỗng. Cùng giao dịch tăng
+    phiên bản 'stats' (migration 0009), nên cache của mọi worker đang chạy
+    bỏ kết quả cũ ở lần đọc sau. Trả về số lượt mượn đã được tính.
+    """
+    with app.app_context():
+        db = get_db()
+        try:
+            db.executescript(f"BEGIN IMMEDIATE;\n{STATS_REBUILD_SQL}\nCOMMIT;")
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        return db.execute("SELECT COUNT(*) FROM borrow_history").fetchone()[0]
+
+def archive_borrows(app, older_than_days, batch_size=1000):
+    """
+    Chuyển các lượt mượn đã trả trước `older_than_days` ngày sang bảng
+    borrows_archive. Mỗi lô là một giao dịch ngắn riêng (BEGIN IMMEDIATE),
+    nên request mượn/trả chỉ phải chờ một lô chứ không chờ cả lần chạy;
+    dừng giữa chừng thì các lô đã xong vẫn giữ nguyên, chạy lại là làm tiếp.
+    Trả về số lượt đã chuyển.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d")
+    moved, after = 0, 0
+    with app.app_context():
+        db = get_db()
+        while True:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                params = {"after": after, "cutoff": cutoff, "limit": batch_size}
+                ids = [row[0] for row in db.execute(ARCHIVE_BATCH_SQL, params).fetchall()]
+                if ids:
+                    db.execute(ARCHIVE_DELETE_SQL, {**params, "last": max(ids)})
+                db.commit()
+            except sqlite3.Error:
+                db.rollback()
+                raise
+            if not ids:
+                return moved
+            moved += len(ids)
+            after = max(ids)
+
 def init_app(app):
     """
     Hàm đăng ký các chức năng quản lý DB với ứng dụng Flask.
     """
     app.teardown_appcontext(close_db)
-    
+
+    @app.errorhandler(PoolTimeout)
+    def database_busy(e):
+        """Hết kết nối (chờ quá lâu hoặc hàng đợi đã đầy): 503 để client thử lại sau."""
+        response = jsonify({"message": "Database is busy, please retry later"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(app.config.get("DB_BUSY_RETRY_AFTER", 1))
+        return response
+
     @app.cli.command('init-db')
     def init_db_command():
         """Xóa dữ liệu cũ, tạo bảng mới và thêm dữ liệu mẫu."""
         init_db(app)
-        print('Initialized the database with schema and sample data.')
\ No newline at end of file
+        print('Initialized the database with schema and sample data.')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Dựng lại chỉ mục full-text (FTS5) của sách."""
+        count = rebuild_search_index(app)
+        print(f'Rebuilt the full-text search index for {count} books.')
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Tính lại các bảng thống kê (/stats/*) từ lịch sử mượn/trả."""
+        count = rebuild_stats(app)
+        print(f'Rebuilt borrow statistics from {count} borrow records.')
+
+    @app.cli.command('archive-borrows')
+    @click.option('--older-than', 'older_than', default=365, show_default=True, type=click.IntRange(min=0),
+                  help='Chuyển các lượt mượn đã trả trước số ngày này.')
+    @click.option('--batch-size', default=1000, show_default=True, type=click.IntRange(min=1),
+                  help='Số dòng mỗi lô/giao dịch.')
+    def archive_borrows_command(older_than, batch_size):
+        """Chuyển các lượt mượn đã trả từ lâu sang bảng borrows_archive."""
+        started = time.perf_counter()
+        moved = archive_borrows(app, older_than, batch_size)
+        print(f'Archived {moved} borrow records returned more than {older_than} days ago '
+              f'in {time.perf_counter() - started:.2f}s.')
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Áp dụng các migration còn thiếu (không xóa dữ liệu)."""
+        applied = migrate(app)
+        for filename in applied:
+            print(f'Applied migration {filename}')
+        print('Database schema is up to date.')
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Chạy EXPLAIN QUERY PLAN cho các câu lệnh trong queries.py, báo lỗi nếu có full scan."""
+        import query_plans
+        if not query_plans.check_query_plans(app):
+            raise SystemExit(1)
+
+    @app.cli.command('import-books')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=10000, show_default=True,
+                  help='Số dòng mỗi lô executemany/giao dịch.')
+    def import_books_command(path, batch_size):
+        """Nạp sách hàng loạt từ file CSV (title,author,year), NDJSON hoặc JSON array."""
+        import bulk_import
+        started = time.perf_counter()
+        with app.app_context():
+            report = bulk_import.import_file(path, batch_size)
+        elapsed = time.perf_counter() - started
+        rate = report['inserted'] / elapsed if elapsed else 0
+        print(f"Inserted {report['inserted']} books in {elapsed:.2f}s ({rate:,.0f} rows/s), "
+              f"{report['failed']} rows rejected.")
+        for error in report['errors'][:20]:
+            print(f"  row {error['row']}: {error['message']}")
\ No newline at end of file
@@ -0,0 +1,79 @@
+# etags.py
+"""
+ETag dựa trên bộ đếm phiên bản (books.version, users.version,
+collection_versions) thay vì băm nội dung JSON.
+
+ETag đã biết của từng tài nguyên được giữ trong một LRU trong tiến trình, nên
+một GET có điều kiện (If-None-Match) khớp sẽ được trả 304 mà không cần chạm
+tới SQLite. Các hàm ghi trong queries.py gọi `invalidate` ngay sau khi commit.
+
+Lưu ý khi chạy nhiều worker: mỗi worker có LRU riêng, nên thay đổi ở worker
+khác chỉ được thấy sau tối đa `ETAG_CACHE_TTL` giây.
+
+Khóa của LRU kèm đường dẫn CSDL (như cache.py), vì cùng một tiến trình có
+thể chạy nhiều app trỏ tới các CSDL khác nhau. `app` mặc định là app hiện
+tại (Flask hoặc bind_app); appAsync truyền app Quart khi gọi trên event loop.
+"""
+import hashlib
+
+from flask import request
+
+from cache import LRUCache
+
+DEFAULT_MAXSIZE = 10000
+DEFAULT_TTL = 5.0
+
+_etags = LRUCache(maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL)
+
+
+def init_app(app):
+    """Đọc ETAG_CACHE_SIZE / ETAG_CACHE_TTL (giây, None = không hết hạn) từ app.config."""
+    _etags.maxsize = app.config.get("ETAG_CACHE_SIZE", DEFAULT_MAXSIZE)
+    _etags.ttl = app.config.get("ETAG_CACHE_TTL", DEFAULT_TTL)
+
+
+def book_etag(book):
+    return f'"book-{book["id"]}-v{book["version"]}"'
+
+
+def user_etag(user):
+    return f'"user-{user["id"]}-v{user["version"]}"'
+
+
+def collection_etag(name, version, req=None, fmt="json"):
+    """
+    ETag của một endpoint danh sách; phụ thuộc cả query string (lọc, phân trang...)
+    và định dạng response (`fmt`, xem negotiation.response_format).
+    `req` mặc định là request hiện tại của Flask (appAsync truyền request của Quart).
+    """
+    key = (req or request).query_string
+    if fmt != "json":
+        key += b"|" + fmt.encode()
+    variant = hashlib.sha1(key).hexdigest()[:12]
+    return f'"{name}-v{version}-{variant}"'
+
+
+def _key(kind, resource_id, app=None):
+    import db
+    return (db.get_database_path(app), kind, resource_id)
+
+
+def cached(kind, resource_id, app=None):
+    """ETag đã biết của tài nguyên (vd. "book", 3), hoặc None."""
+    return _etags.get(_key(kind, resource_id, app))
+
+
+def remember(kind, resource_id, etag, app=None):
+    _etags.set(_key(kind, resource_id, app), etag)
+
+
+def invalidate(kind, resource_id, app=None):
+    _etags.delete(_key(kind, resource_id, app))
+
+
+def is_not_modified(etag, req=None):
+    """
+    Client đã có đúng phiên bản này chưa (theo header If-None-Match). So sánh
+    kiểu yếu như RFC 9110 quy định, để ETag đã bị compression đổi thành W/"..." vẫn khớp.
+    """
+    return bool(etag) and (req or request).if_none_match.contains_weak(etag.strip('"'))
@@ -0,0 +1,65 @@
+# export.py
+"""
+Xuất dữ liệu dạng luồng (streaming) cho các endpoint /<resource>/export.
+Dữ liệu đi thẳng từ cursor (fetchmany) ra socket theo từng lô qua một
+generator, nên bộ nhớ không đổi dù bảng có hàng triệu dòng và client nhận
+được byte đầu tiên ngay sau lô đầu tiên.
+"""
+import csv
+import io
+import json
+
+from flask import Response, request, stream_with_context
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def ndjson_chunks(batches):
+    """Mỗi lô dòng thành một khối NDJSON (mỗi dòng một object JSON)."""
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(row), ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows
+        )
+
+
+def csv_chunks(batches):
+    """Dòng tiêu đề (lấy từ tên cột của lô đầu), rồi mỗi lô dòng thành một khối CSV."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for rows in batches:
+        if not header_written:
+            writer.writerow(rows[0].keys())
+            header_written = True
+        writer.writerows(tuple(row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def choose_format():
+    """Định dạng từ `?format=`, nếu không có thì theo header Accept (mặc định NDJSON)."""
+    fmt = request.args.get("format")
+    if fmt:
+        return fmt if fmt in FORMATS else None
+    best = request.accept_mimetypes.best_match(
+        [FORMATS["ndjson"], FORMATS["csv"]], default=FORMATS["ndjson"]
+    )
+    return "csv" if best == FORMATS["csv"] else "ndjson"
+
+
+def export_response(batches, fmt, filename):
+    """Response dạng chunked cho `batches` (generator các lô dòng) theo định dạng `fmt`."""
+    if fmt == "csv":
+        chunks = csv_chunks(batches)
+    else:
+        chunks = ndjson_chunks(batches)
+    # stream_with_context giữ request context (và kết nối trong g) sống tới
+    # khi generator chạy xong; kết nối được trả về pool ở teardown như thường.
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,58 @@
+# fieldsets.py
+"""
+Đọc tham số của các request lấy nhiều bản ghi theo id:
+- `?ids=1,2,3`: tối đa MAX_IDS id, trùng lặp bị bỏ (giữ thứ tự đầu tiên).
+- `?fields=title,author`: sparse fieldset, chỉ SELECT các cột này (luôn kèm
+  `id`). Với sách, `_links` cũng là một "trường": không liệt kê thì bỏ
+  `_links`, đỡ cả công dựng link lẫn kích thước response.
+Mỗi hàm trả về (giá trị, None) hoặc (None, response lỗi 400), giống các
+helper đọc tham số trong appV5.
+"""
+from flask import jsonify, request
+
+MAX_IDS = 100
+LINKS_FIELD = "_links"
+
+
+def parse_ids():
+    """Danh sách id từ `?ids=`; (None, None) nếu request không có tham số này."""
+    raw = request.args.get("ids")
+    if raw is None:
+        return None, None
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        return None, (jsonify({"message": "ids must be a comma-separated list of integers"}), 400)
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return None, (jsonify({"message": "ids must not be empty"}), 400)
+    if len(ids) > MAX_IDS:
+        return None, (jsonify({"message": f"At most {MAX_IDS} ids per request"}), 400)
+    return ids, None
+
+
+def parse_fields(columns, extra=()):
+    """
+    Các trường từ `?fields=`, kiểm tra theo `columns` (+ `extra`, vd. "_links").
+    Trả về (None, None) nếu không có tham số: lấy mọi cột như trước.
+    """
+    raw = request.args.get("fields")
+    if raw is None:
+        return None, None
+    fields = list(dict.fromkeys(part.strip() for part in raw.split(",") if part.strip()))
+    unknown = [field for field in fields if field not in columns and field not in extra]
+    if unknown or not fields:
+        allowed = ", ".join(tuple(columns) + tuple(extra))
+        return None, (jsonify({"message": f"fields must be a comma-separated subset of: {allowed}"}), 400)
+    return fields, None
+
+
+def select_columns(fields, needed=()):
+    """Các cột cần SELECT cho `fields` (bỏ trường ảo như `_links`), cộng `needed` (vd. để dựng link)."""
+    return tuple(dict.fromkeys(("id",) + tuple(f for f in fields if f != LINKS_FIELD) + tuple(needed)))
+
+
+def project(record, fields):
+    """Chỉ giữ `id` và các trường được yêu cầu (bỏ các cột chỉ đọc thêm để dựng link)."""
+    keep = set(fields) | {"id"}
+    return {key: value for key, value in record.items() if key in keep}
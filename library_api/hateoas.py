@@ -0,0 +1,83 @@
+# hateoas.py
+"""
+Liên kết HATEOAS cho sách, dựng từ template thay vì gọi url_for cho từng cuốn.
+
+URL của mỗi endpoint chỉ được dựng một lần (với một id giả) rồi tách thành
+tiền tố/hậu tố; link của một cuốn sách chỉ còn là phép nối chuỗi. Bộ
+template được nhớ theo app, theo kiểu link và theo gốc URL của request
+(host + script root), nên một danh sách 10k sách không gọi url_for lần nào.
+
+Tham số `?links=`:
+- full (mặc định): URL tuyệt đối, như V4
+- relative: chỉ đường dẫn (/books/1), response gọn hơn
+- none: bỏ `_links` của từng cuốn
+
+Mặc định dùng request/app/url_for của Flask; appAsync truyền các đối tượng
+tương ứng của Quart (`req`, `app`, `build_url`).
+"""
+from flask import current_app, request, url_for
+
+from cache import LRUCache
+
+LINK_MODES = ("full", "relative", "none")
+# Id giả đánh dấu vị trí của id trong URL đã dựng
+_PLACEHOLDER_ID = 2147483647
+# Gốc URL lấy từ header Host do client gửi: giới hạn số bộ template được nhớ
+_MAX_LINKERS = 64
+
+
+def links_mode(req=None):
+    """Kiểu link yêu cầu qua `?links=`; None nếu giá trị không hợp lệ."""
+    mode = (req or request).args.get("links", "full")
+    return mode if mode in LINK_MODES else None
+
+
+def _template(build_url, endpoint, external):
+    url = build_url(endpoint, book_id=_PLACEHOLDER_ID, _external=external)
+    prefix, _, suffix = url.partition(str(_PLACEHOLDER_ID))
+    return prefix, suffix
+
+
+class BookLinker:
+    """Thêm `_links` vào dict của sách từ các template đã dựng sẵn."""
+
+    def __init__(self, mode, build_url=url_for):
+        self.mode = mode
+        if mode == "none":
+            return
+        external = mode == "full"
+        self.self_href = _template(build_url, "get_book", external)
+        self.borrow_href = _template(build_url, "borrow_book_route", external)
+        self.return_href = _template(build_url, "return_book_route", external)
+        self.collection_href = build_url("get_books", _external=external)
+
+    def __call__(self, book):
+        if self.mode == "none":
+            return book
+        book_id = str(book["id"])
+        book["_links"] = {
+            "self": {"href": book_id.join(self.self_href)},
+            "collection": {"href": self.collection_href},
+        }
+        # Chỉ thêm link hành động nếu phù hợp: còn bản trên kệ thì mượn được,
+        # có bản đang được mượn thì trả được (một đầu sách có thể có cả hai)
+        if book["available_copies"] > 0:
+            book["_links"]["borrow"] = {"href": book_id.join(self.borrow_href), "method": "POST"}
+        if book["available_copies"] < book["total_copies"]:
+            book["_links"]["return"] = {"href": book_id.join(self.return_href), "method": "POST"}
+        return book
+
+
+def get_linker(mode="full", req=None, app=None, build_url=url_for):
+    """BookLinker cho request hiện tại, dựng một lần rồi dùng lại giữa các request."""
+    req = req or request
+    app = app or current_app
+    linkers = app.extensions.get("hateoas_linkers")
+    if linkers is None:
+        linkers = app.extensions["hateoas_linkers"] = LRUCache(maxsize=_MAX_LINKERS)
+    key = (mode, req.host_url, req.script_root) if mode == "full" else (mode, req.script_root)
+    linker = linkers.get(key)
+    if linker is None:
+        linker = BookLinker(mode, build_url)
+        linkers.set(key, linker)
+    return linker
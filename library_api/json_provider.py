@@ -0,0 +1,67 @@
+# json_provider.py
+"""
+Đường serialize JSON nhanh cho các response danh sách lớn.
+- FastJSONProvider: dùng orjson nếu đã cài (serialize thẳng ra bytes, không
+  qua bước str -> encode của Response); nếu không có orjson thì hành vi y
+  hệt DefaultJSONProvider của Flask.
+- raw_json_response: trả nguyên văn chuỗi JSON mà SQLite đã dựng sẵn bằng
+  json_group_array/json_object, không tạo sqlite3.Row hay dict nào ở Python.
+Thời gian serialize được tính vào mục `serialize` của Server-Timing (profiling.py).
+"""
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+import profiling
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Giữ nguyên quy ước của Flask (sắp xếp khóa, gọn khi không debug, cách
+    biểu diễn ngày giờ/dataclass qua `default`), chỉ thay phần serialize.
+    """
+
+    def _orjson_option(self):
+        # Ngày giờ/dataclass đi qua `default` của Flask để output không đổi
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        with profiling.span("serialize"):
+            # Tham số riêng của json.dumps (ensure_ascii, cls...) thì để json chuẩn xử lý
+            if orjson is None or kwargs:
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=self.default, option=self._orjson_option()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        with profiling.span("serialize"):
+            body = orjson.dumps(obj, default=self.default,
+                                option=self._orjson_option() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Dùng FastJSONProvider cho jsonify / request.get_json của `app`."""
+    app.json = FastJSONProvider(app)
+
+
+def raw_json_response(payload, status=200):
+    """Response từ một chuỗi JSON đã serialize sẵn (vd. queries.get_all_books_json())."""
+    return current_app.response_class(payload + "\n", status=status,
+                                      mimetype=current_app.json.mimetype)
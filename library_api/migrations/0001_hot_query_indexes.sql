@@ -0,0 +1,18 @@
+-- 0001: Chỉ mục cho các truy vấn "nóng" trong queries.py
+
+-- return_book: WHERE book_id = ? AND return_date IS NULL
+-- Chỉ mục một phần (partial): chỉ chứa các lượt mượn đang mở, nên nhỏ và
+-- không phình ra theo lịch sử mượn/trả.
+CREATE INDEX IF NOT EXISTS idx_borrows_open_by_book
+    ON borrows (book_id) WHERE return_date IS NULL;
+
+-- get_borrowed_books_by_user: WHERE user_id = ? AND return_date IS NULL
+CREATE INDEX IF NOT EXISTS idx_borrows_open_by_user
+    ON borrows (user_id) WHERE return_date IS NULL;
+
+-- search_and_filter_books / search_books_keyset: lọc theo author, year và
+-- sắp xếp keyset theo (title|author|year, id). rowid (id) luôn nằm cuối
+-- khóa của chỉ mục nên không cần khai báo thêm.
+CREATE INDEX IF NOT EXISTS idx_books_author ON books (author);
+CREATE INDEX IF NOT EXISTS idx_books_year ON books (year);
+CREATE INDEX IF NOT EXISTS idx_books_title ON books (title);
@@ -0,0 +1,47 @@
+-- 0002: Chỉ mục full-text (FTS5) cho tiêu đề và tác giả sách.
+-- - Contentless (content=''): chỉ lưu chỉ mục, không nhân đôi dữ liệu của books.
+-- - remove_diacritics 2: "de men" khớp "Dế Mèn". Riêng "đ/Đ" không phải dấu
+--   (không tách được bằng Unicode) nên được đổi thành "d/D" trước khi đánh chỉ mục.
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title,
+    author,
+    content = '',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- Các trigger giữ books_fts đồng bộ với books
+DROP TRIGGER IF EXISTS books_fts_after_insert;
+CREATE TRIGGER books_fts_after_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts (rowid, title, author)
+    VALUES (new.id,
+            replace(replace(new.title, 'Đ', 'D'), 'đ', 'd'),
+            replace(replace(new.author, 'Đ', 'D'), 'đ', 'd'));
+END;
+
+DROP TRIGGER IF EXISTS books_fts_after_delete;
+CREATE TRIGGER books_fts_after_delete AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts (books_fts, rowid, title, author)
+    VALUES ('delete', old.id,
+            replace(replace(old.title, 'Đ', 'D'), 'đ', 'd'),
+            replace(replace(old.author, 'Đ', 'D'), 'đ', 'd'));
+END;
+
+DROP TRIGGER IF EXISTS books_fts_after_update;
+CREATE TRIGGER books_fts_after_update AFTER UPDATE OF title, author ON books BEGIN
+    INSERT INTO books_fts (books_fts, rowid, title, author)
+    VALUES ('delete', old.id,
+            replace(replace(old.title, 'Đ', 'D'), 'đ', 'd'),
+            replace(replace(old.author, 'Đ', 'D'), 'đ', 'd'));
+    INSERT INTO books_fts (rowid, title, author)
+    VALUES (new.id,
+            replace(replace(new.title, 'Đ', 'D'), 'đ', 'd'),
+            replace(replace(new.author, 'Đ', 'D'), 'đ', 'd'));
+END;
+
+-- Đánh chỉ mục các sách đã có (xóa trước để chạy lại không tạo bản trùng)
+INSERT INTO books_fts (books_fts) VALUES ('delete-all');
+INSERT INTO books_fts (rowid, title, author)
+SELECT id,
+       replace(replace(title, 'Đ', 'D'), 'đ', 'd'),
+       replace(replace(author, 'Đ', 'D'), 'đ', 'd')
+FROM books;
@@ -0,0 +1,33 @@
+-- 0003: Bộ đếm phiên bản cho ETag.
+-- - books.version / users.version: tăng mỗi lần bản ghi thay đổi (queries.py
+--   tự tăng trong cùng câu UPDATE), ETag của /books/<id> suy ra từ đây.
+-- - collection_versions: tăng (bằng trigger) mỗi khi bảng có bất kỳ thay đổi
+--   nào, làm ETag cho các endpoint danh sách mà không phải đọc cả bảng.
+ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO collection_versions (name, version) VALUES ('books', 0), ('users', 0);
+
+CREATE TRIGGER IF NOT EXISTS books_collection_after_insert AFTER INSERT ON books BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'books';
+END;
+CREATE TRIGGER IF NOT EXISTS books_collection_after_update AFTER UPDATE ON books BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'books';
+END;
+CREATE TRIGGER IF NOT EXISTS books_collection_after_delete AFTER DELETE ON books BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'books';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_collection_after_insert AFTER INSERT ON users BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'users';
+END;
+CREATE TRIGGER IF NOT EXISTS users_collection_after_update AFTER UPDATE ON users BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'users';
+END;
+CREATE TRIGGER IF NOT EXISTS users_collection_after_delete AFTER DELETE ON users BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'users';
+END;
@@ -0,0 +1,21 @@
+-- 0004: Token xác thực lưu trong CSDL thay cho dict USER_TOKENS trong code.
+-- - Chỉ lưu SHA-256 của token (token là chuỗi ngẫu nhiên đủ dài nên không
+--   cần hàm băm chậm); token gốc chỉ hiện ra một lần lúc cấp.
+-- - scopes: các quyền cách nhau bởi dấu cách; expires_at/revoked_at theo
+--   giờ UTC 'YYYY-MM-DD HH:MM:SS', NULL = không hết hạn / chưa thu hồi.
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_hash TEXT NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    scopes TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    expires_at TEXT,
+    revoked_at TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS idx_tokens_user ON tokens (user_id);
+
+-- Hai token demo trước đây nằm trong USER_TOKENS (token_alice_123 -> 1, token_bob_456 -> 2)
+INSERT OR IGNORE INTO tokens (token_hash, user_id, scopes, created_at) VALUES
+    ('d3671e30c17961033c1b753879835a8e739c8e8ad09704018b7c392db617b07d', 1, 'library', datetime('now')),
+    ('c48818aa7e8c2ed15573cad0d590cffae2fa7dd6cbd20ecad3984be29c65712f', 2, 'library', datetime('now'));
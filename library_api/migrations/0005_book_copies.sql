@@ -0,0 +1,16 @@
+-- 0005: Một đầu sách có nhiều bản (copies).
+-- - total_copies: số bản thư viện sở hữu; available_copies: số bản còn trên kệ.
+--   Mượn/trả tăng/giảm available_copies trong cùng câu UPDATE có điều kiện
+--   (xem queries._borrow_one / _return_one), CHECK chặn mọi trạng thái sai.
+-- - status được giữ lại để tương thích: 'available' khi còn ít nhất một bản.
+ALTER TABLE books ADD COLUMN total_copies INTEGER NOT NULL DEFAULT 1
+    CHECK (total_copies >= 0);
+ALTER TABLE books ADD COLUMN available_copies INTEGER NOT NULL DEFAULT 1
+    CHECK (available_copies BETWEEN 0 AND total_copies);
+
+UPDATE books SET available_copies = 0 WHERE status = 'borrowed';
+
+-- /books?available=true: WHERE available_copies > 0, duyệt theo id.
+-- Chỉ mục một phần chỉ chứa các đầu sách còn bản để mượn.
+CREATE INDEX IF NOT EXISTS idx_books_available
+    ON books (id) WHERE available_copies > 0;
@@ -0,0 +1,81 @@
+-- 0006: Bảng thống kê tổng hợp cho dashboard (/stats/*).
+-- Trigger trên `borrows` cập nhật từng bảng ngay trong giao dịch mượn/trả,
+-- nên mỗi câu hỏi của dashboard chỉ đọc vài dòng thay vì GROUP BY cả lịch sử.
+-- `flask rebuild-stats` tính lại toàn bộ từ `borrows` (db.rebuild_stats).
+-- - stats_book_monthly: số lượt mượn mỗi cuốn theo tháng ('YYYY-MM' của
+--   borrow_date). Không giảm khi xóa lượt mượn: đây là số liệu lịch sử.
+-- - stats_user_open: số sách đang mượn của từng user.
+-- - stats_open_by_day: số lượt mượn đang mở theo ngày mượn; số quá hạn là
+--   tổng các ngày trước mốc hạn trả. Ngày không còn lượt mở bị xóa, nên bảng
+--   chỉ dài bằng số ngày có sách chưa trả.
+CREATE TABLE IF NOT EXISTS stats_book_monthly (
+    month TEXT NOT NULL,
+    book_id INTEGER NOT NULL,
+    borrow_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, book_id)
+) WITHOUT ROWID;
+-- Top sách của một tháng: WHERE month = ? ORDER BY borrow_count DESC, book_id
+CREATE INDEX IF NOT EXISTS idx_stats_book_monthly_top
+    ON stats_book_monthly (month, borrow_count DESC);
+
+CREATE TABLE IF NOT EXISTS stats_user_open (
+    user_id INTEGER PRIMARY KEY,
+    open_count INTEGER NOT NULL DEFAULT 0 CHECK (open_count >= 0)
+);
+-- Người đang mượn nhiều nhất; bỏ qua user đã trả hết
+CREATE INDEX IF NOT EXISTS idx_stats_user_open_top
+    ON stats_user_open (open_count DESC) WHERE open_count > 0;
+
+CREATE TABLE IF NOT EXISTS stats_open_by_day (
+    borrow_date TEXT PRIMARY KEY,
+    open_count INTEGER NOT NULL DEFAULT 0 CHECK (open_count >= 0)
+) WITHOUT ROWID;
+
+INSERT INTO stats_book_monthly (month, book_id, borrow_count)
+SELECT substr(borrow_date, 1, 7), book_id, COUNT(*) FROM borrows GROUP BY 1, 2;
+INSERT INTO stats_user_open (user_id, open_count)
+SELECT user_id, COUNT(*) FROM borrows WHERE return_date IS NULL GROUP BY user_id;
+INSERT INTO stats_open_by_day (borrow_date, open_count)
+SELECT borrow_date, COUNT(*) FROM borrows WHERE return_date IS NULL GROUP BY borrow_date;
+
+CREATE TRIGGER IF NOT EXISTS borrows_stats_after_insert AFTER INSERT ON borrows BEGIN
+    INSERT INTO stats_book_monthly (month, book_id, borrow_count)
+    VALUES (substr(new.borrow_date, 1, 7), new.book_id, 1)
+    ON CONFLICT (month, book_id) DO UPDATE SET borrow_count = borrow_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS borrows_stats_after_insert_open AFTER INSERT ON borrows
+WHEN new.return_date IS NULL
+BEGIN
+    INSERT INTO stats_user_open (user_id, open_count) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET open_count = open_count + 1;
+    INSERT INTO stats_open_by_day (borrow_date, open_count) VALUES (new.borrow_date, 1)
+    ON CONFLICT (borrow_date) DO UPDATE SET open_count = open_count + 1;
+END;
+
+-- Trả sách: return_date từ NULL sang có giá trị
+CREATE TRIGGER IF NOT EXISTS borrows_stats_after_return AFTER UPDATE OF return_date ON borrows
+WHEN old.return_date IS NULL AND new.return_date IS NOT NULL
+BEGIN
+    UPDATE stats_user_open SET open_count = open_count - 1 WHERE user_id = old.user_id;
+    UPDATE stats_open_by_day SET open_count = open_count - 1 WHERE borrow_date = old.borrow_date;
+    DELETE FROM stats_open_by_day WHERE borrow_date = old.borrow_date AND open_count = 0;
+END;
+
+-- Sửa tay một lượt đã trả thành chưa trả
+CREATE TRIGGER IF NOT EXISTS borrows_stats_after_reopen AFTER UPDATE OF return_date ON borrows
+WHEN old.return_date IS NOT NULL AND new.return_date IS NULL
+BEGIN
+    INSERT INTO stats_user_open (user_id, open_count) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET open_count = open_count + 1;
+    INSERT INTO stats_open_by_day (borrow_date, open_count) VALUES (new.borrow_date, 1)
+    ON CONFLICT (borrow_date) DO UPDATE SET open_count = open_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS borrows_stats_after_delete_open AFTER DELETE ON borrows
+WHEN old.return_date IS NULL
+BEGIN
+    UPDATE stats_user_open SET open_count = open_count - 1 WHERE user_id = old.user_id;
+    UPDATE stats_open_by_day SET open_count = open_count - 1 WHERE borrow_date = old.borrow_date;
+    DELETE FROM stats_open_by_day WHERE borrow_date = old.borrow_date AND open_count = 0;
+END;
@@ -0,0 +1,25 @@
+-- 0007: Lưu trữ (archive) các lượt mượn đã trả từ lâu.
+-- `flask archive-borrows --older-than N` (db.archive_borrows) chuyển các lượt
+-- mượn đã trả trước N ngày từ `borrows` sang `borrows_archive` theo từng lô,
+-- nên bảng `borrows` mà mượn/trả đọc-ghi chỉ còn lượt đang mở và lịch sử gần.
+-- - borrow_id được giữ nguyên: `borrows` dùng AUTOINCREMENT nên id đã chuyển
+--   đi không bao giờ bị cấp lại, hai bảng không trùng khóa.
+-- - borrow_history: view gộp cả hai bảng cho các chỗ đọc lịch sử (export,
+--   rebuild-stats). ORDER BY borrow_id trên view được SQLite trộn (MERGE)
+--   từ hai lần duyệt theo khóa chính, không cần sắp xếp tạm.
+-- - Các trigger thống kê (0006) chỉ đổi bộ đếm khi xóa lượt đang mở, nên
+--   chuyển lượt đã trả sang archive không làm đổi số liệu.
+CREATE TABLE IF NOT EXISTS borrows_archive (
+    borrow_id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    borrow_date TEXT NOT NULL,
+    return_date TEXT NOT NULL,
+    FOREIGN KEY (book_id) REFERENCES books (id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+CREATE VIEW IF NOT EXISTS borrow_history AS
+    SELECT borrow_id, book_id, user_id, borrow_date, return_date FROM borrows_archive
+    UNION ALL
+    SELECT borrow_id, book_id, user_id, borrow_date, return_date FROM borrows;
@@ -0,0 +1,11 @@
+-- 0008: Chỉ mục cho lịch sử mượn/trả của một cuốn sách hoặc một user
+-- (?include=history, queries.get_book_history / get_user_history).
+-- WHERE book_id = ? ORDER BY borrow_id DESC LIMIT ? trên view borrow_history:
+-- mỗi bảng được tra theo chỉ mục (borrow_id là rowid nên đã nằm cuối khóa,
+-- không cần sắp xếp) rồi SQLite trộn hai nhánh, dừng sau LIMIT dòng.
+-- Các chỉ mục một phần của 0001 vẫn được giữ: chúng nhỏ hơn nhiều cho các
+-- truy vấn chỉ đọc lượt mượn đang mở.
+CREATE INDEX IF NOT EXISTS idx_borrows_book ON borrows (book_id);
+CREATE INDEX IF NOT EXISTS idx_borrows_user ON borrows (user_id);
+CREATE INDEX IF NOT EXISTS idx_borrows_archive_book ON borrows_archive (book_id);
+CREATE INDEX IF NOT EXISTS idx_borrows_archive_user ON borrows_archive (user_id);
@@ -0,0 +1,7 @@
+-- 0009: Phiên bản của các bảng thống kê (/stats/*).
+-- `flask rebuild-stats` chạy trong tiến trình riêng, nên cache.invalidate
+-- của nó không tới được cache trong bộ nhớ của các worker đang phục vụ.
+-- db.rebuild_stats tăng dòng 'stats' trong cùng giao dịch tính lại; các hàm
+-- đọc thống kê của queries.py ghép phiên bản này vào khóa cache (như danh
+-- sách books/users), nên server thấy số liệu mới ngay, không cần khởi động lại.
+INSERT OR IGNORE INTO collection_versions (name, version) VALUES ('stats', 0);
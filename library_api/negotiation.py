@@ -0,0 +1,59 @@
+# negotiation.py
+"""
+Chọn định dạng response cho các endpoint danh sách theo header Accept:
+JSON (mặc định) hoặc MessagePack (nhị phân, gọn hơn JSON) nếu client yêu
+cầu và thư viện `msgpack` đã được cài.
+"""
+from flask import after_this_request, current_app, jsonify, request
+
+import profiling
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tùy chọn
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+# Các tên khác của MessagePack mà client hay gửi
+MSGPACK_ALIASES = (MSGPACK_MIMETYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def best_format(req):
+    """
+    'msgpack' nếu client của `req` ưu tiên MessagePack, ngược lại 'json' (kể
+    cả với */*). Không đụng tới response: appAsync tự thêm `Vary: Accept`.
+    """
+    if msgpack is None:
+        return "json"
+    best = req.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_ALIASES, default=JSON_MIMETYPE)
+    return "msgpack" if best in MSGPACK_ALIASES else "json"
+
+
+def response_format():
+    """Định dạng cho request Flask hiện tại (best_format), và thêm `Vary: Accept` vào response."""
+    @after_this_request
+    def add_vary(response):
+        response.vary.add("Accept")
+        return response
+
+    return best_format(request)
+
+
+def pack(data):
+    """Mã hóa `data` thành MessagePack."""
+    with profiling.span("serialize"):
+        return msgpack.packb(data, use_bin_type=True)
+
+
+def msgpack_response(data, status=200):
+    return current_app.response_class(pack(data), status=status, mimetype=MSGPACK_MIMETYPE)
+
+
+def collection_response(data, fmt=None, status=200):
+    """Response của một danh sách theo định dạng `fmt` (mặc định: theo Accept)."""
+    if (fmt or response_format()) == "msgpack":
+        return msgpack_response(data, status)
+    response = jsonify(data)
+    response.status_code = status
+    return response
@@ -0,0 +1,372 @@
+# profiling.py
+"""
+Đo thời gian theo request và theo câu truy vấn (bật bằng PROFILING_ENABLED,
+hoặc biến môi trường LIBRARY_PROFILING=1).
+
+- Kết nối SQLite của pool được tạo bằng `InstrumentedConnection`: mỗi lần
+  `execute` ghi lại câu SQL, thời gian (tính cả các lần fetch) và số dòng trả về.
+- Mỗi response có header `Server-Timing` (db, serialize, total), xem được
+  ngay trong tab Network của trình duyệt.
+- Request chậm hơn PROFILING_SLOW_THRESHOLD giây được lưu (kèm danh sách
+  câu truy vấn) vào một ring buffer, xem ở GET /debug/slow.
+- GET /metrics: histogram định dạng Prometheus theo route và theo câu truy vấn.
+  Số liệu là của riêng từng worker; Prometheus gộp lại khi scrape.
+
+Với response dạng luồng (vd. /books/export), thời gian đọc CSDL sau khi gửi
+header không nằm trong Server-Timing.
+
+Ở chế độ debug/testing còn có bộ canh ngân sách truy vấn (QUERY_GUARD): đếm
+số câu lệnh mỗi request, báo khi vượt ngân sách của route hoặc khi cùng một
+dạng câu lệnh lặp lại nhiều lần (dấu hiệu N+1). Xem `check_query_budget`.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import Response, jsonify, request
+
+EXTENSION_KEY = "profiling"
+DEFAULT_SLOW_THRESHOLD = 0.2
+DEFAULT_SLOW_BUFFER = 100
+# Số câu truy vấn tối đa giữ chi tiết cho mỗi request (tổng thời gian vẫn tính đủ)
+MAX_QUERIES_PER_REQUEST = 200
+# Biên các bucket của histogram (giây)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_QUERY_BUDGET = 20
+DEFAULT_REPEAT_THRESHOLD = 3
+# Điều khiển giao dịch và PRAGMA không tính vào ngân sách
+CONTROL_STATEMENT = re.compile(r"\s*(BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA)\b", re.IGNORECASE)
+
+_local = threading.local()
+
+
+class RequestProfile:
+    """Số liệu của một request, gắn với luồng đang xử lý request đó."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {"db": 0.0, "serialize": 0.0}
+        self.query_count = 0
+        self.queries = []
+
+    def add_query(self, sql):
+        self.query_count += 1
+        record = {"sql": sql, "duration": 0.0, "rows": 0}
+        if len(self.queries) < MAX_QUERIES_PER_REQUEST:
+            self.queries.append(record)
+        return record
+
+
+def current_profile():
+    return getattr(_local, "profile", None)
+
+
+@contextmanager
+def span(name):
+    """Cộng thời gian của khối lệnh vào mục `name` của request hiện tại (không làm gì nếu tắt)."""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] = profile.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor ghi thời gian execute + fetch và số dòng vào request đang được đo."""
+
+    _record = None
+
+    def _add(self, started, rows=0):
+        elapsed = time.perf_counter() - started
+        profile = current_profile()
+        if profile is not None:
+            profile.timings["db"] += elapsed
+        if self._record is not None:
+            self._record["duration"] += elapsed
+            self._record["rows"] += rows
+
+    def execute(self, sql, parameters=()):
+        profile = current_profile()
+        self._record = profile.add_query(sql) if profile is not None else None
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(started)
+
+    def executemany(self, sql, seq_of_parameters):
+        profile = current_profile()
+        self._record = profile.add_query(sql) if profile is not None else None
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(started)
+            raise
+        self._add(started, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection (dùng làm `factory` của sqlite3.connect) trả về InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _timed(self, name, method):
+        # COMMIT là lúc ghi WAL (và fsync): cần tính vào thời gian CSDL
+        profile = current_profile()
+        if profile is None:
+            return method()
+        record = profile.add_query(name)
+        started = time.perf_counter()
+        try:
+            return method()
+        finally:
+            elapsed = time.perf_counter() - started
+            record["duration"] += elapsed
+            profile.timings["db"] += elapsed
+
+    def commit(self):
+        return self._timed("COMMIT", super().commit)
+
+    def rollback(self):
+        return self._timed("ROLLBACK", super().rollback)
+
+
+class Histogram:
+    """Histogram kiểu Prometheus (bucket cộng dồn, _sum, _count) theo bộ nhãn."""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [đếm theo bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def normalize_sql(sql):
+    """Nhãn của một câu truy vấn: gộp khoảng trắng và danh sách `?, ?, ...` để số nhãn không phình."""
+    sql = " ".join(sql.split())
+    return re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", sql)
+
+
+def is_enabled(app):
+    return bool(app.config.get("PROFILING_ENABLED"))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Một route chạy quá số câu truy vấn cho phép (chỉ ném ra khi QUERY_GUARD = "raise")."""
+
+
+def guard_mode(app):
+    """
+    QUERY_GUARD: "raise" | "log" | "off". Mặc định "raise" khi app.testing,
+    "log" khi app.debug, còn lại "off" (production không tốn gì).
+    """
+    mode = app.config.get("QUERY_GUARD")
+    if mode is None:
+        mode = "raise" if app.testing else "log" if app.debug else "off"
+    return mode
+
+
+def is_instrumented(app):
+    """Kết nối có cần đo/đếm câu lệnh không (profiling hoặc bộ canh ngân sách)."""
+    return is_enabled(app) or guard_mode(app) != "off"
+
+
+def query_budget(max_queries=None, max_repeats=None):
+    """
+    Decorator ghi đè ngân sách của một route, vd. các endpoint theo lô cố ý
+    chạy một câu lệnh cho mỗi phần tử: `@profiling.query_budget(max_queries=500,
+    max_repeats=200)`. Tham số nào để None thì dùng giá trị chung của app.
+    """
+    def decorator(f):
+        f.query_budget = {"max_queries": max_queries, "max_repeats": max_repeats}
+        return f
+    return decorator
+
+
+def check_query_budget(app, profile, view=None):
+    """
+    Trả về danh sách vi phạm của request (rỗng nếu ổn):
+    - tổng số câu lệnh > QUERY_BUDGETS[endpoint] (hoặc QUERY_BUDGET_DEFAULT);
+    - một dạng câu lệnh (normalize_sql) chạy >= QUERY_REPEAT_THRESHOLD lần.
+    """
+    budget = getattr(view, "query_budget", {})
+    max_queries = (budget.get("max_queries")
+                   or app.config.get("QUERY_BUDGETS", {}).get(request.endpoint)
+                   or app.config.get("QUERY_BUDGET_DEFAULT", DEFAULT_QUERY_BUDGET))
+    max_repeats = budget.get("max_repeats") or app.config.get("QUERY_REPEAT_THRESHOLD",
+                                                              DEFAULT_REPEAT_THRESHOLD)
+    statements = [q["sql"] for q in profile.queries if not CONTROL_STATEMENT.match(q["sql"])]
+    # Các câu vượt quá MAX_QUERIES_PER_REQUEST không được giữ lại nhưng vẫn phải đếm
+    count = len(statements) + profile.query_count - len(profile.queries)
+    problems = []
+    if count > max_queries:
+        problems.append(f"{count} queries (budget {max_queries})")
+    for shape, times in Counter(normalize_sql(sql) for sql in statements).most_common():
+        if times < max_repeats:
+            break
+        problems.append(f"possible N+1: {times}x {shape}")
+    return problems
+
+
+def init_app(app):
+    """
+    Đăng ký các hook đo thời gian và hai endpoint /debug/slow, /metrics.
+    Gọi ngay sau db.init_app để `total` tính cả các after_request khác (vd. nén).
+    Cấu hình: PROFILING_ENABLED, PROFILING_SLOW_THRESHOLD (giây),
+    PROFILING_SLOW_BUFFER (số request chậm được giữ lại); bộ canh ngân sách:
+    QUERY_GUARD, QUERY_BUDGET_DEFAULT, QUERY_BUDGETS ({endpoint: số câu}),
+    QUERY_REPEAT_THRESHOLD.
+    """
+    app.config.setdefault("PROFILING_ENABLED", os.environ.get("LIBRARY_PROFILING") == "1")
+    state = app.extensions[EXTENSION_KEY] = {
+        "slow": deque(maxlen=app.config.get("PROFILING_SLOW_BUFFER", DEFAULT_SLOW_BUFFER)),
+        "requests": Histogram("library_http_request_duration_seconds",
+                              "Thời gian xử lý request theo route.", ("method", "route")),
+        "queries": Histogram("library_db_query_duration_seconds",
+                             "Thời gian của từng câu truy vấn SQLite (execute + fetch).", ("query",)),
+    }
+
+    @app.before_request
+    def start_profile():
+        if is_instrumented(app):
+            _local.profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = current_profile()
+        if profile is None:
+            return response
+        mode = guard_mode(app)
+        if mode != "off":
+            problems = check_query_budget(app, profile, app.view_functions.get(request.endpoint))
+            if problems:
+                message = f"{request.method} {request.path} ({request.endpoint}): " + "; ".join(problems)
+                if mode == "raise":
+                    raise QueryBudgetExceeded(message)
+                app.logger.warning("Query budget exceeded: %s", message)
+        if not is_enabled(app):
+            return response
+        total = time.perf_counter() - profile.started
+        response.headers["Server-Timing"] = ", ".join([
+            f'db;dur={profile.timings["db"] * 1000:.2f};desc="{profile.query_count} queries"',
+            f'serialize;dur={profile.timings["serialize"] * 1000:.2f}',
+            f"total;dur={total * 1000:.2f}",
+        ])
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        state["requests"].observe((request.method, route), total)
+        for query in profile.queries:
+            state["queries"].observe((normalize_sql(query["sql"]),), query["duration"])
+        if total >= app.config.get("PROFILING_SLOW_THRESHOLD", DEFAULT_SLOW_THRESHOLD):
+            state["slow"].append({
+                "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "route": route,
+                "status": response.status_code,
+                "total_ms": round(total * 1000, 2),
+                "db_ms": round(profile.timings["db"] * 1000, 2),
+                "serialize_ms": round(profile.timings["serialize"] * 1000, 2),
+                "query_count": profile.query_count,
+                "queries": [
+                    {"sql": " ".join(q["sql"].split()), "duration_ms": round(q["duration"] * 1000, 3),
+                     "rows": q["rows"]}
+                    for q in profile.queries
+                ],
+            })
+        return response
+
+    @app.teardown_request
+    def clear_profile(exc=None):
+        _local.profile = None
+
+    @app.route("/debug/slow", methods=["GET"])
+    def debug_slow():
+        if not is_enabled(app):
+            return jsonify({"message": "Profiling is disabled"}), 404
+        # Mới nhất trước
+        return jsonify(list(reversed(state["slow"])))
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        if not is_enabled(app):
+            return jsonify({"message": "Profiling is disabled"}), 404
+        body = state["requests"].render() + "\n" + state["queries"].render() + "\n"
+        return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+def connection_factory(app):
+    """Lớp Connection cho pool của `app`: có đo thời gian/đếm câu lệnh hay không."""
+    return InstrumentedConnection if is_instrumented(app) else sqlite3.Connection
@@ -1,14 +1,75 @@
-from db import get_db
-from datetime import datetime
+from db import get_db, index_new_books, BOOKS_INSERT_TRIGGERS
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import base64
+import json
+import re
+import etags
+from cache import cached, invalidate
+
+# Tag cache: "users"/"books" = mọi danh sách; "user:<id>", "book:<id>" = một
+# bản ghi; "user:<id>:borrows" = sách đang mượn của user. Hàm ghi hủy đúng
+# các tag bị ảnh hưởng sau khi commit.
+
+def _json_array_sql(conn, table):
+    """
+    Câu SELECT trả về cả bảng dưới dạng MỘT chuỗi JSON array dựng ngay trong
+    SQLite (json_object/json_group_array): không có sqlite3.Row hay dict nào
+    ở Python. Khóa theo thứ tự chữ cái, giống output của jsonify.
+    """
+    columns = sorted(row["name"] for row in conn.execute(f"PRAGMA table_info({table})"))
+    fields = ", ".join(f"'{column}', {column}" for column in columns)
+    return f"SELECT json_group_array(json_object({fields})) FROM (SELECT * FROM {table} ORDER BY id)"
+
+# Các cột được phép chọn qua sparse fieldset (`?fields=`, xem fieldsets.py)
+USER_COLUMNS = ("id", "name", "email", "member_since", "version")
+BOOK_COLUMNS = ("id", "title", "author", "year", "status", "total_copies", "available_copies", "version")
+
+def _select_by_ids(table, allowed, ids, columns=None):
+    """
+    Đọc các dòng có id trong `ids` bằng một câu WHERE id IN (?, ...) (mỗi id
+    một lần tra khóa chính), chỉ SELECT `columns` nếu có. Kết quả theo thứ tự
+    của `ids`; id không tồn tại bị bỏ qua.
+    """
+    if columns is None:
+        column_list = "*"
+    else:
+        # Tên cột được ghép vào SQL: chỉ nhận các cột trong danh sách cho phép
+        if not set(columns) <= set(allowed):
+            raise ValueError(f"Unknown columns for {table}: {sorted(set(columns) - set(allowed))}")
+        column_list = ", ".join(dict.fromkeys(("id",) + tuple(columns)))
+    conn = get_db(readonly=True)
+    placeholders = ", ".join("?" * len(ids))
+    rows = conn.execute(f"SELECT {column_list} FROM {table} WHERE id IN ({placeholders})", tuple(ids)).fetchall()
+    by_id = {row["id"]: dict(row) for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+# Danh sách có ETag theo collection_versions: khóa cache kèm phiên bản (xem cache.cached)
+def _users_version():
+    return get_collection_version("users")
+
+def _books_version():
+    return get_collection_version("books")
+
+def _stats_version():
+    return get_collection_version("stats")
 
 # === USER QUERIES ===
+@cached(tags=lambda result: ["users"], version=_users_version)
 def get_all_users():
-    conn = get_db()
+    conn = get_db(readonly=True)
     users = conn.execute('SELECT * FROM users').fetchall()
     return [dict(user) for user in users]
 
+@cached(tags=lambda result: ["users"], version=_users_version)
+def get_all_users_json():
+    """Như get_all_users nhưng trả về chuỗi JSON dựng sẵn (xem _json_array_sql)."""
+    conn = get_db(readonly=True)
+    return conn.execute(_json_array_sql(conn, "users")).fetchone()[0]
+
+@cached(tags=lambda result, user_id: [f"user:{user_id}"] if result else ["users"])
 def get_user_by_id(user_id):
-    conn = get_db()
+    conn = get_db(readonly=True)
     user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
     return dict(user) if user else None
 
@@ -20,85 +81,404 @@ def add_user(data):
         cursor.execute('INSERT INTO users (name, email, member_since) VALUES (?, ?, ?)',
                        (data['name'], data['email'], member_since))
         conn.commit()
+        invalidate("users")
         new_user_id = cursor.lastrowid
         return get_user_by_id(new_user_id)
     except conn.IntegrityError: # Bắt lỗi email bị trùng
         return None
 
+@cached(tags=lambda result, user_ids, columns=None:
+        [f"user:{u['id']}" for u in result] + (["users"] if len(result) < len(user_ids) else []),
+        version=_users_version)
+def get_users_by_ids(user_ids, columns=None):
+    """Nhiều user trong MỘT câu WHERE id IN (...); xem _select_by_ids."""
+    return _select_by_ids("users", USER_COLUMNS, user_ids, columns)
+
+def get_collection_version(name):
+    """Phiên bản hiện tại của `name` ('books' | 'users' | 'stats'), tăng sau mỗi thay đổi."""
+    conn = get_db(readonly=True)
+    row = conn.execute('SELECT version FROM collection_versions WHERE name = ?', (name,)).fetchone()
+    return row['version'] if row else 0
+
+# === TOKEN QUERIES ===
+# Không dùng cache của module này: auth.py có cache riêng cho token đã xác thực.
+def get_token_by_hash(token_hash):
+    conn = get_db(readonly=True)
+    token = conn.execute('SELECT * FROM tokens WHERE token_hash = ?', (token_hash,)).fetchone()
+    return dict(token) if token else None
+
+def add_token(user_id, token_hash, scopes, expires_at=None):
+    conn = get_db()
+    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        token = conn.execute(
+            'INSERT INTO tokens (token_hash, user_id, scopes, created_at, expires_at) '
+            'VALUES (?, ?, ?, ?, ?) RETURNING *',
+            (token_hash, user_id, scopes, created_at, expires_at)).fetchone()
+    return dict(token)
+
+def revoke_token(token_id, user_id):
+    """Thu hồi token `token_id` của `user_id`; trả về bản ghi đã thu hồi hoặc None nếu không có."""
+    conn = get_db()
+    revoked_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        token = conn.execute(
+            'UPDATE tokens SET revoked_at = ? WHERE id = ? AND user_id = ? AND revoked_at IS NULL RETURNING *',
+            (revoked_at, token_id, user_id)).fetchone()
+    return dict(token) if token else None
+
 # === BOOK QUERIES ===
+@cached(tags=lambda result: ["books"], version=_books_version)
 def get_all_books():
-    conn = get_db()
+    conn = get_db(readonly=True)
     books = conn.execute('SELECT * FROM books').fetchall()
     return [dict(book) for book in books]
 
+@cached(tags=lambda result: ["books"], version=_books_version)
+def get_all_books_json():
+    """Như get_all_books nhưng trả về chuỗi JSON dựng sẵn (xem _json_array_sql)."""
+    conn = get_db(readonly=True)
+    return conn.execute(_json_array_sql(conn, "books")).fetchone()[0]
+
+def iter_rows(query, params=(), batch_size=1000):
+    """
+    Duyệt kết quả theo từng lô bằng fetchmany thay vì fetchall: bộ nhớ chỉ
+    giữ tối đa `batch_size` dòng, bất kể bảng lớn đến đâu.
+    Sinh ra các lô (list các sqlite3.Row).
+    """
+    conn = get_db(readonly=True)
+    cursor = conn.execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+def iter_books(batch_size=1000):
+    """Toàn bộ catalog, theo thứ tự id, dưới dạng các lô dòng (xem iter_rows)."""
+    return iter_rows('SELECT * FROM books ORDER BY id', batch_size=batch_size)
+
+@cached(tags=lambda result, book_id: [f"book:{book_id}"] if result else ["books"])
 def get_book_by_id(book_id):
-    conn = get_db()
+    conn = get_db(readonly=True)
     book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
     return dict(book) if book else None
 
-def add_book(data):
+@cached(tags=lambda result, book_ids, columns=None:
+        [f"book:{b['id']}" for b in result] + (["books"] if len(result) < len(book_ids) else []),
+        version=_books_version)
+def get_books_by_ids(book_ids, columns=None):
+    """Nhiều sách trong MỘT câu WHERE id IN (...), thay cho N lần get_book_by_id."""
+    return _select_by_ids("books", BOOK_COLUMNS, book_ids, columns)
+
+def add_book(data, total_copies=1):
+    """
+    Thêm một đầu sách với `total_copies` bản, tất cả đều trên kệ. `status`
+    suy ra từ số bản như trong update_book: 0 bản nghĩa là không mượn được.
+    """
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO books (title, author, year) VALUES (?, ?, ?)',
-                   (data['title'], data['author'], data['year']))
+    cursor.execute('INSERT INTO books (title, author, year, total_copies, available_copies, status) '
+                   "VALUES (?, ?, ?, ?, ?, CASE WHEN ? > 0 THEN 'available' ELSE 'borrowed' END)",
+                   (data['title'], data['author'], data['year'], total_copies, total_copies, total_copies))
     conn.commit()
+    invalidate("books")
     new_book_id = cursor.lastrowid
     return get_book_by_id(new_book_id)
 
-def update_book(book_id, data):
+@contextmanager
+def books_bulk_load():
+    """
+    Tạm bỏ các trigger AFTER INSERT của books (FTS và version của collection,
+    xem db.BOOKS_INSERT_TRIGGERS) trong suốt một lần nạp hàng loạt: trigger
+    chạy một lần cho MỖI dòng, còn insert_books làm phần việc đó một lần cho
+    cả lô. Lược đồ chỉ đổi hai lần cho cả lần nạp (bỏ rồi tạo lại), không
+    phải mỗi lô, nên các kết nối khác không phải chuẩn bị lại câu lệnh liên tục.
+    - Mỗi giao dịch ở đây và trong insert_books là riêng, nên kết nối ghi được
+      trả về pool giữa các lô. Sách do request khác thêm trong lúc nạp được
+      đánh chỉ mục ở lô kế tiếp (db.index_new_books) hoặc khi kết thúc.
+    - Hai lần nạp chồng nhau vẫn đúng: lần kết thúc trước tạo lại trigger,
+      lần còn lại tiếp tục với trigger (chậm hơn) mà không đánh chỉ mục trùng.
+    - Tiến trình bị kill giữa chừng: `flask rebuild-search-index` tạo lại trigger.
+    - Tự checkpoint WAL của kết nối ghi được hoãn tới cuối lần nạp: chép các
+      trang của mỗi lô về file chính ngay sau commit tốn thêm ~5-10% thời gian.
+    """
+    conn = get_db()
+    autocheckpoint = conn.execute('PRAGMA wal_autocheckpoint').fetchone()[0]
+    conn.execute('PRAGMA wal_autocheckpoint = 0')
+    _in_write_transaction(conn, _drop_books_insert_triggers)
+    try:
+        yield
+    finally:
+        conn = get_db()
+        try:
+            _in_write_transaction(conn, _restore_books_insert_triggers)
+        finally:
+            conn.execute(f'PRAGMA wal_autocheckpoint = {int(autocheckpoint)}')
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        invalidate("books")
+
+def _in_write_transaction(conn, step):
+    """Chạy `step(conn)` trong BEGIN IMMEDIATE (sqlite3 không tự mở giao dịch cho DDL)."""
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        step(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def _drop_books_insert_triggers(conn):
+    for name in BOOKS_INSERT_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def _restore_books_insert_triggers(conn):
+    # Sách được thêm sau lô cuối (lúc chưa có trigger) được đánh chỉ mục trước
+    _index_pending_books(conn)
+    for sql in BOOKS_INSERT_TRIGGERS.values():
+        conn.execute(sql)
+
+def _index_pending_books(conn):
+    index_new_books(conn)
+    conn.execute("UPDATE collection_versions SET version = version + 1 WHERE name = 'books'")
+
+def insert_books(rows):
+    """
+    Thêm nhiều sách bằng một lệnh executemany trong MỘT giao dịch
+    (một lần commit/fsync cho cả lô). `rows` là các tuple (title, author, year)
+    đã được kiểm tra hợp lệ. Trả về số sách đã thêm.
+    Trong books_bulk_load (không có trigger AFTER INSERT), cả lô được đánh chỉ
+    mục FTS bằng một lệnh INSERT ... SELECT và version của collection tăng một
+    lần; ngoài đó trigger đã làm việc này cho từng dòng và bước cuối không
+    còn sách nào phải đánh chỉ mục.
+    """
+    conn = get_db()
+    with conn:
+        conn.executemany('INSERT INTO books (title, author, year) VALUES (?, ?, ?)', rows)
+        _index_pending_books(conn)
+    invalidate("books")
+    return len(rows)
+
+def update_book(book_id, data, total_copies=None):
+    """
+    Sửa thông tin sách. `total_copies` (nếu có) đổi số bản sở hữu, số bản trên
+    kệ đổi theo cùng một lượng; trả về None nếu số bản mới ít hơn số bản đang
+    được mượn (CHECK của available_copies).
+    """
     conn = get_db()
-    conn.execute('UPDATE books SET title = ?, author = ?, year = ? WHERE id = ?',
-                   (data['title'], data['author'], data['year'], book_id))
+    if total_copies is None:
+        conn.execute('UPDATE books SET title = ?, author = ?, year = ?, version = version + 1 WHERE id = ?',
+                       (data['title'], data['author'], data['year'], book_id))
+    else:
+        try:
+            # Vế phải của mọi phép gán đều đọc giá trị CŨ của dòng
+            conn.execute(
+                "UPDATE books SET title = ?, author = ?, year = ?, "
+                "available_copies = available_copies + (? - total_copies), total_copies = ?, "
+                "status = CASE WHEN available_copies + (? - total_copies) > 0 "
+                "THEN 'available' ELSE 'borrowed' END, "
+                "version = version + 1 WHERE id = ?",
+                (data['title'], data['author'], data['year'],
+                 total_copies, total_copies, total_copies, book_id))
+        except conn.IntegrityError:
+            conn.rollback()
+            return None
     conn.commit()
+    etags.invalidate("book", book_id)
+    invalidate("books", f"book:{book_id}")
     return get_book_by_id(book_id)
 
 def delete_book(book_id):
+    """
+    Xóa sách nếu không còn bản nào đang được mượn. Điều kiện nằm ngay trong
+    câu DELETE (không dựa vào get_book_by_id, có thể là bản cache cũ), nên
+    một lượt mượn chen vào giữa lúc kiểm tra và lúc xóa không thể bị bỏ qua.
+    Trả về (True, None) nếu đã xóa, hoặc (False, lỗi) với lỗi là
+    'book_not_found' hay 'book_borrowed'.
+    """
     conn = get_db()
-    conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
-    conn.commit()
-    # Using cursor.rowcount is a more reliable way to check for changes
-    return get_db().changes() > 0
+    with conn:
+        cursor = conn.execute('DELETE FROM books WHERE id = ? AND available_copies = total_copies', (book_id,))
+        # Vẫn trong giao dịch ghi: không khớp dòng nào là do sách không tồn tại hay đang được mượn
+        error = None if cursor.rowcount else _book_missing_or(conn, book_id, 'book_borrowed')
+    if error:
+        return False, error
+    etags.invalidate("book", book_id)
+    invalidate("books", f"book:{book_id}")
+    return True, None
 
 # === BORROW/RETURN QUERIES ===
-def borrow_book(book_id, user_id):
-    conn = get_db()
-    try:
-        with conn: # 'with': tự động commit hoặc rollback
-            conn.execute("UPDATE books SET status = 'borrowed' WHERE id = ?", (book_id,))
-            
-            borrow_date = datetime.now().strftime("%Y-%m-%d")
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO borrows (book_id, user_id, borrow_date) VALUES (?, ?, ?)',
-                           (book_id, user_id, borrow_date))
-            
-            new_borrow_id = cursor.lastrowid
-            borrow_record = conn.execute('SELECT * FROM borrows WHERE borrow_id = ?', (new_borrow_id,)).fetchone()
-            return dict(borrow_record)
-    except conn.Error:
-        return None
+# Mượn/trả chạy trong một giao dịch BEGIN IMMEDIATE: khóa ghi được giữ ngay
+# từ đầu, và UPDATE có điều kiện trên `available_copies` vừa kiểm tra vừa
+# tăng/giảm bộ đếm trong cùng một câu lệnh. Hai request mượn bản cuối cùng
+# của một đầu sách (kể cả từ hai tiến trình khác nhau) không thể cùng thắng.
+# `status` là giá trị suy ra ('available' khi còn ít nhất một bản trên kệ).
+# Mỗi cuốn sách là một SAVEPOINT riêng, nên một lô (quầy mượn trả quét nhiều
+# sách một lúc) được phép thành công từng phần mà vẫn chỉ commit một lần.
+# Kết quả của mỗi cuốn là (kết quả, lỗi): kết quả là {"book": ..., "borrow": ...}
+# khi thành công; lỗi là một trong 'book_not_found', 'user_not_found',
+# 'book_unavailable', 'book_not_borrowed', 'no_active_borrow', 'db_error'.
+
+def _book_missing_or(conn, book_id, error):
+    """Sau khi UPDATE có điều kiện không khớp dòng nào: sách không tồn tại hay sai trạng thái."""
+    exists = conn.execute('SELECT 1 FROM books WHERE id = ?', (book_id,)).fetchone()
+    return error if exists else 'book_not_found'
 
-def return_book(book_id):
+def _borrow_one(conn, book_id, user_id, borrow_date):
+    book = conn.execute(
+        "UPDATE books SET available_copies = available_copies - 1, "
+        "status = CASE WHEN available_copies > 1 THEN 'available' ELSE 'borrowed' END, "
+        "version = version + 1 "
+        "WHERE id = ? AND available_copies > 0 RETURNING *", (book_id,)).fetchone()
+    if book is None:
+        return None, _book_missing_or(conn, book_id, 'book_unavailable')
+    borrow_record = conn.execute(
+        'INSERT INTO borrows (book_id, user_id, borrow_date) '
+        'SELECT ?, id, ? FROM users WHERE id = ? RETURNING *',
+        (book_id, borrow_date, user_id)).fetchone()
+    if borrow_record is None:
+        return None, 'user_not_found'
+    return {"book": dict(book), "borrow": dict(borrow_record)}, None
+
+def _return_one(conn, book_id, return_date, user_id=None):
+    book = conn.execute(
+        "UPDATE books SET available_copies = available_copies + 1, status = 'available', "
+        "version = version + 1 "
+        "WHERE id = ? AND available_copies < total_copies RETURNING *", (book_id,)).fetchone()
+    if book is None:
+        return None, _book_missing_or(conn, book_id, 'book_not_borrowed')
+    # Nhiều bản đang được mượn: ưu tiên lượt mượn của chính người trả, sau đó là lượt cũ nhất
+    borrow_record = conn.execute(
+        'UPDATE borrows SET return_date = ? WHERE borrow_id = ('
+        '    SELECT borrow_id FROM borrows WHERE book_id = ? AND return_date IS NULL'
+        '    ORDER BY user_id = ? DESC, borrow_id LIMIT 1'
+        ') RETURNING *',
+        (return_date, book_id, user_id)).fetchone()
+    if borrow_record is None:
+        return None, 'no_active_borrow'
+    return {"book": dict(book), "borrow": dict(borrow_record)}, None
+
+def _run_batch(book_ids, step):
+    """
+    Chạy `step(conn, book_id)` cho từng sách trong một giao dịch duy nhất.
+    Cuốn nào lỗi thì chỉ phần của cuốn đó bị hủy (ROLLBACK TO SAVEPOINT).
+    Lỗi CSDL làm hỏng cả lô: mọi phần tử nhận (None, 'db_error').
+    """
     conn = get_db()
+    results = []
     try:
-        with conn:
-            conn.execute("UPDATE books SET status = 'available' WHERE id = ?", (book_id,))
-            return_date = datetime.now().strftime("%Y-%m-%d")
-            res = conn.execute("UPDATE borrows SET return_date = ? WHERE book_id = ? AND return_date IS NULL",
-                               (return_date, book_id))
-            return res.rowcount > 0 
+        conn.execute('BEGIN IMMEDIATE')
+        for book_id in book_ids:
+            conn.execute('SAVEPOINT item')
+            result, error = step(conn, book_id)
+            if error:
+                conn.execute('ROLLBACK TO item')
+            conn.execute('RELEASE item')
+            results.append((result, error))
+        conn.commit()
     except conn.Error:
-        return False
+        conn.rollback()
+        return [(None, 'db_error')] * len(book_ids)
+    return results
+
+def borrow_books(book_ids, user_id):
+    """Mượn nhiều sách cho một user; trả về danh sách (kết quả, lỗi) theo thứ tự `book_ids`."""
+    borrow_date = datetime.now().strftime("%Y-%m-%d")
+    results = _run_batch(book_ids, lambda conn, book_id: _borrow_one(conn, book_id, user_id, borrow_date))
+    borrowed = [result["book"]["id"] for result, _ in results if result]
+    for book_id in borrowed:
+        etags.invalidate("book", book_id)
+    if borrowed:
+        invalidate("books", "stats", f"user:{user_id}:borrows", *(f"book:{book_id}" for book_id in borrowed))
+    return results
+
+def return_books(book_ids, user_id=None):
+    """
+    Trả nhiều sách; trả về danh sách (kết quả, lỗi) theo thứ tự `book_ids`.
+    `user_id`: người trả (nếu biết), để đóng đúng lượt mượn của họ khi một đầu
+    sách có nhiều bản đang được mượn.
+    """
+    return_date = datetime.now().strftime("%Y-%m-%d")
+    results = _run_batch(book_ids, lambda conn, book_id: _return_one(conn, book_id, return_date, user_id))
+    returned = [result for result, _ in results if result]
+    for result in returned:
+        etags.invalidate("book", result["book"]["id"])
+    if returned:
+        invalidate("books", "stats", *(f"book:{result['book']['id']}" for result in returned),
+                   *{f"user:{result['borrow']['user_id']}:borrows" for result in returned})
+    return results
+
+def borrow_book(book_id, user_id):
+    return borrow_books([book_id], user_id)[0]
+
+def return_book(book_id, user_id=None):
+    return return_books([book_id], user_id)[0]
+
+def iter_borrows(batch_size=1000):
+    """
+    Toàn bộ lịch sử mượn/trả (kể cả phần đã archive), theo thứ tự borrow_id,
+    dưới dạng các lô dòng.
+    """
+    return iter_rows('SELECT * FROM borrow_history ORDER BY borrow_id', batch_size=batch_size)
+
+# === STATS QUERIES ===
+# Đọc các bảng thống kê do trigger duy trì (migrations/0006_borrow_stats.sql):
+# chi phí không phụ thuộc độ dài lịch sử mượn/trả. Tag "stats" bị hủy sau
+# mỗi lần mượn/trả; phiên bản 'stats' trong khóa cache đổi sau mỗi lần
+# `flask rebuild-stats` (chạy ở tiến trình khác, không hủy được tag ở đây).
+
+@cached(tags=lambda result, month, limit: ["stats"] + [f"book:{b['id']}" for b in result],
+        version=_stats_version)
+def get_top_books(month, limit):
+    """Các cuốn được mượn nhiều nhất trong tháng `month` ('YYYY-MM')."""
+    conn = get_db(readonly=True)
+    rows = conn.execute(
+        'SELECT b.id, b.title, b.author, b.year, s.borrow_count '
+        'FROM stats_book_monthly AS s JOIN books AS b ON b.id = s.book_id '
+        'WHERE s.month = ? ORDER BY s.borrow_count DESC, s.book_id LIMIT ?',
+        (month, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+@cached(tags=lambda result, limit: ["stats"], version=_stats_version)
+def get_active_borrowers(limit):
+    """Các user đang mượn nhiều sách nhất (chỉ những người còn sách chưa trả)."""
+    conn = get_db(readonly=True)
+    rows = conn.execute(
+        'SELECT u.id, u.name, u.email, s.open_count '
+        'FROM stats_user_open AS s JOIN users AS u ON u.id = s.user_id '
+        'WHERE s.open_count > 0 ORDER BY s.open_count DESC, s.user_id LIMIT ?',
+        (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+@cached(tags=lambda result, due_before: ["stats"], version=_stats_version)
+def get_overdue_summary(due_before):
+    """
+    Số lượt mượn đang mở và số lượt quá hạn (mượn trước ngày `due_before`,
+    'YYYY-MM-DD'). Đọc stats_open_by_day: mỗi ngày còn sách chưa trả một dòng.
+    """
+    conn = get_db(readonly=True)
+    row = conn.execute(
+        'SELECT COALESCE(SUM(open_count), 0) AS open_loans, '
+        '       COALESCE(SUM(CASE WHEN borrow_date < ? THEN open_count END), 0) AS overdue_loans, '
+        '       MIN(borrow_date) AS oldest_borrow_date '
+        'FROM stats_open_by_day',
+        (due_before,)).fetchone()
+    return dict(row)
 
 # ======================================================================
 # === CÁC HÀM MỚI ĐƯỢC THÊM VÀO ĐỂ DEMO CÁC TÍNH NĂNG NÂNG CAO ===
 # ======================================================================
 
+@cached(tags=lambda result, user_id: [f"user:{user_id}:borrows"] + [f"book:{b['id']}" for b in result])
 def get_borrowed_books_by_user(user_id):
     """
     Hàm cho Nesting: Lấy danh sách sách mà một người dùng đang mượn.
     Sử dụng JOIN để kết hợp thông tin từ bảng books và borrows.
     """
-    conn = get_db()
+    conn = get_db(readonly=True)
     query = """
         SELECT
             b.id,
@@ -114,42 +494,244 @@ def get_borrowed_books_by_user(user_id):
     return [dict(book) for book in books]
 
 
-def search_and_filter_books(search_term, author, year, page, limit):
+# === TÀI NGUYÊN LIÊN QUAN (?include=, xem compound.py) ===
+# Mỗi hàm là MỘT truy vấn, bất kể có bao nhiêu dòng liên quan.
+
+@cached(tags=lambda result, book_id: [f"book:{book_id}"])
+def get_current_borrowers(book_id):
+    """Những người đang mượn một bản của cuốn sách (một đầu sách có thể có nhiều bản)."""
+    conn = get_db(readonly=True)
+    rows = conn.execute(
+        'SELECT u.*, br.borrow_id, br.borrow_date '
+        'FROM borrows AS br JOIN users AS u ON u.id = br.user_id '
+        'WHERE br.book_id = ? AND br.return_date IS NULL ORDER BY br.borrow_id',
+        (book_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+@cached(tags=lambda result, book_id, limit: [f"book:{book_id}"])
+def get_book_history(book_id, limit):
+    """`limit` lượt mượn gần nhất của cuốn sách, kể cả phần đã archive."""
+    conn = get_db(readonly=True)
+    rows = conn.execute(
+        'SELECT * FROM borrow_history WHERE book_id = ? ORDER BY borrow_id DESC LIMIT ?',
+        (book_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+@cached(tags=lambda result, user_id, limit: [f"user:{user_id}:borrows"])
+def get_user_history(user_id, limit):
+    """`limit` lượt mượn gần nhất của user, kể cả phần đã archive."""
+    conn = get_db(readonly=True)
+    rows = conn.execute(
+        'SELECT * FROM borrow_history WHERE user_id = ? ORDER BY borrow_id DESC LIMIT ?',
+        (user_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fts_match_query(search_term):
     """
-    Hàm cho Query Params: Tìm kiếm, lọc và phân trang sách.
-    Xây dựng câu lệnh SQL một cách linh động dựa trên các tham số đầu vào.
+    Chuyển chuỗi tìm kiếm của người dùng thành biểu thức MATCH của FTS5:
+    mỗi từ thành một tiền tố ("de* men*"), các từ nối với nhau bằng AND.
+    "đ/Đ" được đổi thành "d/D" giống như khi đánh chỉ mục (xem migrations/0002_books_fts.sql).
+    Trả về None nếu chuỗi không có từ nào.
+    """
+    folded = search_term.replace("Đ", "D").replace("đ", "d")
+    tokens = re.findall(r"\w+", folded)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _book_filters(search_term, author, year, available=None):
+    """
+    Dựng danh sách điều kiện WHERE (và tham số) dùng chung cho tìm kiếm sách.
+    `available`: True = còn bản trên kệ, False = đã cho mượn hết, None = không lọc.
     """
-    conn = get_db()
-    
-    # Bắt đầu với câu query cơ bản và một danh sách các điều kiện WHERE
-    base_query = "SELECT * FROM books"
     conditions = []
     params = []
 
-    # 1. Thêm điều kiện tìm kiếm (nếu có)
+    # 1. Thêm điều kiện tìm kiếm full-text trên tiêu đề/tác giả (nếu có)
     if search_term:
-        conditions.append("title LIKE ?")
-        params.append(f"%{search_term}%")
+        match_query = fts_match_query(search_term)
+        if match_query:
+            conditions.append("id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)")
+            params.append(match_query)
+        else:
+            # Từ khóa không có từ nào (vd. "!!!"): không sách nào khớp, không bỏ qua điều kiện
+            conditions.append("0")
 
     # 2. Thêm điều kiện lọc theo tác giả (nếu có)
     if author:
         conditions.append("author = ?")
         params.append(author)
-    
+
     # 3. Thêm điều kiện lọc theo năm (nếu có)
     if year:
         conditions.append("year = ?")
         params.append(year)
 
-    # 4. Ghép các điều kiện lại với "AND"
+    # 4. Lọc theo tình trạng còn sách (đọc bộ đếm, dùng chỉ mục idx_books_available)
+    if available is True:
+        conditions.append("available_copies > 0")
+    elif available is False:
+        conditions.append("available_copies = 0")
+
+    return conditions, params
+
+
+# Số sách tối đa mỗi trang của các hàm tìm kiếm. limit âm trong SQLite nghĩa là
+# "không giới hạn" (LIMIT -1 trả về cả bảng), nên phải chặn trước khi vào SQL.
+MAX_LIMIT = 100
+
+def _check_limit(limit):
+    """Ném ValueError nếu `limit` không phải số nguyên trong [1, MAX_LIMIT]."""
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be an integer between 1 and {MAX_LIMIT}")
+
+def _page_offset(page, limit):
+    """OFFSET của trang `page` (đánh số từ 1); ném ValueError nếu page/limit không hợp lệ."""
+    _check_limit(limit)
+    if not _is_sqlite_int(page) or page < 1 or not _is_sqlite_int((page - 1) * limit):
+        raise ValueError("page must be a positive integer")
+    return (page - 1) * limit
+
+
+@cached(tags=lambda result, *args, **kwargs: ["books"], version=_books_version)
+def search_and_filter_books(search_term, author, year, page, limit, available=None):
+    """
+    Hàm cho Query Params: Tìm kiếm, lọc và phân trang sách.
+    Xây dựng câu lệnh SQL một cách linh động dựa trên các tham số đầu vào.
+    Phân trang kiểu LIMIT/OFFSET (giữ lại cho tham số `page`); trang càng sâu
+    càng chậm, nên ưu tiên dùng search_books_keyset.
+    Ném ValueError nếu page/limit không hợp lệ (xem _page_offset).
+    """
+    offset = _page_offset(page, limit)
+    conn = get_db(readonly=True)
+    
+    # Bắt đầu với câu query cơ bản và các điều kiện WHERE
+    base_query = "SELECT * FROM books"
+    conditions, params = _book_filters(search_term, author, year, available)
+
+    # 5. Ghép các điều kiện lại với "AND"
     if conditions:
         base_query += " WHERE " + " AND ".join(conditions)
 
-    # 5. Thêm logic phân trang
-    offset = (page - 1) * limit
+    # 6. Thêm logic phân trang
     base_query += " LIMIT ? OFFSET ?"
     params.extend([limit, offset])
 
     # Thực thi câu query cuối cùng
     results = conn.execute(base_query, tuple(params)).fetchall()
     return [dict(row) for row in results]
+
+
+@cached(tags=lambda result, *args, **kwargs: ["books"], version=_books_version)
+def search_books_ranked(search_term, author, year, page, limit, available=None):
+    """
+    Tìm kiếm full-text xếp hạng theo độ liên quan (bm25, tiêu đề nặng ký
+    hơn tác giả). Chỉ đọc các dòng khớp trong chỉ mục FTS5 nên thời gian
+    không tăng tuyến tính theo kích thước catalog.
+    Ném ValueError nếu page/limit không hợp lệ (xem _page_offset).
+    """
+    offset = _page_offset(page, limit)
+    if not search_term:
+        return search_and_filter_books(None, author, year, page, limit, available)
+    match_query = fts_match_query(search_term)
+    if not match_query:
+        return []
+
+    conn = get_db(readonly=True)
+    query = """
+        SELECT b.*
+        FROM books_fts
+        JOIN books AS b ON b.id = books_fts.rowid
+        WHERE books_fts MATCH ?
+    """
+    params = [match_query]
+    if author:
+        query += " AND b.author = ?"
+        params.append(author)
+    if year:
+        query += " AND b.year = ?"
+        params.append(year)
+    if available is True:
+        query += " AND b.available_copies > 0"
+    elif available is False:
+        query += " AND b.available_copies = 0"
+    query += " ORDER BY bm25(books_fts, 2.0, 1.0), b.id LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    results = conn.execute(query, tuple(params)).fetchall()
+    return [dict(row) for row in results]
+
+
+# === KEYSET (CURSOR) PAGINATION ===
+# Các cột được phép sắp xếp; luôn kèm `id` để thứ tự là duy nhất.
+BOOK_SORT_COLUMNS = ("id", "title", "author", "year")
+# Kiểu của khóa sắp xếp trong cursor, theo cột
+_SORT_KEY_TYPES = {"id": int, "title": str, "author": str, "year": int}
+_SQLITE_INT_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+def _is_sqlite_int(value):
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and _SQLITE_INT_RANGE[0] <= value <= _SQLITE_INT_RANGE[1])
+
+def encode_cursor(sort, book):
+    """Mã hóa vị trí (sort_key, id) của cuốn sách cuối trang thành chuỗi opaque."""
+    payload = {"s": sort, "k": book[sort], "id": book["id"]}
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """Giải mã cursor; ném ValueError nếu cursor không hợp lệ."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        sort, key, last_id = payload["s"], payload["k"], payload["id"]
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    # Cursor đến từ client: khóa phải là giá trị vô hướng đúng kiểu của cột
+    # sắp xếp và id phải vừa số nguyên 64-bit, nếu không SQLite sẽ báo lỗi
+    if sort not in BOOK_SORT_COLUMNS or not _is_sqlite_int(last_id):
+        raise ValueError("Invalid cursor")
+    expected = _SORT_KEY_TYPES[sort]
+    if expected is int and not _is_sqlite_int(key) or expected is str and not isinstance(key, str):
+        raise ValueError("Invalid cursor")
+    return sort, key, last_id
+
+@cached(tags=lambda result, *args, **kwargs: ["books"], version=_books_version)
+def search_books_keyset(search_term, author, year, limit, cursor=None, sort="id", available=None):
+    """
+    Tìm kiếm/lọc sách với phân trang keyset: thay vì OFFSET, mỗi trang "seek"
+    thẳng tới sau (sort_key, id) của dòng cuối trang trước, nên trang sâu
+    cũng nhanh như trang đầu.
+    Trả về (books, next_cursor); next_cursor là None nếu đã hết dữ liệu.
+    """
+    _check_limit(limit)
+    if cursor:
+        sort, last_key, last_id = decode_cursor(cursor)
+    elif sort not in BOOK_SORT_COLUMNS:
+        raise ValueError(f"Invalid sort: {sort}")
+
+    conn = get_db(readonly=True)
+    conditions, params = _book_filters(search_term, author, year, available)
+
+    if cursor:
+        if sort == "id":
+            conditions.append("id > ?")
+            params.append(last_id)
+        else:
+            conditions.append(f"({sort}, id) > (?, ?)")
+            params.extend([last_key, last_id])
+
+    query = "SELECT * FROM books"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id" if sort == "id" else f" ORDER BY {sort}, id"
+    # Lấy dư một dòng để biết còn trang sau hay không.
+    query += " LIMIT ?"
+    params.append(limit + 1)
+
+    rows = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
+    books = rows[:limit]
+    next_cursor = encode_cursor(sort, books[-1]) if len(rows) > limit else None
+    return books, next_cursor
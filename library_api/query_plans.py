@@ -0,0 +1,147 @@
+# query_plans.py
+"""
+Kiểm tra kế hoạch thực thi (EXPLAIN QUERY PLAN) của các câu lệnh trong queries.py.
+
+Cách làm: chạy từng hàm trong `SAMPLES` trên một bản sao tạm của CSDL (dữ
+liệu thật không bị đụng tới), ghi lại mọi câu lệnh SQL mà hàm đó thực sự
+gửi xuống SQLite, rồi EXPLAIN từng câu. Câu nào quét toàn bộ bảng (SCAN
+không dùng chỉ mục) sẽ bị báo lỗi, trừ các hàm được đánh dấu cho phép.
+"""
+import os
+import sqlite3
+import tempfile
+from flask import g
+
+import cache
+import db
+import queries
+
+# (tên, hàm gọi thử, có được phép full scan hay không)
+# Khi thêm hàm mới vào queries.py, hãy thêm một mẫu gọi thử vào đây.
+SAMPLES = [
+    # Liệt kê toàn bộ bảng: full scan là đúng bản chất của hàm
+    ("get_all_users", lambda: queries.get_all_users(), True),
+    ("get_all_books", lambda: queries.get_all_books(), True),
+    ("get_all_users_json", lambda: queries.get_all_users_json(), True),
+    ("get_all_books_json", lambda: queries.get_all_books_json(), True),
+    ("iter_books", lambda: list(queries.iter_books()), True),
+    ("iter_borrows", lambda: list(queries.iter_borrows()), True),
+    # Không có bộ lọc nào thì "lấy 10 dòng đầu" là SCAN có LIMIT, chấp nhận được
+    ("search_and_filter_books[no filter]",
+     lambda: queries.search_and_filter_books(None, None, None, 1, 10), True),
+
+    # Một dòng cho mỗi ngày còn sách chưa trả, không phụ thuộc lịch sử
+    ("get_overdue_summary", lambda: queries.get_overdue_summary("2023-10-12"), True),
+    ("get_collection_version", lambda: queries.get_collection_version("books"), False),
+    ("get_user_by_id", lambda: queries.get_user_by_id(1), False),
+    ("get_token_by_hash", lambda: queries.get_token_by_hash("0" * 64), False),
+    ("add_token", lambda: queries.add_token(1, "f" * 64, "library"), False),
+    ("revoke_token", lambda: queries.revoke_token(1, 1), False),
+    ("add_user", lambda: queries.add_user({"name": "Plan", "email": "plan@example.com"}), False),
+    ("get_book_by_id", lambda: queries.get_book_by_id(1), False),
+    ("get_books_by_ids", lambda: queries.get_books_by_ids((3, 1, 999), ("title", "author")), False),
+    ("get_users_by_ids", lambda: queries.get_users_by_ids((2, 1)), False),
+    ("add_book", lambda: queries.add_book({"title": "Plan", "author": "Plan", "year": 2000}), False),
+    ("insert_books", lambda: queries.insert_books([("Plan", "Plan", 2000), ("Plan 2", "Plan", 2001)]), False),
+    ("update_book", lambda: queries.update_book(1, {"title": "Plan", "author": "Plan", "year": 2000}), False),
+    ("borrow_book", lambda: queries.borrow_book(1, 1), False),
+    ("return_book", lambda: queries.return_book(1), False),
+    ("borrow_books", lambda: queries.borrow_books([1, 3, 999], 1), False),
+    ("return_books", lambda: queries.return_books([1, 3, 999]), False),
+    ("delete_book", lambda: queries.delete_book(2), False),
+    ("get_top_books", lambda: queries.get_top_books("2023-10", 10), False),
+    ("get_active_borrowers", lambda: queries.get_active_borrowers(10), False),
+    ("get_current_borrowers", lambda: queries.get_current_borrowers(3), False),
+    ("get_book_history", lambda: queries.get_book_history(3, 20), False),
+    ("get_user_history", lambda: queries.get_user_history(1, 20), False),
+    ("get_borrowed_books_by_user", lambda: queries.get_borrowed_books_by_user(1), False),
+    ("search_and_filter_books[q]",
+     lambda: queries.search_and_filter_books("lao", None, None, 1, 10), False),
+    ("search_and_filter_books[author]",
+     lambda: queries.search_and_filter_books(None, "Nam Cao", None, 2, 10), False),
+    ("search_and_filter_books[year]",
+     lambda: queries.search_and_filter_books(None, None, 1943, 1, 10), False),
+    ("search_books_ranked",
+     lambda: queries.search_books_ranked("de men", None, None, 1, 10), False),
+    ("search_books_keyset[id]",
+     lambda: queries.search_books_keyset(None, None, None, 10,
+                                         cursor=queries.encode_cursor("id", {"id": 1})), False),
+    ("search_books_keyset[title]",
+     lambda: queries.search_books_keyset(None, None, None, 10,
+                                         cursor=queries.encode_cursor("title", {"id": 1, "title": "A"})), False),
+    ("search_books_keyset[author, year]",
+     lambda: queries.search_books_keyset(None, "Nam Cao", 1943, 10, sort="year"), False),
+    ("search_books_keyset[available]",
+     lambda: queries.search_books_keyset(None, None, None, 10, available=True), False),
+    ("search_and_filter_books[author, available]",
+     lambda: queries.search_and_filter_books(None, "Nam Cao", None, 1, 10, available=True), False),
+]
+
+SQL_KEYWORDS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def is_full_scan(detail):
+    """Một dòng của EXPLAIN QUERY PLAN có phải là quét toàn bảng không."""
+    if not detail.startswith("SCAN "):
+        return False
+    return not any(marker in detail for marker in (
+        "USING INDEX", "USING COVERING INDEX", "USING INTEGER PRIMARY KEY",
+        "VIRTUAL TABLE", "CONSTANT ROW",
+    ))
+
+
+def _capture_statements(conn, sample):
+    """Chạy một hàm mẫu và trả về các câu SQL (đã gắn tham số) mà nó thực thi."""
+    statements = []
+
+    def trace(sql):
+        # Bỏ qua BEGIN/COMMIT, các câu nội bộ của SQLite/FTS5 ("--", 'main'.<shadow table>)
+        # và các lần gọi lặp lại do trigger (trace trả về câu lệnh gốc)
+        if not sql.lstrip().upper().startswith(SQL_KEYWORDS) or "'main'." in sql:
+            return
+        if sql not in statements:
+            statements.append(sql)
+
+    conn.set_trace_callback(trace)
+    try:
+        sample()
+    finally:
+        conn.set_trace_callback(None)
+    return statements
+
+
+def check_query_plans(app, out=print):
+    """Trả về True nếu không có câu lệnh nào (ngoài danh sách cho phép) bị full scan."""
+    fd, scratch_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    ok = True
+    try:
+        # Tắt cache: mọi mẫu phải thực sự chạy SQL (và không được ghi kết quả
+        # của bản sao tạm vào cache của CSDL thật)
+        with cache.disabled(), app.test_request_context():
+            source = db.get_db()
+            scratch = sqlite3.connect(scratch_path)
+            source.backup(scratch)
+            scratch.row_factory = sqlite3.Row
+            # Mọi hàm trong queries (kể cả đọc) sẽ dùng bản sao thông qua g.db
+            db.close_db()
+            g.db = scratch
+            try:
+                for name, sample, allow_full_scan in SAMPLES:
+                    for sql in _capture_statements(scratch, sample):
+                        plan = [row["detail"] for row in scratch.execute("EXPLAIN QUERY PLAN " + sql)]
+                        scans = [detail for detail in plan if is_full_scan(detail)]
+                        failed = bool(scans) and not allow_full_scan
+                        ok = ok and not failed
+                        status = "FULL SCAN" if failed else "ok"
+                        out(f"[{status}] {name}: {' '.join(sql.split())}")
+                        for detail in plan:
+                            out(f"    {detail}")
+            finally:
+                g.pop("db", None)
+                scratch.close()
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch_path + suffix):
+                os.remove(scratch_path + suffix)
+    return ok
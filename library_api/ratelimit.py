@@ -0,0 +1,228 @@
+# ratelimit.py
+"""
+Giới hạn tần suất (rate limiting) theo thuật toán token bucket.
+
+- Mỗi "chủ thể" có một xô chứa tối đa `burst` lượt, được nạp lại `rate` lượt
+  mỗi giây; mỗi request tiêu một lượt. Xô rỗng => 429 kèm Retry-After.
+- Chủ thể là user của token (`g.token`, do auth.token_required đặt) hoặc địa
+  chỉ IP với các route không cần đăng nhập.
+- Các quy tắc có tên (vd. "borrow", "search") được cấu hình trong
+  RATELIMIT_RULES = {"tên": (rate mỗi giây, burst)}.
+- Nơi lưu các xô:
+  * `MemoryStore`: trong tiến trình, mỗi worker một bản (mặc định).
+  * `SQLiteStore`: một file SQLite riêng, dùng chung giữa các worker gunicorn
+    trên cùng máy (giống cache.SQLiteBackend).
+- appAsync (Quart) dùng `limit_async` với cùng cấu hình và store.
+"""
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+EXTENSION_KEY = "ratelimit"
+DEFAULT_RULES = {
+    # Mượn/trả: ghi vào CSDL qua kết nối ghi duy nhất
+    "borrow": (1.0, 10),
+    # Tìm kiếm full-text: đọc nhưng tốn CPU hơn các GET khác
+    "search": (5.0, 20),
+}
+
+
+def _take(tokens, updated, now, rate, burst):
+    """Nạp lại xô tới thời điểm `now` rồi thử lấy một lượt; trả về (còn lại, được phép, chờ bao lâu)."""
+    tokens = min(float(burst), tokens + (now - updated) * rate)
+    if tokens >= 1.0:
+        return tokens - 1.0, True, 0.0
+    return tokens, False, (1.0 - tokens) / rate
+
+
+class MemoryStore:
+    """Các xô trong tiến trình; khi vượt `maxsize` chủ thể, xô lâu nhất không dùng bị loại."""
+
+    name = "memory"
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(burst), now))
+            tokens, allowed, retry_after = _take(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteStore:
+    """
+    Các xô nằm trong một file SQLite riêng (không phải CSDL thư viện), nên mọi
+    worker trên cùng máy chia sẻ cùng một hạn mức. Đọc-sửa-ghi mỗi xô nằm
+    trong BEGIN IMMEDIATE để hai worker không cùng tiêu một lượt.
+    """
+
+    name = "sqlite"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID;
+    """
+    # Xóa các xô không dùng quá chừng này giây, sau mỗi PRUNE_EVERY lần gọi
+    PRUNE_AFTER = 3600.0
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Mất vài xô khi mất điện cũng không sao: không cần fsync
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key, rate, burst):
+        # Đồng hồ thực (không phải monotonic): phải so sánh được giữa các tiến trình
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (float(burst), now)
+            tokens, allowed, retry_after = _take(tokens, updated, now, rate, burst)
+            conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_prune(now)
+        return allowed, retry_after
+
+    def _maybe_prune(self, now):
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY:
+                return
+        self._conn().execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.PRUNE_AFTER,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM rate_buckets")
+
+
+def init_app(app):
+    """
+    Đọc cấu hình từ app.config:
+    - RATELIMIT_ENABLED (mặc định True)
+    - RATELIMIT_STORE: "memory" (mặc định) | "sqlite"
+    - RATELIMIT_STORAGE_PATH: file cho store sqlite (mặc định <instance>/ratelimit.db)
+    - RATELIMIT_RULES: ghi đè/thêm quy tắc, {"tên": (rate mỗi giây, burst)}
+    """
+    kind = app.config.get("RATELIMIT_STORE", "memory")
+    if kind == "sqlite":
+        path = app.config.get("RATELIMIT_STORAGE_PATH") or os.path.join(app.instance_path, "ratelimit.db")
+        store = SQLiteStore(path)
+    elif kind == "memory":
+        store = MemoryStore(maxsize=app.config.get("RATELIMIT_MAXSIZE", 100000))
+    else:
+        raise ValueError(f"Unknown RATELIMIT_STORE: {kind}")
+    app.extensions[EXTENSION_KEY] = {
+        "store": store,
+        "rules": {**DEFAULT_RULES, **app.config.get("RATELIMIT_RULES", {})},
+    }
+
+
+def client_key():
+    """Chủ thể bị giới hạn: user của token nếu request đã xác thực, ngược lại là IP."""
+    token = g.get("token")
+    if token is not None:
+        return f"user:{token['user_id']}"
+    return f"ip:{request.remote_addr}"
+
+
+def _check(app, rule, key):
+    """(được phép, chờ bao lâu) của chủ thể `key` theo quy tắc `rule`; luôn được phép nếu đã tắt."""
+    state = app.extensions.get(EXTENSION_KEY)
+    if state is None or not app.config.get("RATELIMIT_ENABLED", True):
+        return True, 0.0
+    rate, burst = state["rules"][rule]
+    return state["store"].consume(f"{rule}|{key}", rate, burst)
+
+
+def _too_many_requests(response_json, retry_after):
+    response = response_json({"message": "Too many requests, please slow down"})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def limit(rule, when=None):
+    """
+    Decorator áp quy tắc `rule` cho một route. Đặt DƯỚI @token_required để
+    giới hạn theo user thay vì theo IP. `when()` trả về False thì bỏ qua
+    (vd. chỉ giới hạn /books khi có tham số tìm kiếm `q`).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if when is not None and not when():
+                return f(*args, **kwargs)
+            allowed, retry_after = _check(current_app, rule, client_key())
+            if not allowed:
+                return _too_many_requests(jsonify, retry_after)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def limit_async(rule):
+    """
+    Bản coroutine của `limit` cho appAsync (Quart). Đặt DƯỚI token_required
+    của appAsync: hàm được bọc nhận user id làm tham số đầu tiên. Store
+    sqlite chạy trên thread pool để BEGIN IMMEDIATE không chặn event loop.
+    """
+    from quart import current_app as quart_app, jsonify as quart_jsonify
+
+    def decorator(f):
+        @wraps(f)
+        async def decorated(current_user_id, *args, **kwargs):
+            app = quart_app._get_current_object()
+            key = f"user:{current_user_id}"
+            state = app.extensions.get(EXTENSION_KEY)
+            if state is not None and state["store"].name == "sqlite":
+                allowed, retry_after = await asyncio.to_thread(_check, app, rule, key)
+            else:
+                allowed, retry_after = _check(app, rule, key)
+            if not allowed:
+                return _too_many_requests(quart_jsonify, retry_after)
+            return await f(current_user_id, *args, **kwargs)
+        return decorated
+    return decorator
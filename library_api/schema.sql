@@ -1,6 +1,19 @@
 -- schema.sql
+-- Lược đồ gốc (phiên bản 0). Mọi thay đổi sau đó nằm trong migrations/
+-- và được áp dụng bằng `flask migrate` (init-db tự chạy chúng).
+
+-- Khởi tạo lại từ đầu nên đưa phiên bản lược đồ về 0
+PRAGMA user_version = 0;
 
 -- Xóa các bảng nếu chúng đã tồn tại để đảm bảo khởi tạo lại từ đầu
+DROP VIEW IF EXISTS borrow_history;
+DROP TABLE IF EXISTS borrows_archive;
+DROP TABLE IF EXISTS stats_open_by_day;
+DROP TABLE IF EXISTS stats_user_open;
+DROP TABLE IF EXISTS stats_book_monthly;
+DROP TABLE IF EXISTS tokens;
+DROP TABLE IF EXISTS collection_versions;
+DROP TABLE IF EXISTS books_fts;
 DROP TABLE IF EXISTS borrows;
 DROP TABLE IF EXISTS books;
 DROP TABLE IF EXISTS users;
@@ -31,4 +44,4 @@ CREATE TABLE borrows (
     return_date TEXT,
     FOREIGN KEY (book_id) REFERENCES books (id),
     FOREIGN KEY (user_id) REFERENCES users (id)
-);
\ No newline at end of file
+);
@@ -0,0 +1,61 @@
+# stats.py
+"""
+Các endpoint thống kê cho dashboard, đọc bảng tổng hợp do trigger duy trì
+(migrations/0006_borrow_stats.sql) nên không phải GROUP BY cả bảng `borrows`:
+- GET /stats/top-books?month=YYYY-MM&limit=10: sách được mượn nhiều nhất trong tháng
+- GET /stats/active-borrowers?limit=10: user đang mượn nhiều sách nhất
+- GET /stats/overdue?days=14: số lượt mượn đang mở và số lượt quá hạn
+
+Số liệu lệch (vd. sau khi sửa tay `borrows`) thì chạy `flask rebuild-stats`;
+server đang chạy thấy số liệu mới ngay (phiên bản 'stats', migration 0009).
+"""
+import re
+from datetime import date, timedelta
+
+from flask import jsonify, request
+
+import queries
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Thời hạn mượn mặc định (ngày); ghi đè bằng LOAN_PERIOD_DAYS hoặc ?days=
+DEFAULT_LOAN_PERIOD_DAYS = 14
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def _limit_arg():
+    """Đọc ?limit=; trả về (giá trị, None) hoặc (None, response lỗi 400)."""
+    limit = request.args.get("limit", default=DEFAULT_LIMIT, type=int)
+    if limit is None or not 1 <= limit <= MAX_LIMIT:
+        return None, (jsonify({"message": f"limit must be an integer between 1 and {MAX_LIMIT}"}), 400)
+    return limit, None
+
+
+def init_app(app):
+    """Đăng ký các endpoint /stats/*. Cấu hình: LOAN_PERIOD_DAYS."""
+
+    @app.route("/stats/top-books", methods=["GET"])
+    def stats_top_books():
+        month = request.args.get("month", default=date.today().strftime("%Y-%m"), type=str)
+        if not MONTH_PATTERN.match(month):
+            return jsonify({"message": "month must be in YYYY-MM format"}), 400
+        limit, error_response = _limit_arg()
+        if error_response: return error_response
+        return jsonify({"month": month, "items": queries.get_top_books(month, limit)}), 200
+
+    @app.route("/stats/active-borrowers", methods=["GET"])
+    def stats_active_borrowers():
+        limit, error_response = _limit_arg()
+        if error_response: return error_response
+        return jsonify({"items": queries.get_active_borrowers(limit)}), 200
+
+    @app.route("/stats/overdue", methods=["GET"])
+    def stats_overdue():
+        days = request.args.get("days", default=app.config.get("LOAN_PERIOD_DAYS", DEFAULT_LOAN_PERIOD_DAYS),
+                                type=int)
+        if days is None or days < 0:
+            return jsonify({"message": "days must be a non-negative integer"}), 400
+        # Mượn trước ngày này (tính theo ngày mượn) là quá hạn
+        due_before = (date.today() - timedelta(days=days)).isoformat()
+        summary = queries.get_overdue_summary(due_before)
+        return jsonify({"loan_period_days": days, "due_before": due_before, **summary}), 200
@@ -0,0 +1,7 @@
+# conftest.py
+# Các module của library_api được import phẳng (`import db`, `import queries`),
+# giống như khi chạy app từ thư mục library_api.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,78 @@
+# test_borrow_concurrency.py
+"""
+Nhiều request mượn cùng một đầu sách cùng lúc (POST /books/<id>/borrow của
+appV5): số lượt thắng đúng bằng số bản trên kệ, available_copies không bao
+giờ âm, và mỗi lượt thắng có đúng một bản ghi mượn.
+"""
+import threading
+
+import pytest
+
+import appV5
+import auth
+import db
+import queries
+
+BORROWERS = 16
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = appV5.create_app()
+    app.config.update(DATABASE=str(tmp_path / "library.db"), TESTING=True, RATELIMIT_ENABLED=False)
+    db.init_db(app)
+    return app
+
+
+def _borrow_concurrently(app, book_id, tokens):
+    """Gửi mỗi token một request mượn, cùng xuất phát sau một barrier; trả về các status code."""
+    barrier = threading.Barrier(len(tokens))
+    statuses = []
+
+    def borrow(token):
+        client = app.test_client()
+        barrier.wait()
+        response = client.post(f"/books/{book_id}/borrow", headers={"Authorization": f"Bearer {token}"})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=borrow, args=(token,)) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+@pytest.mark.parametrize("copies", [1, 3])
+def test_concurrent_borrows_have_exactly_as_many_winners_as_copies(app, copies):
+    with app.app_context():
+        book = queries.add_book({"title": "Tắt đèn", "author": "Ngô Tất Tố", "year": 1939}, total_copies=copies)
+        tokens = []
+        for i in range(BORROWERS):
+            user = queries.add_user({"name": f"Reader {i}", "email": f"reader{i}@example.com"})
+            token, _ = auth.issue_token(user["id"])
+            tokens.append(token)
+
+    statuses = _borrow_concurrently(app, book["id"], tokens)
+
+    assert statuses.count(200) == copies
+    assert statuses.count(409) == BORROWERS - copies
+    with app.app_context():
+        conn = db.get_db()
+        row = conn.execute("SELECT available_copies, status FROM books WHERE id = ?", (book["id"],)).fetchone()
+        open_borrows = conn.execute("SELECT COUNT(*) FROM borrows WHERE book_id = ? AND return_date IS NULL",
+                                    (book["id"],)).fetchone()[0]
+    assert row["available_copies"] == 0
+    assert row["status"] == "borrowed"
+    assert open_borrows == copies
+
+
+def test_borrow_conflict_on_a_book_deleted_meanwhile_is_404(app, monkeypatch):
+    # Lượt mượn thất bại vì hết bản, rồi sách bị xóa trước khi route đọc lại trạng thái
+    with app.app_context():
+        token, _ = auth.issue_token(1)
+    monkeypatch.setattr(queries, "borrow_book", lambda book_id, user_id: (None, "book_unavailable"))
+
+    response = app.test_client().post("/books/999/borrow", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 404